@@ -0,0 +1,301 @@
+"""
+Benchmark suite for sspa methods on seeded synthetic data.
+
+Each registered benchmark is run over a one-factor-at-a-time sweep of the data dimensions (samples, entities,
+pathways and pathway size) around a default configuration. Wall time (best of --repeat runs) and peak traced
+memory are appended to a JSON lines history file, and each result is compared with the median of earlier runs
+of the same benchmark and parameters to flag regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --quick
+    python benchmarks/run_benchmarks.py --methods sspa_SVD sspa_zscore --threshold 0.2 --fail-on-regression
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import make_dataset  # noqa: E402
+
+DEFAULTS = {"n_samples": 100, "n_entities": 1000, "n_pathways": 200, "mean_size": 20}
+SWEEPS = {
+    "n_samples": [50, 200, 800],
+    "n_entities": [500, 2000, 8000],
+    "n_pathways": [100, 500, 2000],
+    "mean_size": [10, 40, 160],
+}
+QUICK_DEFAULTS = {"n_samples": 40, "n_entities": 300, "n_pathways": 50, "mean_size": 15}
+QUICK_SWEEPS = {"n_samples": [20, 80], "n_pathways": [25, 100]}
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "history.jsonl")
+
+BENCHMARKS = {}
+
+
+def benchmark(name, axes=("n_samples", "n_entities", "n_pathways", "mean_size"), max_samples=None):
+    """
+    Register a benchmark. The decorated function receives (mat, groups, pathway_df, workdir) and returns a
+    zero-argument callable performing the timed work.
+    Args:
+        name (str): benchmark name, used in the history file
+        axes (tuple): data dimensions the benchmark is swept over
+        max_samples (int): skip configurations with more samples than this (for permutation-heavy methods)
+    """
+    def register(setup):
+        BENCHMARKS[name] = {"setup": setup, "axes": axes, "max_samples": max_samples}
+        return setup
+    return register
+
+
+@benchmark("sspa_zscore")
+def bench_zscore(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_zscore(pathway_df, min_entity=2).fit_transform(mat)
+
+
+@benchmark("sspa_SVD")
+def bench_svd(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_SVD(pathway_df, min_entity=2).fit_transform(mat)
+
+
+@benchmark("sspa_KPCA")
+def bench_kpca(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_KPCA(pathway_df, min_entity=2).fit_transform(mat)
+
+
+@benchmark("sspa_ssClustPA")
+def bench_cluster(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_ssClustPA(pathway_df, min_entity=2).fit_transform(mat)
+
+
+@benchmark("sspa_ssGSEA", max_samples=200)
+def bench_ssgsea(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_ssGSEA(pathway_df, min_entity=2).fit_transform(mat)
+
+
+@benchmark("sspa_ssGSEA_native", max_samples=200)
+def bench_ssgsea_native(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_ssGSEA(pathway_df, min_entity=2, backend="native").fit_transform(mat)
+
+
+def permuted_enrichment(mat, groups, pathway_df, backend, n_permutations=100):
+    # GSEA-style workload: signal-to-noise ratios of permuted group labels, scored against every pathway
+    import sspa
+    from sspa import utils
+    rng = np.random.default_rng(0)
+    values = mat.to_numpy()
+    labels = np.array([rng.permutation(groups.to_numpy() == groups.iloc[0]) for _ in range(n_permutations)])
+    sets = [positions for positions, _ in utils.group_pathways(utils.pathwaydf_to_dict(pathway_df), mat.columns, 2)]
+
+    def run():
+        case, ctrl = labels[:, :, None], ~labels[:, :, None]
+        mean_case = (values * case).sum(axis=1) / case.sum(axis=1)
+        mean_ctrl = (values * ctrl).sum(axis=1) / ctrl.sum(axis=1)
+        std_case = np.sqrt(((values - mean_case[:, None]) ** 2 * case).sum(axis=1) / (case.sum(axis=1) - 1))
+        std_ctrl = np.sqrt(((values - mean_ctrl[:, None]) ** 2 * ctrl).sum(axis=1) / (ctrl.sum(axis=1) - 1))
+        metric = (mean_case - mean_ctrl) / (std_case + std_ctrl)
+        return sspa.enrichment.enrichment_scores(metric, sets, statistic="max_deviation", backend=backend)
+    return run
+
+
+@benchmark("enrichment_numpy", max_samples=200)
+def bench_enrichment_numpy(mat, groups, pathway_df, workdir):
+    return permuted_enrichment(mat, groups, pathway_df, "numpy")
+
+
+if importlib.util.find_spec("numba") is not None:
+    @benchmark("enrichment_numba", max_samples=200)
+    def bench_enrichment_numba(mat, groups, pathway_df, workdir):
+        return permuted_enrichment(mat, groups, pathway_df, "numba")
+
+
+@benchmark("sspa_ora")
+def bench_ora(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_ora(mat, groups, pathway_df, 0.05).over_representation_analysis()
+
+
+@benchmark("sspa_gsea", max_samples=200)
+def bench_gsea(mat, groups, pathway_df, workdir):
+    import sspa
+    return lambda: sspa.sspa_gsea(mat, groups, pathway_df, min_entity=2)
+
+
+@benchmark("process_gmt", axes=("n_pathways", "mean_size"))
+def bench_process_gmt(mat, groups, pathway_df, workdir):
+    import sspa
+    from sspa.pathway_set import PathwaySet
+    path = os.path.join(workdir, "pathways.gmt")
+    PathwaySet.from_wide(pathway_df).to_gmt(path)
+    return lambda: sspa.process_gmt(path)
+
+
+@benchmark("process_kegg", axes=("n_pathways", "mean_size"))
+def bench_process_kegg(mat, groups, pathway_df, workdir):
+    import sspa
+    path = os.path.join(workdir, "kegg_pathways.csv")
+    pathway_df.to_csv(path)
+    return lambda: sspa.process_kegg("hsa", infile=path)
+
+
+@benchmark("process_pathbank", axes=("n_pathways", "mean_size"))
+def bench_process_pathbank(mat, groups, pathway_df, workdir):
+    import sspa
+    path = os.path.join(workdir, "pathbank_pathways.csv")
+    pathway_df.to_csv(path)
+    return lambda: sspa.process_pathbank("Homo sapiens", infile=path)
+
+
+@benchmark("process_reactome", axes=("n_pathways", "mean_size"))
+def bench_process_reactome(mat, groups, pathway_df, workdir):
+    import sspa
+    path = os.path.join(workdir, "ChEBI2Reactome_All_Levels.txt")
+    long_df = pathway_df.drop("Pathway_name", axis=1).melt(ignore_index=False).dropna()
+    with open(path, "w") as f:
+        for pathway, entity in zip(long_df.index, long_df["value"]):
+            f.write("%s\t%s\thttps://reactome.org/%s\t%s\tIEA\tHomo sapiens\n"
+                    % (entity, pathway, pathway, pathway_df.loc[pathway, "Pathway_name"]))
+    return lambda: sspa.process_reactome("Homo sapiens", infile=path)
+
+
+def configurations(axes, defaults, sweeps):
+    """
+    One-factor-at-a-time sweep: the default configuration, then each swept axis varied on its own
+    """
+    configs = [dict(defaults)]
+    for axis, values in sweeps.items():
+        if axis not in axes:
+            continue
+        for value in values:
+            config = dict(defaults, **{axis: value})
+            if config not in configs:
+                configs.append(config)
+    return configs
+
+
+def measure(run, repeat):
+    """
+    Returns:
+        tuple of (best wall time in seconds, peak traced memory in MB)
+    """
+    # untimed warm-up run so lazy imports and first-call caches are not counted
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    # memory is traced in a separate run so tracing overhead does not inflate the timings
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(results, history, threshold, metric="time_s", window=5):
+    """
+    Compare each result with the median of the last `window` runs of the same benchmark and parameters
+    recorded on the same machine
+    Returns:
+        list of (result, baseline value, ratio) for results exceeding the baseline by more than threshold
+    """
+    regressions = []
+    for res in results:
+        previous = [h[metric] for h in history if h["method"] == res["method"] and h["params"] == res["params"]
+                    and h.get("machine") == res.get("machine")]
+        if not previous:
+            continue
+        baseline = float(np.median(previous[-window:]))
+        ratio = res[metric] / baseline if baseline > 0 else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append((res, baseline, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="small configurations for a fast smoke run")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON lines file results are appended to")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if regressions are found")
+    parser.add_argument("--no-record", action="store_true", help="compare against the history without appending to it")
+    args = parser.parse_args(argv)
+
+    import sspa
+    defaults, sweeps = (QUICK_DEFAULTS, QUICK_SWEEPS) if args.quick else (DEFAULTS, SWEEPS)
+    history = load_history(args.history)
+    meta = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+            "sspa_version": sspa.__version__, "python": platform.python_version(), "machine": platform.node()}
+
+    results = []
+    datasets = {}
+    warnings.filterwarnings("ignore")
+    with tempfile.TemporaryDirectory() as workdir:
+        for method in args.methods:
+            spec = BENCHMARKS[method]
+            for params in configurations(spec["axes"], defaults, sweeps):
+                if spec["max_samples"] and params["n_samples"] > spec["max_samples"]:
+                    continue
+                key = tuple(sorted(params.items()))
+                if key not in datasets:
+                    datasets[key] = make_dataset(seed=args.seed, **params)
+                run = spec["setup"](*datasets[key], workdir)
+                time_s, peak_mb = measure(run, args.repeat)
+                res = dict(meta, method=method, params=params, time_s=round(time_s, 6), peak_mb=round(peak_mb, 3))
+                results.append(res)
+                print("%-18s %-70s %10.4f s %10.2f MB" % (method, json.dumps(params), time_s, peak_mb))
+
+    regressions = []
+    for metric in ("time_s", "peak_mb"):
+        for res, baseline, ratio in find_regressions(results, history, args.threshold, metric=metric):
+            regressions.append(res)
+            print("REGRESSION %s %s %s: %.4f vs baseline %.4f (x%.2f)"
+                  % (res["method"], json.dumps(res["params"]), metric, res[metric], baseline, ratio))
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a") as f:
+            for res in results:
+                f.write(json.dumps(res) + "\n")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Seeded synthetic omics data and pathway generator for the sspa benchmark suite
+"""
+import numpy as np
+import pandas as pd
+
+
+def make_pathways(n_pathways, n_entities, mean_size=20, max_size=500, overlap=0.3, seed=0):
+    """
+    Generate a GMT-like pathway DataFrame with a realistic pathway size distribution and overlap
+
+    Pathway sizes are drawn from a log-normal distribution (many small, few very large pathways) and members
+    are sampled with Zipf-like entity popularity, so hub entities occur in many pathways. A fraction of
+    pathways (overlap) are created as subsets of a previous pathway, mimicking parent/child hierarchies.
+
+    Args:
+        n_pathways (int): number of pathways
+        n_entities (int): size of the entity universe, entities are named E0, E1, ...
+        mean_size (int): approximate median pathway size
+        max_size (int): maximum pathway size
+        overlap (float): fraction of pathways generated as subsets of an earlier pathway
+        seed (int): random seed
+    Returns:
+        GMT-like pd.DataFrame with pathway IDs as the index and a Pathway_name column
+    """
+    rng = np.random.default_rng(seed)
+    entities = np.array(["E%d" % i for i in range(n_entities)], dtype=object)
+    popularity = 1.0 / np.arange(1, n_entities + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    sizes = np.clip(rng.lognormal(np.log(mean_size), 0.9, n_pathways).astype(int), 3, min(max_size, n_entities))
+
+    pathways = []
+    for n, size in enumerate(sizes):
+        if n > 0 and rng.random() < overlap:
+            parent = pathways[rng.integers(0, n)]
+            members = rng.choice(parent, size=max(2, min(size, len(parent) - 1)), replace=False)
+        else:
+            members = rng.choice(n_entities, size=size, replace=False, p=popularity)
+        pathways.append(members)
+
+    pathway_dict = {"P%05d" % n: entities[m].tolist() for n, m in enumerate(pathways)}
+    df = pd.DataFrame.from_dict(pathway_dict, orient="index", dtype="object")
+    df.insert(0, "Pathway_name", ["Synthetic pathway %d" % n for n in range(n_pathways)])
+    return df
+
+
+def make_omics(n_samples, n_entities, n_modules=20, effect_size=1.0, seed=0):
+    """
+    Generate a standardised sample-by-entity matrix with correlated entity modules and two sample groups
+
+    Args:
+        n_samples (int): number of samples (rows)
+        n_entities (int): number of entities (columns), named E0, E1, ...
+        n_modules (int): number of latent factors inducing correlation between entities
+        effect_size (float): mean shift of the first latent factor between the two groups
+        seed (int): random seed
+    Returns:
+        tuple of (pd.DataFrame data matrix, pd.Series of group labels 'CASE'/'CTRL')
+    """
+    rng = np.random.default_rng(seed)
+    groups = np.array(["CASE", "CTRL"])[np.arange(n_samples) % 2]
+    factors = rng.normal(size=(n_samples, n_modules))
+    factors[groups == "CASE", 0] += effect_size
+    loadings = rng.normal(scale=0.5, size=(n_modules, n_entities)) * (rng.random((n_modules, n_entities)) < 0.1)
+    values = factors @ loadings + rng.normal(size=(n_samples, n_entities))
+    values = (values - values.mean(axis=0)) / values.std(axis=0)
+
+    index = pd.Index(["S%05d" % i for i in range(n_samples)], name="sample_id")
+    columns = ["E%d" % i for i in range(n_entities)]
+    return pd.DataFrame(values, index=index, columns=columns), pd.Series(groups, index=index, name="Group")
+
+
+def make_dataset(n_samples=100, n_entities=1000, n_pathways=200, mean_size=20, overlap=0.3, seed=0):
+    """
+    Generate a matched data matrix, group labels and pathway DataFrame
+    Returns:
+        tuple of (data matrix, group labels, pathway DataFrame)
+    """
+    mat, groups = make_omics(n_samples, n_entities, seed=seed)
+    # pathways draw from a larger universe than is measured, as with real annotation databases
+    pathways = make_pathways(n_pathways, int(n_entities * 1.5), mean_size=mean_size, overlap=overlap, seed=seed + 1)
+    return mat, groups, pathways
@@ -17,6 +17,7 @@ setup(
     long_description=long_description,
     long_description_content_type='text/markdown',
     package_data={'sspa': ['example_data/*', 'pathway_databases/*']},
+    entry_points={'console_scripts': ['sspa=sspa.cli:main']},
     classifiers=[
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
@@ -33,4 +34,5 @@ setup(
         'requests',
         'gseapy',
     ],
+    extras_require={'numba': ['numba'], 'parquet': ['pyarrow']},
 )
@@ -1,14 +1,93 @@
-from pkg_resources import get_distribution
-__version__ = get_distribution('sspa').version
-
-from .process_pathways import process_reactome, process_kegg, process_gmt, process_pathbank
-from .sspa_cluster import sspa_ssClustPA
-from .sspa_kpca import sspa_KPCA
-from .sspa_zscore import sspa_zscore
-from .sspa_svd import sspa_SVD
-from .utils import load_example_data, t_tests
-from .sspa_ora import sspa_ora
-from .sspa_gsea import sspa_gsea
-from .sspa_ssGSEA import sspa_ssGSEA
-from .download_pathways import download_KEGG, download_reactome
-from .identifier_conversion import identifier_conversion, map_identifiers
\ No newline at end of file
+import importlib
+import sys
+import types
+
+# public names and the submodule that defines them; submodules (and their
+# heavy backends such as sklearn, gseapy and statsmodels) are only imported
+# the first time one of these names is accessed
+_lazy_imports = {
+    'process_reactome': 'process_pathways',
+    'process_kegg': 'process_pathways',
+    'process_gmt': 'process_pathways',
+    'process_pathbank': 'process_pathways',
+    'sspa_ssClustPA': 'sspa_cluster',
+    'sspa_KPCA': 'sspa_kpca',
+    'sspa_zscore': 'sspa_zscore',
+    'sspa_SVD': 'sspa_svd',
+    'sspa_multi': 'sspa_multi',
+    'load_example_data': 'utils',
+    't_tests': 'utils',
+    'sspa_ora': 'sspa_ora',
+    'sspa_gsea': 'sspa_gsea',
+    'sspa_ssGSEA': 'sspa_ssGSEA',
+    'sspa_singscore': 'sspa_singscore',
+    'download_KEGG': 'download_pathways',
+    'download_reactome': 'download_pathways',
+    'identifier_conversion': 'identifier_conversion',
+    'map_identifiers': 'identifier_conversion',
+    'CrossReferenceIndex': 'identifier_conversion',
+    'PathwaySet': 'pathway_set',
+    'collapse_redundant': 'pathway_set',
+    'set_config': 'config',
+    'get_config': 'config',
+    'config_context': 'config',
+}
+
+_submodules = {
+    'config', 'download_pathways', 'enrichment', 'fit_cache', 'identifier_conversion', 'instrumentation', 'memory',
+    'output', 'pathway_set', 'process_pathways', 'ranks', 'serialization', 'serve', 'sspa_cluster',
+    'sspa_fgsea', 'sspa_gsea', 'sspa_gsva', 'sspa_kpca', 'sspa_multi', 'sspa_ora', 'sspa_ssGSEA',
+    'sspa_singscore', 'sspa_svd', 'sspa_zscore', 'utils',
+}
+
+__all__ = list(_lazy_imports)
+
+
+def _version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python 3.7 has neither importlib.metadata nor, unless installed, its importlib_metadata backport
+        try:
+            from importlib_metadata import version, PackageNotFoundError
+        except ImportError:
+            import pkg_resources
+            try:
+                return pkg_resources.get_distribution('sspa').version
+            except pkg_resources.DistributionNotFound:
+                return 'unknown'
+    try:
+        return version('sspa')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def __getattr__(name):
+    if name == '__version__':
+        # importlib.metadata pulls in the email package, so only look it up on request
+        value = _version()
+    elif name in _lazy_imports:
+        module = importlib.import_module('.' + _lazy_imports[name], __name__)
+        value = getattr(module, name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _submodules)
+
+
+class _LazyPackage(types.ModuleType):
+    def __setattr__(self, name, value):
+        # importing a submodule binds it onto the package; where a public name
+        # shares its submodule's name (e.g. sspa.sspa_zscore) keep the public object
+        if isinstance(value, types.ModuleType) and _lazy_imports.get(name) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _LazyPackage
@@ -0,0 +1,4 @@
+import sys
+from sspa.cli import main
+
+sys.exit(main())
@@ -0,0 +1,532 @@
+"""
+Command-line interface for sspa.
+
+Examples:
+    sspa score data.csv --pathways kegg --method svd --output scores.parquet
+    sspa score data.npy --columns entities.txt --pathways reactome.gmt --method zscore --chunk-size 5000 -o scores.csv
+    sspa ora data.csv --metadata groups.csv --pathways download:reactome --organism "Homo sapiens" -o ora.csv
+    sspa gsea data.parquet --metadata groups.csv --pathways pathways.gmt -o gsea.parquet
+    sspa pathways build --source reactome --organism "Homo sapiens" --download -o reactome.gmt
+    sspa serve --model svd=svd.npz --model zscore=zscore.npz --port 8000
+
+Input matrices (samples x entities) are read from .csv/.tsv (first column is the sample index), .parquet or .npy
+(with entity identifiers given by --columns). Results are written as .parquet, .arrow or .csv, chosen by the output
+file extension, and scores wide or long with --layout. Reading and writing Parquet and Arrow files requires pyarrow.
+
+Pathways are given with --pathways as a .gmt or GMT-like .csv file, the name of a bundled database ('kegg' or
+'reactome', with --organism), or 'download:<source>' to download the latest release of 'kegg', 'reactome' or
+'pathbank' once and reuse it from the cache directory ($SSPA_CACHE_DIR, default ~/.cache/sspa).
+
+Only the standard library is imported until a command runs, so the entry point starts quickly.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+_SCORE_METHODS = {
+    "zscore": ("sspa.sspa_zscore", "sspa_zscore"),
+    "svd": ("sspa.sspa_svd", "sspa_SVD"),
+    "cluster": ("sspa.sspa_cluster", "sspa_ssClustPA"),
+    "kpca": ("sspa.sspa_kpca", "sspa_KPCA"),
+    "ssgsea": ("sspa.sspa_ssGSEA", "sspa_ssGSEA"),
+    "singscore": ("sspa.sspa_singscore", "sspa_singscore"),
+}
+# methods with partial_fit, fitted by streaming chunks rather than reading all samples
+_INCREMENTAL = ("zscore", "svd")
+_BUNDLED = ("kegg", "reactome")
+_DOWNLOADS = ("kegg", "reactome", "pathbank")
+
+
+class CLIError(Exception):
+    """
+    Error in the command line arguments or inputs, reported without a traceback
+    """
+
+
+class Timings:
+    """
+    Wall-clock time spent in each stage of a command
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def to_dict(self):
+        return {"total": time.perf_counter() - self._start, "stages": dict(self.stages), **self.counts}
+
+    def report(self, stream):
+        summary = self.to_dict()
+        stream.write("stage        seconds\n")
+        for name, seconds in summary["stages"].items():
+            stream.write("%-12s %8.3f\n" % (name, seconds))
+        stream.write("%-12s %8.3f\n" % ("total", summary["total"]))
+        if self.counts:
+            stream.write(" ".join("%s=%s" % kv for kv in self.counts.items()) + "\n")
+
+
+def _extension(path):
+    path = path.lower()
+    for ext in (".parquet", ".pq", ".csv", ".tsv", ".txt", ".npy", ".gmt"):
+        if path.endswith(ext):
+            return ext
+    return os.path.splitext(path)[1]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise CLIError("Reading and writing Parquet and Arrow files requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def read_chunks(path, chunk_size=None, columns=None, index=None, dtype=None):
+    """
+    Read a samples x entities matrix in chunks of samples
+    Args:
+        path (str): .csv, .tsv, .parquet or .npy file
+        chunk_size (int): number of samples per chunk, default is all samples in one chunk
+        columns (str): file with one entity identifier per line, required for .npy input
+        index (str): file with one sample identifier per line for .npy input, default is S0, S1, ...
+        dtype (str): convert each chunk to this floating point type, e.g. 'float32'
+    Yields:
+        pd.DataFrame of each chunk
+    """
+    for chunk in _read_chunks(path, chunk_size, columns, index):
+        yield chunk if dtype is None else chunk.astype(dtype, copy=False)
+
+
+def _read_chunks(path, chunk_size, columns, index):
+    import numpy as np
+    import pandas as pd
+
+    ext = _extension(path)
+    if ext in (".csv", ".tsv", ".txt"):
+        sep = "," if ext == ".csv" else "\t"
+        if chunk_size is None:
+            yield pd.read_csv(path, sep=sep, index_col=0)
+        else:
+            yield from pd.read_csv(path, sep=sep, index_col=0, chunksize=chunk_size)
+    elif ext in (".parquet", ".pq"):
+        pa = _require_pyarrow()
+        parquet = pa.parquet.ParquetFile(path)
+        if chunk_size is None:
+            yield parquet.read().to_pandas()
+        else:
+            for batch in parquet.iter_batches(batch_size=chunk_size):
+                # rebuild through a table so the pandas index stored in the schema is restored
+                yield pa.Table.from_batches([batch], schema=parquet.schema_arrow).to_pandas()
+    elif ext == ".npy":
+        if columns is None:
+            raise CLIError(".npy input needs --columns, a file with one entity identifier per line")
+        values = np.load(path, mmap_mode="r")
+        entity_ids = _read_lines(columns)
+        if values.ndim != 2 or values.shape[1] != len(entity_ids):
+            raise CLIError("%s has shape %s but %d entity identifiers were given" % (path, values.shape, len(entity_ids)))
+        sample_ids = _read_lines(index) if index is not None else ["S%d" % i for i in range(values.shape[0])]
+        step = chunk_size or max(values.shape[0], 1)
+        for start in range(0, values.shape[0], step):
+            stop = start + step
+            yield pd.DataFrame(np.asarray(values[start:stop]), index=sample_ids[start:stop], columns=entity_ids)
+    else:
+        raise CLIError("Unsupported input format %r, expected .csv, .tsv, .parquet or .npy" % ext)
+
+
+def read_matrix(path, columns=None, index=None, dtype=None):
+    """
+    Read a whole samples x entities matrix, see read_chunks
+    """
+    return next(read_chunks(path, None, columns, index, dtype))
+
+
+class TableWriter:
+    """
+    Write a table in chunks of rows to a .csv, .parquet or .arrow file without holding all rows in memory, see
+    sspa.output
+    Args:
+        path (str): output file, the format is chosen by the extension
+        layout (str): 'wide' or 'long' to write pathway scores, default None writes result rows
+    """
+    def __init__(self, path, layout=None):
+        self.path = path
+        self.ext = _extension(path)
+        if self.ext not in (".csv", ".tsv", ".parquet", ".pq", ".arrow", ".feather"):
+            raise CLIError("Unsupported output format %r, expected .parquet, .arrow or .csv" % self.ext)
+        if self.ext not in (".csv", ".tsv"):
+            _require_pyarrow()
+        from sspa import output
+
+        self._writer = output.ResultWriter(path) if layout is None else output.ScoreWriter(path, layout)
+
+    @property
+    def rows(self):
+        return self._writer.rows
+
+    def write(self, df):
+        self._writer.write(df)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _cache_dir():
+    return os.environ.get("SSPA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sspa"))
+
+
+def _cache_path(source, organism, omics_type):
+    name = "_".join([source, organism or "all", omics_type]).replace(" ", "_").replace(os.sep, "_")
+    return os.path.join(_cache_dir(), name + ".gmt")
+
+
+def _download(source, organism, omics_type):
+    from sspa import process_pathways
+
+    if source == "kegg":
+        return process_pathways.process_kegg(organism, download_latest=True, omics_type=omics_type)
+    if source == "reactome":
+        return process_pathways.process_reactome(organism, download_latest=True, omics_type=omics_type)
+    return process_pathways.process_pathbank(organism, download_latest=True, omics_type=omics_type)
+
+
+def load_pathways(spec, organism=None, omics_type="metabolomics"):
+    """
+    Load pathways from a file, a bundled database or a cached download
+    Args:
+        spec (str): .gmt or .csv file, 'kegg' or 'reactome' (bundled), or 'download:<kegg|reactome|pathbank>'
+        organism (str): organism for bundled and downloaded pathways, e.g. 'hsa' (KEGG) or 'Homo sapiens' (Reactome)
+        omics_type (str): omics type of downloaded pathways
+    Returns:
+        GMT-like pd.DataFrame of pathways
+    """
+    from sspa import process_pathways
+    from sspa.pathway_set import PathwaySet
+
+    if os.path.exists(spec):
+        return process_pathways.process_gmt(spec)
+    if spec in _BUNDLED:
+        if organism is None:
+            raise CLIError("--organism is required for bundled pathways")
+        if spec == "kegg":
+            return process_pathways.process_kegg(organism)
+        return process_pathways.process_reactome(organism)
+    if spec.startswith("download:") and spec.split(":", 1)[1] in _DOWNLOADS:
+        source = spec.split(":", 1)[1]
+        if organism is None:
+            raise CLIError("--organism is required to download pathways")
+        path = _cache_path(source, organism, omics_type)
+        if not os.path.exists(path):
+            pathways_df = _download(source, organism, omics_type)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            PathwaySet.from_wide(pathways_df).to_gmt(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        return process_pathways.process_gmt(path)
+    raise CLIError("Unknown pathway source %r: expected a .gmt/.csv file, %s or download:<%s>"
+                   % (spec, "/".join(_BUNDLED), "|".join(_DOWNLOADS)))
+
+
+def _estimator(method):
+    import importlib
+
+    module, name = _SCORE_METHODS[method]
+    return getattr(importlib.import_module(module), name)
+
+
+def _chunks(args):
+    return read_chunks(args.input, args.chunk_size, args.columns, args.index, args.dtype)
+
+
+def cmd_score(args, timings):
+    with timings.stage("import"):
+        cls = _estimator(args.method)
+    if args.model is not None:
+        if not hasattr(cls, "load"):
+            raise CLIError("--model is not supported for method %r" % args.method)
+        with timings.stage("load_model"):
+            model = cls.load(args.model)
+    else:
+        if args.pathways is None:
+            raise CLIError("--pathways is required unless a saved --model is given")
+        with timings.stage("pathways"):
+            pathways_df = load_pathways(args.pathways, args.organism, args.omics_type)
+        model = cls(pathways_df, min_entity=args.min_entity)
+
+    data = None
+    if args.model is None and args.method in _INCREMENTAL and args.chunk_size is not None:
+        # first pass: accumulate the statistics of all samples one chunk at a time
+        for chunk in _chunks(args):
+            with timings.stage("fit"):
+                model.partial_fit(chunk)
+    elif args.model is None:
+        with timings.stage("read"):
+            data = read_matrix(args.input, args.columns, args.index, args.dtype)
+        with timings.stage("fit"):
+            model.fit(data)
+
+    if args.save_model is not None:
+        if not hasattr(model, "save"):
+            raise CLIError("--save-model is not supported for method %r" % args.method)
+        with timings.stage("save_model"):
+            model.save(args.save_model)
+
+    if data is not None and (args.method == "ssgsea" or args.chunk_size is None):
+        # ssGSEA normalises scores over all samples; its memory use is bounded by --max-memory instead
+        chunks = [data]
+    elif data is not None:
+        chunks = (data.iloc[start:start + args.chunk_size] for start in range(0, len(data), args.chunk_size))
+    else:
+        chunks = _chunks(args)
+
+    n_pathways = 0
+    with TableWriter(args.output, layout=args.layout) as writer:
+        for chunk in chunks:
+            with timings.stage("transform"):
+                scores = model.transform(chunk)
+            with timings.stage("write"):
+                writer.write(scores)
+            n_pathways = scores.shape[1]
+    timings.count(samples=writer.rows, pathways=n_pathways)
+
+
+def _metadata(args, index):
+    import pandas as pd
+
+    metadata = pd.read_csv(args.metadata, index_col=0)
+    column = args.group_column if args.group_column is not None else metadata.columns[0]
+    if column not in metadata.columns:
+        raise CLIError("Column %r not found in %s" % (column, args.metadata))
+    missing = index.difference(metadata.index)
+    if len(missing):
+        raise CLIError("%d samples have no metadata, e.g. %s" % (len(missing), missing[0]))
+    return metadata[column].reindex(index)
+
+
+def _write_table(df, path):
+    with TableWriter(path) as writer:
+        writer.write(df)
+
+
+def cmd_ora(args, timings):
+    from sspa.sspa_ora import sspa_ora
+
+    with timings.stage("read"):
+        data = read_matrix(args.input, args.columns, args.index)
+        metadata = _metadata(args, data.index)
+    with timings.stage("pathways"):
+        pathways_df = load_pathways(args.pathways, args.organism, args.omics_type)
+    with timings.stage("ora"):
+        ora = sspa_ora(data, metadata, pathways_df, args.cutoff, DA_testtype=args.test)
+        results = ora.over_representation_analysis(collapse_redundant=args.collapse_redundant)
+    with timings.stage("write"):
+        _write_table(results.set_index("ID"), args.output)
+    timings.count(samples=len(data), pathways=len(results))
+
+
+def cmd_gsea(args, timings):
+    from sspa.sspa_gsea import sspa_gsea
+
+    with timings.stage("read"):
+        data = read_matrix(args.input, args.columns, args.index)
+        metadata = _metadata(args, data.index)
+    with timings.stage("pathways"):
+        pathways_df = load_pathways(args.pathways, args.organism, args.omics_type)
+    with timings.stage("gsea"):
+        results = sspa_gsea(data, metadata, pathways_df, ranking_metric=args.ranking_metric,
+                            min_entity=args.min_entity, collapse_redundant=args.collapse_redundant)
+    with timings.stage("write"):
+        _write_table(results.set_index("Pathway_ID"), args.output)
+    timings.count(samples=len(data), pathways=len(results))
+
+
+def cmd_pathways_build(args, timings):
+    from sspa import process_pathways
+    from sspa.pathway_set import PathwaySet
+
+    with timings.stage("load"):
+        if args.source == "gmt":
+            if args.input is None:
+                raise CLIError("--input is required for --source gmt")
+            pathways_df = process_pathways.process_gmt(args.input)
+        elif args.download:
+            pathways_df = load_pathways("download:" + args.source, args.organism, args.omics_type)
+        elif args.source in _BUNDLED:
+            pathways_df = load_pathways(args.source, args.organism)
+        else:
+            raise CLIError("Pathways from %r must be downloaded, add --download" % args.source)
+
+    with timings.stage("write"):
+        ext = _extension(args.output)
+        if ext == ".gmt":
+            PathwaySet.from_wide(pathways_df).to_gmt(args.output)
+        elif ext in (".parquet", ".pq"):
+            _write_table(PathwaySet.from_wide(pathways_df).to_long().set_index("Pathway_ID"), args.output)
+        elif ext == ".csv":
+            pathways_df.to_csv(args.output)
+        else:
+            raise CLIError("Unsupported output format %r, expected .gmt, .csv or .parquet" % ext)
+    timings.count(pathways=len(pathways_df))
+
+
+def cmd_serve(args, timings):
+    from sspa import serve
+
+    models = {}
+    for spec in args.model:
+        name, sep, path = spec.partition("=")
+        if not sep or not name or not path:
+            raise CLIError("--model must be given as name=path, got %r" % spec)
+        models[name] = path
+    with timings.stage("load_models"):
+        server = serve.ScoringServer(models, args.host, args.port, args.max_batch, args.max_wait_ms / 1000)
+    sys.stderr.write("sspa: serving %s on http://%s:%d\n" % (", ".join(models), args.host, args.port))
+    try:
+        import asyncio
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def _positive_int(value):
+    value = int(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return value
+
+
+def build_parser():
+    """
+    Returns:
+        argparse.ArgumentParser of the sspa command
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--jobs", "-j", type=int, default=None,
+                        help="maximum worker threads, -1 for all processors")
+    common.add_argument("--max-memory", default=None, help="memory ceiling, e.g. 4GB (see sspa.set_config)")
+    common.add_argument("--dtype", choices=["float32", "float64"], default=None,
+                        help="floating point type of the data, models and scores (default float64); float32 halves "
+                             "memory use")
+    common.add_argument("--timings", default=None, help="write the timing summary as JSON to this file")
+    common.add_argument("--quiet", "-q", action="store_true", help="do not print the timing summary")
+
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument("input", help="samples x entities matrix (.csv, .tsv, .parquet or .npy)")
+    data.add_argument("--columns", default=None, help="entity identifiers of .npy input, one per line")
+    data.add_argument("--index", default=None, help="sample identifiers of .npy input, one per line")
+    data.add_argument("--output", "-o", required=True, help="output file (.parquet, .arrow or .csv)")
+
+    pathways = argparse.ArgumentParser(add_help=False)
+    pathways.add_argument("--organism", default=None, help="organism of bundled or downloaded pathways")
+    pathways.add_argument("--omics-type", default="metabolomics", help="omics type of downloaded pathways")
+
+    parser = argparse.ArgumentParser(prog="sspa", description="Single sample pathway analysis")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    score = commands.add_parser("score", parents=[common, data, pathways], help="score pathways in each sample")
+    score.add_argument("--method", "-m", choices=list(_SCORE_METHODS), required=True)
+    score.add_argument("--pathways", "-p", default=None,
+                       help="pathway source: .gmt/.csv file, kegg, reactome or download:<kegg|reactome|pathbank>")
+    score.add_argument("--min-entity", type=int, default=2)
+    score.add_argument("--chunk-size", type=_positive_int, default=None,
+                       help="samples read, scored and written at a time")
+    score.add_argument("--layout", choices=["wide", "long"], default="wide",
+                       help="wide (one column per pathway, default) or long (Sample, Pathway, Score rows) scores")
+    score.add_argument("--model", default=None, help="score with a model saved by --save-model instead of fitting")
+    score.add_argument("--save-model", default=None, help="save the fitted model (svd, cluster, kpca) to this file")
+    score.set_defaults(func=cmd_score)
+
+    for name, func, text in [("ora", cmd_ora, "over-representation analysis"),
+                             ("gsea", cmd_gsea, "gene set enrichment analysis")]:
+        sub = commands.add_parser(name, parents=[common, data, pathways], help=text)
+        sub.add_argument("--pathways", "-p", required=True,
+                         help="pathway source: .gmt/.csv file, kegg, reactome or download:<kegg|reactome|pathbank>")
+        sub.add_argument("--metadata", required=True, help="CSV of sample groups, indexed by sample")
+        sub.add_argument("--group-column", default=None, help="metadata column of sample groups, default first column")
+        sub.add_argument("--collapse-redundant", type=float, default=None,
+                         help="collapse significant pathways overlapping a more significant one by at least this much")
+        sub.set_defaults(func=func)
+        if name == "ora":
+            sub.add_argument("--cutoff", type=float, default=0.05, help="FDR cutoff for differential molecules")
+            sub.add_argument("--test", choices=["ttest", "mwu"], default="ttest")
+        else:
+            sub.add_argument("--ranking-metric", default="signal_to_noise")
+            sub.add_argument("--min-entity", type=int, default=2)
+
+    serve_cmd = commands.add_parser("serve", parents=[common], help="serve saved models over local HTTP")
+    serve_cmd.add_argument("--model", action="append", required=True,
+                           help="name=path of a model saved with save (svd, cluster, kpca or partial_fit zscore), "
+                                "repeat for several models")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8000)
+    serve_cmd.add_argument("--max-batch", type=_positive_int, default=64, help="maximum samples per transform")
+    serve_cmd.add_argument("--max-wait-ms", type=float, default=0.0,
+                           help="time to hold a micro-batch open for more requests, default is to score what is queued")
+    serve_cmd.set_defaults(func=cmd_serve)
+
+    pathways_cmd = commands.add_parser("pathways", help="pathway database utilities")
+    pathways_commands = pathways_cmd.add_subparsers(dest="pathways_command", metavar="command")
+    pathways_commands.required = True
+    build = pathways_commands.add_parser("build", parents=[common, pathways],
+                                         help="build a pathway file from a bundled, downloaded or GMT source")
+    build.add_argument("--source", choices=["kegg", "reactome", "pathbank", "gmt"], required=True)
+    build.add_argument("--download", action="store_true", help="download the latest release (cached)")
+    build.add_argument("--input", default=None, help="input file for --source gmt")
+    build.add_argument("--output", "-o", required=True, help="output file (.gmt, .csv or long-format .parquet)")
+    build.set_defaults(func=cmd_pathways_build)
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the sspa command
+    Args:
+        argv (list): command line arguments, default sys.argv[1:]
+    Returns:
+        exit status
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    from sspa.config import config_context
+
+    config = {k: v for k, v in [("max_memory", args.max_memory), ("n_jobs", args.jobs), ("dtype", args.dtype)]
+              if v is not None}
+    timings = Timings()
+    try:
+        with config_context(**config):
+            args.func(args, timings)
+    except (CLIError, FileNotFoundError, ValueError) as error:
+        parser.exit(2, "sspa: error: %s\n" % error)
+
+    if args.timings is not None:
+        with open(args.timings, "w") as f:
+            json.dump(timings.to_dict(), f, indent=2)
+    if not args.quiet:
+        timings.report(sys.stderr)
+    return 0
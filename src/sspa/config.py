@@ -0,0 +1,142 @@
+"""
+Global configuration for sspa.
+
+Example:
+    sspa.set_config(max_memory="4GB", n_jobs=8)
+    sspa.set_config(dtype="float32")
+    sspa.set_config(fit_cache="2GB", fit_cache_dir="sspa_cache")
+
+    with sspa.config_context(max_memory="512MB"):
+        scores = sspa.sspa_KPCA(pathways).fit_transform(data)
+"""
+import re
+from contextlib import contextmanager
+
+_global_config = {
+    "max_memory": None,
+    "n_jobs": None,
+    "dtype": None,
+    "fit_cache": None,
+    "fit_cache_dir": None,
+}
+
+_DTYPES = ("float32", "float64")
+
+# in-memory fit cache size of fit_cache=True
+_FIT_CACHE_SIZE = 1024 ** 3
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+          "G": 1024 ** 3, "GB": 1024 ** 3, "T": 1024 ** 4, "TB": 1024 ** 4}
+
+
+def parse_memory(value):
+    """
+    Convert a memory size to bytes
+    Args:
+        value (int, float or str): number of bytes, or a string such as '512MB', '4GB' or '1.5G'
+    Returns:
+        int number of bytes, or None if value is None
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        match = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?B?)\s*", value.upper())
+        if match is None:
+            raise ValueError("Invalid memory size %r, expected e.g. '512MB' or '4GB'" % value)
+        value = float(match.group(1)) * _UNITS[match.group(2)]
+    if value <= 0:
+        raise ValueError("Memory size must be positive")
+    return int(value)
+
+
+def resolve_dtype(dtype=None):
+    """
+    Floating point type used for computation and scores
+    Args:
+        dtype (str or np.dtype): 'float32' or 'float64', default is the configured dtype, or float64 if none is set
+    Returns:
+        np.dtype
+    """
+    import numpy as np
+    if dtype is None:
+        dtype = _global_config["dtype"]
+    if dtype is None:
+        return np.dtype(np.float64)
+    dtype = np.dtype(dtype)
+    if dtype.name not in _DTYPES:
+        raise ValueError("Unsupported dtype %r, expected one of %s" % (dtype.name, ", ".join(_DTYPES)))
+    return dtype
+
+
+def _parse_fit_cache(value):
+    if value is None or value is False:
+        return None
+    if value is True:
+        return _FIT_CACHE_SIZE
+    return parse_memory(value)
+
+
+def get_config():
+    """
+    Returns:
+        dict of the current global configuration
+    """
+    return dict(_global_config)
+
+
+def set_config(max_memory=None, n_jobs=None, dtype=None, fit_cache=None, fit_cache_dir=None):
+    """
+    Set global configuration. Arguments left as None are not changed; use config_context to set them temporarily.
+    Args:
+        max_memory (int or str): memory ceiling for a single method call, in bytes or as a string such as '4GB'.
+            Methods estimate their working set from the input shape and split samples and pathways into blocks and
+            limit the number of worker threads to stay under it. Default is no limit.
+        n_jobs (int): maximum number of worker threads per method call, -1 for all processors. Default is 1 without
+            a memory ceiling, and as many as fit in the ceiling (up to the number of processors) with one.
+        dtype (str): floating point type of the data, models and scores of estimators not given a dtype of their
+            own, 'float32' or 'float64'. float32 halves the memory used and speeds up the linear algebra of large
+            cohorts, with scores accurate to about 1e-5 relative to float64. Default is float64.
+        fit_cache (bool, int or str): cache the models fitted by sspa_SVD, sspa_KPCA and sspa_ssClustPA on the
+            content of the training data, the pathways and the hyperparameters (see sspa.fit_cache), so refitting
+            the same data, e.g. a cross-validation fold in a parameter search, restores the fitted model. True for
+            a 1GB in-memory cache, or its size in bytes or as a string such as '512MB'. False disables the cache,
+            the default.
+        fit_cache_dir (str): directory of an on-disk tier of the fit cache, shared between processes and sessions.
+            False disables it, the default.
+    """
+    if max_memory is not None:
+        _global_config["max_memory"] = parse_memory(max_memory)
+    if n_jobs is not None:
+        _global_config["n_jobs"] = n_jobs
+    if dtype is not None:
+        _global_config["dtype"] = resolve_dtype(dtype).name
+    if fit_cache is not None:
+        _global_config["fit_cache"] = _parse_fit_cache(fit_cache)
+    if fit_cache_dir is not None:
+        _global_config["fit_cache_dir"] = fit_cache_dir or None
+
+
+@contextmanager
+def config_context(**config):
+    """
+    Context manager temporarily changing the global configuration, e.g. config_context(max_memory='2GB').
+    Settings passed as None are reset to their defaults within the context.
+    """
+    old = get_config()
+    unknown = set(config) - set(_global_config)
+    if unknown:
+        raise TypeError("Unknown configuration options: %s" % ", ".join(sorted(unknown)))
+    if "max_memory" in config:
+        config["max_memory"] = parse_memory(config["max_memory"])
+    if config.get("dtype") is not None:
+        config["dtype"] = resolve_dtype(config["dtype"]).name
+    if "fit_cache" in config:
+        config["fit_cache"] = _parse_fit_cache(config["fit_cache"])
+    if "fit_cache_dir" in config:
+        config["fit_cache_dir"] = config["fit_cache_dir"] or None
+    _global_config.update(config)
+    try:
+        yield get_config()
+    finally:
+        _global_config.clear()
+        _global_config.update(old)
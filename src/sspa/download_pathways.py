@@ -3,13 +3,135 @@
 
 import requests
 import re
+import functools
+import logging
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+import tempfile
 import warnings
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
-import requests
-import io
+from sspa.pathway_set import PathwaySet
+from sspa import instrumentation
+
+log = logging.getLogger(__name__)
+
+
+def _traced_download(source):
+    '''
+    Decorator wrapping a download function in an instrumentation span
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(organism, *args, **kwargs):
+            with instrumentation.span("download", source=source, organism=organism):
+                return func(organism, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _get(url, **kwargs):
+    '''
+    requests.get with request timing reported to instrumentation callbacks
+    '''
+    with instrumentation.span("request", url=url) as span:
+        resp = requests.get(url, **kwargs)
+        span.set(status=resp.status_code, bytes=len(resp.content))
+    return resp
+
+
+def _read_csv_url(url, **kwargs):
+    '''
+    pd.read_csv of a remote file with request timing reported to instrumentation callbacks
+    '''
+    with instrumentation.span("request", url=url):
+        return pd.read_csv(url, **kwargs)
+
 
+def _download_to_tempfile(url, chunk_size=1 << 20):
+    '''
+    Streams a remote file to an anonymous temporary file on disk rather than holding the response in memory
+    Args:
+        url (str): URL of the file to download
+        chunk_size (int): number of bytes to read from the response at a time
+    Returns:
+        binary file object positioned at the start of the downloaded content
+    '''
+    tmp = tempfile.TemporaryFile()
+    with instrumentation.span("request", url=url) as span, requests.get(url, stream=True) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            tmp.write(chunk)
+        span.set(status=resp.status_code, bytes=tmp.tell())
+    tmp.seek(0)
+    return tmp
+
+
+def _open_zip_member(fileobj, suffix):
+    '''
+    Opens the first member of a zip archive ending in suffix for streamed reading
+    '''
+    zip_ref = zipfile.ZipFile(fileobj)
+    member = [f for f in zip_ref.namelist() if f.endswith(suffix)][0]
+    return zip_ref.open(member)
+
+
+def _read_reactome_gmt(url):
+    '''
+    Streams the Reactome gene symbol GMT out of its zip archive
+    Returns:
+        list of GMT rows (pathway name, pathway ID, gene symbols...)
+    '''
+    input_gmt = []
+    with _download_to_tempfile(url) as tmp, _open_zip_member(tmp, '.gmt') as gmt_file:
+        for i in gmt_file:
+            i = i.decode('utf-8').strip()
+            input_gmt.append(i.strip("\n").split("\t"))
+    return input_gmt
+
+
+def _read_reactome_mapping(url, organism):
+    '''
+    Reads a Reactome <identifier>2Reactome mapping file into long format (molecule_ID, pathway_ID) for one organism
+    '''
+    f = _read_csv_url(url, sep="\t", header=None, usecols=[0, 1, 5], names=['molecule_ID', 'pathway_ID', 'species'], dtype=str)
+    f = f[f.species == organism]
+    return f[['pathway_ID', 'molecule_ID']]
+
+
+def _read_pathbank_csv(url, organism, id_col):
+    '''
+    Streams a zipped PathBank CSV and returns the long format (pathway_ID, molecule_ID) table for one organism
+    '''
+    with _download_to_tempfile(url) as tmp, _open_zip_member(tmp, '.csv') as csv_file:
+        f = pd.read_csv(csv_file, sep=',', header=0, dtype=str, usecols=['PathBank ID', 'Species', id_col])
+    f = f[f['Species'] == organism]
+    f = f.rename(columns={'PathBank ID': 'pathway_ID', id_col: 'molecule_ID'})
+    return f[['pathway_ID', 'molecule_ID']]
+
+
+def _union_pathway_sets(frames):
+    '''
+    Merges long format (pathway_ID, molecule_ID) tables from several sources into one set of pathways.
+    Each table is encoded as a sparse pathway-by-molecule incidence matrix and the sources are combined with a sparse union.
+    Args:
+        frames (list): list of pd.DataFrames with pathway_ID and molecule_ID columns
+    Returns:
+        dict of pathway IDs (keys) and lists of unique pathway molecules (values)
+    '''
+    long_df = pd.concat(frames, ignore_index=True).dropna()
+    pathway_codes, pathway_ids = pd.factorize(long_df['pathway_ID'])
+    molecule_codes, molecule_ids = pd.factorize(long_df['molecule_ID'])
+    incidence = sp.csr_matrix((np.ones(len(long_df), dtype=np.int8), (pathway_codes, molecule_codes)),
+                              shape=(len(pathway_ids), len(molecule_ids)))
+    # duplicate (pathway, molecule) pairs across sources collapse into a single stored entry
+    incidence.sum_duplicates()
+    molecule_ids = np.asarray(molecule_ids, dtype=object)
+    return {pathway: molecule_ids[incidence.indices[incidence.indptr[n]:incidence.indptr[n + 1]]].tolist()
+            for n, pathway in enumerate(pathway_ids)}
+
+@_traced_download("KEGG")
 def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
     '''
     Function for KEGG pathway download
@@ -20,11 +142,11 @@ def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
     Returns: 
         GMT-like pd.DataFrame containing KEGG pathways
     '''
-    print("Beginning KEGG download...")
+    log.info("Beginning KEGG download...")
     # get all pathways
     url = 'http://rest.kegg.jp/list/pathway/'+organism
     # change organism name
-    data = requests.get(url)
+    data = _get(url)
     pathways = data.text
     pathways = pathways.split("\n")
     pathways = filter(None, pathways)
@@ -43,17 +165,17 @@ def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
     pathway_names = list(pathway_dict.values())
 
     # get release details
-    release_data = requests.get('http://rest.kegg.jp/info/kegg')
+    release_data = _get('http://rest.kegg.jp/info/kegg')
     version_no = release_data.text.split()[9][0:3]
 
     if omics_type == 'metabolomics':
         pathway_compound_mapping = dict()
 
-        for index,i in enumerate(tqdm(pathway_ids)):
+        for index,i in enumerate(pathway_ids):
             complist = []
             current_url = base_url + "pathway:" +i
             # parse the pathway description page
-            page = requests.get(current_url)
+            page = _get(current_url)
             lines = page.text.split("\n")
 
             try:
@@ -77,9 +199,9 @@ def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
 
         if filepath:
             fpath = filepath + "/KEGG_" + organism + "_pathways_compounds_R" + str(version_no) + ".gmt"
-            df.to_csv(fpath, sep="\t", header=False)
-            print("KEGG DB file saved to " + fpath)
-        print("Complete!")
+            PathwaySet.from_wide(df).to_gmt(fpath)
+            log.info("KEGG DB file saved to %s", fpath)
+        log.info("Complete!")
 
         return df
         
@@ -87,12 +209,12 @@ def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
     if omics_type == 'multiomics':
         pathway_mapping = dict()
 
-        for index,i in enumerate(tqdm(pathway_ids)):
+        for index,i in enumerate(pathway_ids):
             complist = []
             genelist = []
             current_url = base_url + "pathway:" +i
             # parse the pathway description page
-            page = requests.get(current_url)
+            page = _get(current_url)
             lines = page.text.split("\n")
 
             try:
@@ -122,12 +244,13 @@ def download_KEGG(organism, filepath=None, omics_type='metabolomics'):
 
         if filepath:
             fpath = filepath + "/KEGG_" + organism + "_pathways_multiomics_R" + str(version_no) + ".gmt"
-            df.to_csv(fpath, sep="\t", header=False)
-            print("KEGG DB file saved to " + fpath)
-        print("Complete!")
+            PathwaySet.from_wide(df).to_gmt(fpath)
+            log.info("KEGG DB file saved to %s", fpath)
+        log.info("Complete!")
 
         return df
 
+@_traced_download("Reactome")
 def download_reactome(organism, filepath=None, omics_type='metabolomics', identifiers=None):
     '''
     Function for Reactome pathway download
@@ -140,16 +263,16 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
     Returns: 
         GMT-like pd.DataFrame containing Reactome pathways
     '''
-    print("Beginning Reactome download...")
+    log.info("Beginning Reactome download...")
 
     # get release details
-    release_data = requests.get('https://reactome.org/download/current/reactome_stable_ids.txt')
+    release_data = _get('https://reactome.org/download/current/reactome_stable_ids.txt')
     version_no = release_data.text.split()[6]
 
     # get all pathways
     if omics_type == 'metabolomics':
         url = 'https://reactome.org/download/current/ChEBI2Reactome_All_Levels.txt'
-        f = pd.read_csv(url, sep="\t", header=None)
+        f = _read_csv_url(url, sep="\t", header=None)
         
         f.columns = ['CHEBI', 'pathway_ID', 'link', 'pathway_name', 'evidence_code', 'species']
         f_filt = f[f.species == organism]
@@ -164,15 +287,15 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
 
         if filepath:
             fpath = filepath + "/Reactome_" + "_".join(organism.split())+ "_pathways_ChEBI_R" + str(version_no) + ".gmt"
-            pathways_df.to_csv(fpath, sep="\t", header=False)
-            print("Reactome DB file saved to " + fpath)
+            PathwaySet.from_wide(pathways_df).to_gmt(fpath)
+            log.info("Reactome DB file saved to %s", fpath)
         
-        print("Complete!")
+        log.info("Complete!")
         return pathways_df
 
     if omics_type == 'proteomics':
         url = 'https://reactome.org/download/current/UniProt2Reactome_All_Levels.txt'
-        f = pd.read_csv(url, sep="\t", header=None)
+        f = _read_csv_url(url, sep="\t", header=None)
         
         f.columns = ['UniProt', 'pathway_ID', 'link', 'pathway_name', 'evidence_code', 'species']
         f_filt = f[f.species == organism]
@@ -187,25 +310,15 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
 
         if filepath:
             fpath = filepath + "/Reactome_" + "_".join(organism.split())+ "_pathways_UniProt_R" + str(version_no) + ".gmt"
-            pathways_df.to_csv(fpath, sep="\t", header=False)
-            print("Reactome DB file saved to " + fpath)
+            PathwaySet.from_wide(pathways_df).to_gmt(fpath)
+            log.info("Reactome DB file saved to %s", fpath)
         
-        print("Complete!")
+        log.info("Complete!")
         return pathways_df
     
     if omics_type == 'transcriptomics':
         url_gmt = 'https://reactome.org/download/current/ReactomePathways.gmt.zip'
-        resp_gmt = requests.get(url_gmt)
-
-        input_gmt = []
-        with zipfile.ZipFile(io.BytesIO(resp_gmt.content)) as zip_ref:
-            gmt_filename = [f for f in zip_ref.namelist() if f.endswith('.gmt')][0]
-
-            # Extract the GMT file contents
-            with zip_ref.open(gmt_filename) as gmt_file:
-                for i in gmt_file:
-                    i = i.decode('utf-8').strip()
-                    input_gmt.append(i.strip("\n").split("\t"))
+        input_gmt = _read_reactome_gmt(url_gmt)
         pathways_df = pd.DataFrame(input_gmt)
         pathways_df = pathways_df.rename({0:"Pathway_name", 1:"Pathway_ID"}, axis=1)
         pathways_df.index = pathways_df["Pathway_ID"]
@@ -215,63 +328,46 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
 
         if filepath:
             fpath = filepath + "/Reactome_" + "_".join(organism.split())+ "_pathways_GeneSymbol_R" + str(version_no) + ".gmt"
-            pathways_df.to_csv(fpath, sep="\t", header=False)
-            print("Reactome DB file saved to " + fpath)
+            PathwaySet.from_wide(pathways_df).to_gmt(fpath)
+            log.info("Reactome DB file saved to %s", fpath)
         
-        print("Complete!")
+        log.info("Complete!")
         return pathways_df
 
     if omics_type == 'multiomics':
-        
+        if identifiers is None:
+            identifiers = ['chebi', 'uniprot', 'gene_symbol']
+
         if organism != 'Homo sapiens' and ('gene_symbol' in identifiers):
-            print('WARNING: Reactome does not provide gene_symbols for a non-Human organism, use UniProt instead')
-            
-        name_df = pd.read_csv('https://reactome.org/download/current/ReactomePathways.txt', sep="\t", header=None)
+            log.warning('Reactome does not provide gene_symbols for a non-Human organism, use UniProt instead')
+
+        url_names = 'https://reactome.org/download/current/ReactomePathways.txt'
         url_prot = 'https://reactome.org/download/current/UniProt2Reactome_All_Levels.txt'
         url_metab = 'https://reactome.org/download/current/ChEBI2Reactome_All_Levels.txt'
         url_gmt = 'https://reactome.org/download/current/ReactomePathways.gmt.zip'
-        
-        # read the chebi and uniprot files
-        pathway_dicts = {'chebi': None, 'uniprot': None, 'gene_symbol': None}
-        for k, url in {'uniprot': url_prot, 'chebi': url_metab}.items():
-            f = pd.read_csv(url, sep="\t", header=None)
-            f.columns = ['molecule_ID', 'pathway_ID', 'link', 'pathway_name', 'evidence_code', 'species']
-            f_filt = f[f.species == organism]
-            groups = f_filt.groupby(['pathway_ID'])['molecule_ID'].apply(list).to_dict()
-            groups = {k: list(set(v)) for k, v in groups.items()}
-            pathway_dicts[k] = groups
-
-        # read the GMT with gene symbols
-        url_gmt = 'https://reactome.org/download/current/ReactomePathways.gmt.zip'
-        resp_gmt = requests.get(url_gmt)
-
-        input_gmt = []
-        gene_dict = {}
-        with zipfile.ZipFile(io.BytesIO(resp_gmt.content)) as zip_ref:
-            gmt_filename = [f for f in zip_ref.namelist() if f.endswith('.gmt')][0]
-
-            # Extract the GMT file contents
-            with zip_ref.open(gmt_filename) as gmt_file:
-                for i in gmt_file:
-                    i = i.decode('utf-8').strip()
-                    line = i.strip("\n").split("\t")
-                    gene_dict[line[1]] = line[2:]
-        pathway_dicts['gene_symbol'] = gene_dict
-
-        # combine all dicts by key
-        # combine the required dictionaries based on the identifiers
-        if identifiers:
-            required_dicts = [pathway_dicts[k] for k in identifiers]
-        else:
-            required_dicts = list(pathway_dicts.values())
-
-        combined_dict = {}
-        for k in set().union(*required_dicts):
-            combined_dict[k] = list(d.get(k) for d in required_dicts)
-        # remove none values
-        combined_dict = {k: [x for x in v if x is not None] for k, v in combined_dict.items()}
-        # flatten the list of lists
-        combined_dict = {k: [item for sublist in v for item in sublist] for k, v in combined_dict.items()}
+
+        # fetch and parse all required sources concurrently
+        with ThreadPoolExecutor() as executor:
+            names_future = executor.submit(_read_csv_url, url_names, sep="\t", header=None)
+            source_futures = {}
+            if 'chebi' in identifiers:
+                source_futures['chebi'] = executor.submit(_read_reactome_mapping, url_metab, organism)
+            if 'uniprot' in identifiers:
+                source_futures['uniprot'] = executor.submit(_read_reactome_mapping, url_prot, organism)
+            if 'gene_symbol' in identifiers:
+                source_futures['gene_symbol'] = executor.submit(_read_reactome_gmt, url_gmt)
+            name_df = names_future.result()
+            sources = {k: v.result() for k, v in source_futures.items()}
+
+        if 'gene_symbol' in sources:
+            # GMT rows are (pathway name, pathway ID, gene symbols...)
+            gmt_rows = sources['gene_symbol']
+            sources['gene_symbol'] = pd.DataFrame(
+                [(line[1], gene) for line in gmt_rows for gene in line[2:]],
+                columns=['pathway_ID', 'molecule_ID'])
+
+        # combine the required identifier types by pathway
+        combined_dict = _union_pathway_sets([sources[k] for k in identifiers if k in sources])
 
         # create the dataframe
         reactome_mo = pd.DataFrame.from_dict(combined_dict, orient='index', dtype="object")
@@ -282,10 +378,10 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
 
         if filepath:
             fpath = filepath + "/Reactome_" + "_".join(organism.split())+ "_pathways_multiomics_R" + str(version_no) + ".gmt"
-            reactome_mo.to_csv(fpath, sep="\t", header=False)
-            print("Reactome DB file saved to " + fpath)
+            PathwaySet.from_wide(reactome_mo).to_gmt(fpath)
+            log.info("Reactome DB file saved to %s", fpath)
 
-        print("Complete!")
+        log.info("Complete!")
         return reactome_mo
 
 
@@ -354,6 +450,7 @@ def download_reactome(organism, filepath=None, omics_type='metabolomics', identi
 #         return pathways
 
 
+@_traced_download("PathBank")
 def download_pathbank(organism, filepath=None, omicstype='metabolomics'):
     '''
     Function for PathBank pathway download
@@ -370,13 +467,13 @@ def download_pathbank(organism, filepath=None, omicstype='metabolomics'):
         raise ValueError('Organism must be one of '+ ", ".join(organisms))
 
     version_no = None
-    pathway_names = pd.read_csv('https://pathbank.org/downloads/pathbank_all_pathways.csv.zip', compression='zip', sep=',', header=0)
+    pathway_names = _read_csv_url('https://pathbank.org/downloads/pathbank_all_pathways.csv.zip', compression='zip', sep=',', header=0)
     name_dict = dict(zip(pathway_names['SMPDB ID'], pathway_names['Name']))
 
 
     if omicstype == 'metabolomics':
         metabolites_url = 'https://pathbank.org/downloads/pathbank_all_metabolites.csv.zip'
-        chebi_pathways = pd.read_csv(metabolites_url, compression='zip', sep=',', header=0, dtype=str)
+        chebi_pathways = _read_csv_url(metabolites_url, compression='zip', sep=',', header=0, dtype=str)
         chebi_pathways = chebi_pathways[chebi_pathways['Species'] == organism]
 
         # reformat to gmt style such that each row contains chebi ID per pathway and each column is a chebi id
@@ -387,15 +484,15 @@ def download_pathbank(organism, filepath=None, omicstype='metabolomics'):
 
         if filepath:
             fpath = filepath + "/Pathbank_" + "_".join(organism.split())+ "_pathways_ChEBI" + ".gmt"
-            chebi_pathways_gmt.to_csv(fpath, sep="\t", header=False)
-            print("Pathbank DB file saved to " + fpath)
+            PathwaySet.from_wide(chebi_pathways_gmt).to_gmt(fpath)
+            log.info("Pathbank DB file saved to %s", fpath)
 
-        print("Complete!")
+        log.info("Complete!")
         return chebi_pathways_gmt
     
     if omicstype == 'proteomics':
         proteins_url = 'https://pathbank.org/downloads/pathbank_all_proteins.csv.zip'
-        uniprot_pathways = pd.read_csv(proteins_url, compression='zip', sep=',', header=0, dtype=str)
+        uniprot_pathways = _read_csv_url(proteins_url, compression='zip', sep=',', header=0, dtype=str)
         uniprot_pathways = uniprot_pathways[uniprot_pathways['Species'] == organism]
 
         # reformat to gmt style such that each row contains uniprot ID per pathway and each column is a uniprot id
@@ -406,39 +503,32 @@ def download_pathbank(organism, filepath=None, omicstype='metabolomics'):
 
         if filepath:
             fpath = filepath + "/Pathbank_" + "_".join(organism.split())+ "_pathways_UniProt" + ".gmt"
-            uniprot_pathways_gmt.to_csv(fpath, sep="\t", header=False)
-            print("Pathbank DB file saved to " + fpath)
+            PathwaySet.from_wide(uniprot_pathways_gmt).to_gmt(fpath)
+            log.info("Pathbank DB file saved to %s", fpath)
 
-        print("Complete!")
+        log.info("Complete!")
         return uniprot_pathways_gmt
     
     if omicstype == 'multiomics':
         metabolites_url = 'https://pathbank.org/downloads/pathbank_all_metabolites.csv.zip'
-        chebi_pathways = pd.read_csv(metabolites_url, compression='zip', sep=',', header=0, dtype=str)
-        chebi_pathways = chebi_pathways[chebi_pathways['Species'] == organism]
-
-        # reformat to gmt style such that each row contains chebi ID per pathway and each column is a chebi id
-        chebi_pathways = chebi_pathways.groupby(['PathBank ID', 'Pathway Name'])['ChEBI ID'].apply(list).reset_index()
-        chebi_pathways_gmt = pd.DataFrame(chebi_pathways['ChEBI ID'].values.tolist(), index=chebi_pathways['PathBank ID'])
-
         proteins_url = 'https://pathbank.org/downloads/pathbank_all_proteins.csv.zip'
-        uniprot_pathways = pd.read_csv(proteins_url, compression='zip', sep=',', header=0, dtype=str)
-        uniprot_pathways = uniprot_pathways[uniprot_pathways['Species'] == organism]
 
-        # reformat to gmt style such that each row contains uniprot ID per pathway and each column is a uniprot id
-        uniprot_pathways = uniprot_pathways.groupby(['PathBank ID', 'Pathway Name'])['Uniprot ID'].apply(list).reset_index()
-        uniprot_pathways_gmt = pd.DataFrame(uniprot_pathways['Uniprot ID'].values.tolist(), index=uniprot_pathways['PathBank ID'])
+        # download and parse both tables concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            chebi_future = executor.submit(_read_pathbank_csv, metabolites_url, organism, 'ChEBI ID')
+            uniprot_future = executor.submit(_read_pathbank_csv, proteins_url, organism, 'Uniprot ID')
+            combined_dict = _union_pathway_sets([chebi_future.result(), uniprot_future.result()])
 
-        multiomics_pathways_gmt = pd.concat([chebi_pathways_gmt, uniprot_pathways_gmt], axis=1)
+        multiomics_pathways_gmt = pd.DataFrame.from_dict(combined_dict, orient='index', dtype="object")
         multiomics_pathways_gmt['Pathway_name'] = multiomics_pathways_gmt.index.map(name_dict)
         multiomics_pathways_gmt.insert(0, 'Pathway_name', multiomics_pathways_gmt.pop('Pathway_name'))
 
         if filepath:
             fpath = filepath + "/Pathbank_" + "_".join(organism.split())+ "_pathways_multiomics" + ".gmt"
-            multiomics_pathways_gmt.to_csv(fpath, sep="\t", header=False)
-            print("Pathbank DB file saved to " + fpath)
+            PathwaySet.from_wide(multiomics_pathways_gmt).to_gmt(fpath)
+            log.info("Pathbank DB file saved to %s", fpath)
 
-        print("Complete!")
+        log.info("Complete!")
   
         return multiomics_pathways_gmt
     
\ No newline at end of file
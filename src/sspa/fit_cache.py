@@ -0,0 +1,234 @@
+"""
+Opt-in cache of fitted sspa_SVD, sspa_KPCA and sspa_ssClustPA models.
+
+Parameter searches and repeated cross-validation clone an estimator for every parameter setting and fit each clone
+on the same folds. With sspa.set_config(fit_cache=...) fit looks up its fitted state under a key hashing the
+content of the training data (see sspa.utils.fingerprint), the aligned pathways and the hyperparameters, so clones
+share their fits: a fold seen before is restored rather than refitted.
+
+The in-memory tier is an LRU bounded by the configured size. With fit_cache_dir, fitted models are also saved to
+(and restored from) that directory in the sspa.serialization format, so they are shared between the worker
+processes of a parallel search and across sessions; models restored from disk score through their packed
+parameters and are not used with nan_policy='omit'. Cache files are not removed automatically, see clear.
+
+Example:
+    sspa.set_config(fit_cache="2GB", fit_cache_dir="sspa_cache")
+    pipeline = Pipeline([("svd", sspa.sspa_SVD(pathways)), ("clf", LogisticRegression())])
+    GridSearchCV(pipeline, {"clf__C": [0.1, 1, 10]}, cv=5).fit(data, labels)
+    sspa.fit_cache.get_cache().info()
+"""
+import copy
+import functools
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import sspa.utils as utils
+from sspa import instrumentation, serialization
+from sspa.config import get_config, resolve_dtype
+
+# attributes that are not part of the fitted state
+_UNCACHED = ("X_", "y_", "pathways", "memory_plans_")
+# running statistics of partial_fit, which a restored fit starts over from
+_PARTIAL_FIT = ("n_samples_seen_", "pathway_positions_", "pathway_means_", "pathway_scatter_")
+# parameters that do not change the fitted state
+_UNHASHED = ("pathway_df", "keep_X")
+
+_cache = None
+_lock = threading.Lock()
+
+
+def _nbytes(value, seen=None):
+    """
+    Approximate memory held by the arrays of a fitted state
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v, seen) for v in value)
+    if hasattr(value, "__dict__"):
+        return _nbytes(vars(value), seen)
+    return 0
+
+
+class FitCache:
+    """
+    LRU cache of fitted states, with an optional on-disk tier
+
+    Args:
+        max_memory (int): size of the in-memory tier in bytes
+        directory (str): directory of the on-disk tier, None for memory only
+
+    Attributes:
+        hits (int): fits restored from memory
+        disk_hits (int): fits restored from disk
+        misses (int): fits computed
+    """
+    def __init__(self, max_memory, directory=None):
+        self.max_memory = max_memory
+        self.directory = directory
+        self.hits = self.disk_hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _remember(self, key, state):
+        size = _nbytes(state)
+        with self._lock:
+            if key in self._entries or size > self.max_memory:
+                return
+            self._entries[key] = (state, size)
+            self._nbytes += size
+            while self._nbytes > self.max_memory:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def get(self, key, model):
+        """
+        Args:
+            key (str): cache key, as returned by fit_key
+            model: estimator being fitted
+        Returns:
+            dict of fitted attributes, or None if the key is not cached
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        if self.directory is not None and getattr(model, "nan_policy", "propagate") != "omit":
+            path = self._path(key)
+            if os.path.exists(path):
+                state = _state(serialization.load(path, cls=type(model)))
+                self._remember(key, state)
+                with self._lock:
+                    self.disk_hits += 1
+                return state
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, model):
+        """
+        Cache the fitted state of a model
+        Args:
+            key (str): cache key, as returned by fit_key
+            model: fitted estimator
+        """
+        # a copy, so that later changes to the model (e.g. partial_fit) are not cached
+        self._remember(key, copy.deepcopy(_state(model)))
+        if self.directory is not None and getattr(model, "nan_policy", "propagate") != "omit":
+            os.makedirs(self.directory, exist_ok=True)
+            # written under a temporary name, so concurrent readers never see a partial file
+            path = self._path(key)
+            temporary = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            serialization.save(model, temporary)
+            os.replace(temporary, path)
+
+    def clear(self, disk=False):
+        """
+        Drop the in-memory tier, and the files of the on-disk tier if disk is True
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+        if disk and self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def info(self):
+        """
+        Returns:
+            dict of the hit and miss counts, entries and memory used by the in-memory tier
+        """
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "entries": len(self._entries), "nbytes": self._nbytes, "max_memory": self.max_memory,
+                    "directory": self.directory}
+
+    def __repr__(self):
+        return "FitCache(%d entries, %.1fMB of %.1fMB, directory=%r)" % (
+            len(self._entries), self._nbytes / 1024 ** 2, self.max_memory / 1024 ** 2, self.directory)
+
+
+def get_cache():
+    """
+    Returns:
+        the FitCache of the current configuration, shared by all estimators, or None if fit_cache is disabled
+    """
+    global _cache
+    config = get_config()
+    if config["fit_cache"] is None:
+        return None
+    with _lock:
+        if _cache is None or (_cache.max_memory, _cache.directory) != (config["fit_cache"], config["fit_cache_dir"]):
+            _cache = FitCache(config["fit_cache"], config["fit_cache_dir"])
+        return _cache
+
+
+def fit_key(model, X):
+    """
+    Cache key of fitting a model to X
+    Args:
+        model: sspa_SVD, sspa_KPCA or sspa_ssClustPA estimator
+        X (pd.DataFrame): training data
+    Returns:
+        str hex digest of the method, data fingerprint, pathways and hyperparameters
+    """
+    params = {k: v for k, v in model.get_params(deep=False).items() if k not in _UNHASHED}
+    if "dtype" in params:
+        params["dtype"] = resolve_dtype(params["dtype"]).name
+    digest = utils._sha1()
+    digest.update(type(model).__name__.encode())
+    digest.update(utils.fingerprint(X).encode())
+    digest.update(json.dumps(list(model.pathways.items()), default=str).encode())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+def _state(model):
+    params = model.get_params(deep=False)
+    return {k: v for k, v in vars(model).items() if k not in _UNCACHED + _PARTIAL_FIT and k not in params}
+
+
+def cached(fit):
+    """
+    Decorator of an estimator's fit method restoring the fitted state from the fit cache when it is enabled
+    """
+    @functools.wraps(fit)
+    def cached_fit(self, X, y=None):
+        cache = get_cache()
+        # warm started fits depend on the previous fit, not only on the key
+        if cache is None or getattr(self, "warm_start", False):
+            return fit(self, X, y)
+        key = fit_key(self, X)
+        state = cache.get(key, self)
+        if state is None:
+            fit(self, X, y)
+            cache.put(key, self)
+            return self
+
+        with instrumentation.span("fit_cache", method=type(self).__name__, n_samples=X.shape[0], n_features=X.shape[1]):
+            # fitted models are copied, so estimators restored from the same entry do not share mutable state
+            for name, value in copy.deepcopy(state).items():
+                setattr(self, name, value)
+            for name in _PARTIAL_FIT:
+                vars(self).pop(name, None)
+            self.memory_plans_ = {}
+            self.X_ = X if getattr(self, "keep_X", True) else None
+            self.y_ = y
+        return self
+    return cached_fit
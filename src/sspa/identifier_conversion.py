@@ -1,43 +1,385 @@
-import requests
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+from sspa import instrumentation
 
-def identifier_conversion(input_type, compound_list):
+log = logging.getLogger(__name__)
+
+METABOANALYST_URL = "https://www.xialab.ca/api/mapcompounds"
+OUTPUT_COLUMNS = ["Query", "Match", "HMDB", "PubChem", "ChEBI", "KEGG", "METLIN", "SMILES", "Comment"]
+
+
+def _default_cache_path():
+    cache_dir = os.environ.get("SSPA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sspa"))
+    return os.path.join(cache_dir, "identifier_conversion.sqlite")
+
+
+class ConversionCache:
     """
-    Use Metaboanalyst API for identifier conversion
+    Persistent SQLite cache of identifier conversion results, keyed by input identifier type and query.
+    Only matched identifiers are cached, so identifiers without a match are queried again in later conversions
+    (e.g. after they are added to MetaboAnalyst)
+
+    Args:
+        path (str): path of the SQLite database, default is identifier_conversion.sqlite in the sspa cache directory
+            (~/.cache/sspa, or the directory set by the SSPA_CACHE_DIR environment variable)
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else _default_cache_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS conversions "
+                               "(input_type TEXT, query TEXT, record TEXT, PRIMARY KEY (input_type, query))")
+
+    def get(self, input_type, queries):
+        """
+        Look up cached conversion records
+        Args:
+            input_type (str): identifier type of the queries
+            queries (list): list of identifiers
+        Returns:
+            dict of query (keys) and conversion record dicts (values) for the queries present in the cache
+        """
+        found = {}
+        queries = list(queries)
+        with self._lock:
+            # stay below SQLite's limit on the number of bound parameters
+            for start in range(0, len(queries), 500):
+                chunk = queries[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT query, record FROM conversions WHERE input_type = ? AND query IN (%s)" % ",".join("?" * len(chunk)),
+                    [input_type] + chunk).fetchall()
+                found.update({q: json.loads(r) for q, r in rows})
+        return found
+
+    def put(self, input_type, records):
+        """
+        Store conversion records, records without a match are not stored
+        Args:
+            input_type (str): identifier type of the queries
+            records (list): list of conversion record dicts, each containing a 'Query' key
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO conversions VALUES (?, ?, ?)",
+                                   [(input_type, r["Query"], json.dumps(r)) for r in records if _matched(r)])
+
+    def clear(self):
+        """
+        Remove all cached conversions
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM conversions")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+
+
+def _matched(record):
+    # the API reports identifiers without any match with a "NA" (or missing) Match
+    match = record.get("Match")
+    return isinstance(match, str) and match not in ("", "NA")
+
+
+def _local_records(local_tables, queries):
+    """
+    Look up queries in user supplied mapping tables (in the format returned by identifier_conversion)
+    """
+    found = {}
+    remaining = set(queries)
+    for table in local_tables:
+        if not remaining:
+            break
+        if not isinstance(table, pd.DataFrame):
+            table = pd.read_csv(table, dtype=str)
+        hits = table[table["Query"].isin(remaining)].drop_duplicates("Query")
+        for record in hits.to_dict(orient="records"):
+            found[record["Query"]] = record
+        remaining -= set(hits["Query"])
+    return found
+
+
+def _request_batch(session, url, input_type, batch, timeout):
+    """
+    Convert one batch of identifiers using the MetaboAnalyst mapcompounds API
+    """
+    payload = {"queryList": ";".join(batch) + ";", "inputType": input_type}
+    with instrumentation.span("request", url=url, n_queries=len(batch)) as span:
+        response = session.post(url, json=payload, headers={"cache-control": "no-cache"}, timeout=timeout)
+        span.set(status=response.status_code, bytes=len(response.content))
+    response.raise_for_status()
+    return pd.DataFrame(response.json()).to_dict(orient="records")
+
+
+def _make_session(retries):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # retry POST requests too
+    try:
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=None)
+    except TypeError:
+        # urllib3 before 1.26
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      method_whitelist=False)
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(max_retries=retry))
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    return session
+
+
+def identifier_conversion(input_type, compound_list, batch_size=500, n_jobs=4, cache=False,
+                          local_tables=None, offline=False, url=METABOANALYST_URL, retries=3, timeout=60):
+    """
+    Use Metaboanalyst API for identifier conversion.
+    Identifiers are looked up in any local mapping tables first, then in the persistent conversion cache,
+    and only the remaining identifiers are sent to the API in concurrent batches.
     Args:
         input_type (str): identifier type present in input data - any of ('name', 'hmdb', 'pubchem', 'chebi', 'metlin', 'kegg')
         compound_list (list): list of identifiers in the data
+        batch_size (int): maximum number of identifiers sent per API request
+        n_jobs (int): number of API requests sent concurrently
+        cache (bool, str or ConversionCache): False (default) to disable caching, True to use the cache in the sspa
+            cache directory (an SQLite file written to ~/.cache/sspa, or the directory set by the SSPA_CACHE_DIR
+            environment variable), or a file path or ConversionCache object to use a specific cache
+        local_tables (list): list of mapping tables (pd.DataFrames or CSV file paths) with the same columns as the output
+            of this function, consulted before the cache and the API
+        offline (bool): never call the API, identifiers not found locally are returned without matches
+        url (str): URL of the mapcompounds API
+        retries (int): number of retries for failed API requests
+        timeout (float): timeout in seconds for each API request
     Returns:
-        (pd.DataFrame) Dataframe containing identifier matches 
+        (pd.DataFrame) Dataframe containing identifier matches
     """
-    url = "https://www.xialab.ca/api/mapcompounds"
-    print('Commencing ID conversion using MetaboAnalyst API...')
-
     if input_type != 'name':
         raise NotImplementedError('Currently the API only converts from compound names to other identifiers.')
 
-    compound_list_string = ";".join(compound_list)
-    payload = f"{{\n\t\"queryList\": \"{compound_list_string};\",\n\t\"inputType\": \"{input_type}\"\n}}"
+    queries = list(dict.fromkeys(str(i) for i in compound_list))
+    records = _local_records(local_tables, queries) if local_tables else {}
 
-    headers = {
-        'Content-Type': "application/json",
-        'cache-control': "no-cache",
-        }
+    if cache is True:
+        cache = ConversionCache()
+    elif isinstance(cache, str):
+        cache = ConversionCache(cache)
+    elif cache is False:
+        cache = None
+    if cache is not None:
+        missing = [q for q in queries if q not in records]
+        records.update(cache.get(input_type, missing))
 
-    response = requests.request("POST", url, data=payload, headers=headers)
-    resp_dict = response.json()
-    resp_df = pd.DataFrame(resp_dict)
+    missing = [q for q in queries if q not in records]
+    if missing and not offline:
+        log.info('Commencing ID conversion using MetaboAnalyst API...')
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        session = _make_session(retries)
+        with ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(batches)))) as executor:
+            results = executor.map(lambda b: _request_batch(session, url, input_type, b, timeout), batches)
+            fetched = [r for batch_records in results for r in batch_records]
+        if cache is not None:
+            cache.put(input_type, fetched)
+        records.update({r["Query"]: r for r in fetched})
+
+    # identifiers without any match are reported as "NA", as the API does
+    rows = [records.get(q, {"Query": q}) for q in queries]
+    columns = list(dict.fromkeys(OUTPUT_COLUMNS + [k for r in rows for k in r]))
+    resp_df = pd.DataFrame(rows, columns=columns).fillna("NA")
     return resp_df
 
 
-def map_identifiers(query_df, output_id_type, matrix):
+class CrossReferenceIndex:
+    """
+    On-disk cross-reference index between identifier namespaces (e.g. 'chebi', 'kegg', 'hmdb', 'uniprot'),
+    built from local mapping files so that pathways and data matrices can be harmonised without network calls
+
+    Args:
+        path (str): path of the SQLite database holding the index, default is ":memory:" (not persisted)
+    """
+    def __init__(self, path=":memory:"):
+        self.path = path
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._mappings = {}
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS xref "
+                               "(source_ns TEXT, source_id TEXT, target_ns TEXT, target_id TEXT, "
+                               "UNIQUE (source_ns, source_id, target_ns, target_id))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS xref_lookup ON xref (source_ns, target_ns)")
+
+    def add_mapping(self, mapping, source_ns, target_ns, source_col=0, target_col=1, sep=None, bidirectional=True):
+        """
+        Add identifier pairs from a mapping table to the index
+        Args:
+            mapping (pd.DataFrame or str): mapping table, or path to a CSV/TSV mapping file
+            source_ns (str): namespace of the identifiers in source_col, e.g. 'hmdb'
+            target_ns (str): namespace of the identifiers in target_col, e.g. 'chebi'
+            source_col (str or int): column name or position of the source identifiers
+            target_col (str or int): column name or position of the target identifiers
+            sep (str): field separator of the mapping file, default is inferred from the file ending (.csv or tab separated)
+            bidirectional (bool): also index the target to source direction
+        Returns:
+            self : object
+        """
+        if not isinstance(mapping, pd.DataFrame):
+            if sep is None:
+                sep = "," if str(mapping).endswith(".csv") else "\t"
+            mapping = pd.read_csv(mapping, sep=sep, dtype=str)
+        cols = [mapping.columns[c] if isinstance(c, int) else c for c in (source_col, target_col)]
+        pairs = mapping[cols].dropna().astype(str).drop_duplicates()
+
+        rows = [(source_ns, pairs[cols[0]].values, target_ns, pairs[cols[1]].values)]
+        if bidirectional:
+            rows.append((target_ns, pairs[cols[1]].values, source_ns, pairs[cols[0]].values))
+        with self._conn:
+            for src_ns, src_ids, tgt_ns, tgt_ids in rows:
+                self._conn.executemany("INSERT OR IGNORE INTO xref VALUES (?, ?, ?, ?)",
+                                       zip([src_ns] * len(src_ids), src_ids, [tgt_ns] * len(tgt_ids), tgt_ids))
+                self._mappings.pop((src_ns, tgt_ns), None)
+        return self
+
+    def namespaces(self):
+        """
+        Returns:
+            list of (source namespace, target namespace) pairs available in the index
+        """
+        return self._conn.execute("SELECT DISTINCT source_ns, target_ns FROM xref").fetchall()
+
+    def mapping(self, source_ns, target_ns):
+        """
+        Load the mapping between two namespaces
+        Args:
+            source_ns (str): namespace to map from
+            target_ns (str): namespace to map to
+        Returns:
+            pd.DataFrame with 'source' and 'target' columns, one row per identifier pair
+        """
+        key = (source_ns, target_ns)
+        if key not in self._mappings:
+            rows = self._conn.execute("SELECT source_id, target_id FROM xref WHERE source_ns = ? AND target_ns = ?",
+                                      key).fetchall()
+            if not rows:
+                raise KeyError("No mapping from %s to %s in the cross-reference index" % key)
+            self._mappings[key] = pd.DataFrame(rows, columns=["source", "target"])
+        return self._mappings[key]
+
+    def translate_ids(self, ids, source_ns, target_ns):
+        """
+        Translate a list of identifiers
+        Args:
+            ids (list): identifiers in the source namespace
+            source_ns (str): namespace to map from
+            target_ns (str): namespace to map to
+        Returns:
+            pd.DataFrame with 'source' and 'target' columns for every identifier that could be mapped
+        """
+        mapping = self.mapping(source_ns, target_ns)
+        return mapping[mapping["source"].isin(pd.Index(ids).astype(str))].reset_index(drop=True)
+
+    def translate_pathways(self, pathway_df, source_ns, target_ns, keep_unmapped=False):
+        """
+        Translate the entities of a GMT-like pathway DataFrame to another namespace
+        Args:
+            pathway_df (pd.DataFrame): GMT-like pathway dataframe (as returned by the process_* functions)
+            source_ns (str): namespace of the pathway entities
+            target_ns (str): namespace to map to
+            keep_unmapped (bool): keep entities without a mapping under their original identifier
+        Returns:
+            GMT-like pd.DataFrame containing the translated pathways
+        """
+        long_df = pathway_df.drop(["Pathway_name"], axis=1).melt(ignore_index=False, value_name="source")["source"]
+        long_df = long_df.dropna().astype(str).reset_index()
+        long_df.columns = ["Pathway_ID", "source"]
+        long_df = long_df[~long_df["source"].isin(["None", "nan"])]
+
+        how = "left" if keep_unmapped else "inner"
+        merged = long_df.merge(self.mapping(source_ns, target_ns), on="source", how=how)
+        if keep_unmapped:
+            merged["target"] = merged["target"].fillna(merged["source"])
+        merged = merged.drop_duplicates(["Pathway_ID", "target"])
+
+        groups = merged.groupby("Pathway_ID", sort=False)["target"].apply(list).to_dict()
+        translated = pd.DataFrame.from_dict(groups, orient="index", dtype="object")
+        translated.insert(0, "Pathway_name", translated.index.map(pathway_df["Pathway_name"].to_dict()))
+        return translated
+
+    def translate_matrix(self, matrix, source_ns, target_ns, aggregate="mean", keep_unmapped=False):
+        """
+        Re-key the columns of a sample-by-entity matrix to another namespace.
+        Columns mapping to several targets are duplicated, and several columns mapping to the same target are
+        combined using the aggregate function.
+        Args:
+            matrix (pd.DataFrame): sample-by-entity data matrix with source namespace identifiers as columns
+            source_ns (str): namespace of the matrix columns
+            target_ns (str): namespace to map to
+            aggregate (str): how to combine columns mapping to the same target, any of 'mean', 'max', 'min', 'sum' or 'first'
+            keep_unmapped (bool): keep columns without a mapping under their original identifier
+        Returns:
+            sample-by-entity pd.DataFrame with target namespace identifiers as columns
+        """
+        return _rekey_columns(matrix, self.translate_ids(matrix.columns, source_ns, target_ns), aggregate, keep_unmapped)
+
+    def close(self):
+        self._conn.close()
+
+
+def _rekey_columns(matrix, pairs, aggregate="mean", keep_unmapped=False):
+    """
+    Re-key matrix columns from a table of (source, target) identifier pairs, aggregating columns sharing a target
+    """
+    if aggregate not in ("mean", "max", "min", "sum", "first"):
+        raise ValueError("aggregate must be one of 'mean', 'max', 'min', 'sum' or 'first'")
+    columns = matrix.columns.astype(str)
+    # pairs are joined to column positions, so duplicated column labels each map (and aggregate) separately
+    positions = pd.DataFrame({"source": columns, "position": np.arange(len(columns))})
+    pairs = pairs[["source", "target"]].drop_duplicates().merge(positions, on="source")
+    if keep_unmapped:
+        unmapped = positions[~positions["source"].isin(pairs["source"])]
+        pairs = pd.concat([pairs, unmapped.assign(target=unmapped["source"])], ignore_index=True)
+    if len(pairs) == 0:
+        return pd.DataFrame(np.empty((len(matrix), 0)), index=matrix.index, columns=pd.Index([], dtype=object))
+
+    col_idx = pairs["position"].to_numpy()
+    target_codes, targets = pd.factorize(pairs["target"])
+
+    # order columns by target so each target's columns form one contiguous run, then reduce runs in one pass
+    order = np.lexsort((col_idx, target_codes))
+    starts = np.flatnonzero(np.r_[True, np.diff(target_codes[order]) != 0])
+    values = matrix.to_numpy(dtype=float)[:, col_idx[order]]
+
+    if aggregate == "first":
+        out = values[:, starts]
+    elif aggregate == "max":
+        out = np.fmax.reduceat(values, starts, axis=1)
+    elif aggregate == "min":
+        out = np.fmin.reduceat(values, starts, axis=1)
+    else:
+        observed = ~np.isnan(values)
+        out = np.add.reduceat(np.where(observed, values, 0), starts, axis=1)
+        if aggregate == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out = out / np.add.reduceat(observed, starts, axis=1)
+    return pd.DataFrame(out, index=matrix.index, columns=targets[target_codes[order][starts]])
+
+
+def map_identifiers(query_df, output_id_type, matrix, aggregate=None):
     """
     Map desired identifiers to input data
     Args:
         query_df (pd.DataFrame): DataFrame obtained using the identifier_conversion function containing ID mappings
         output_id_type (str): Any of ('Match', 'HMDB', 'PubChem', 'ChEBI', 'KEGG', 'METLIN','SMILES')
         matrix (pd.DataFrame): sample-by-compound metabolomics data matrix
+        aggregate (str): default None keeps one column per compound. Otherwise compounds mapping to the same identifier
+            are combined into a single column using any of 'mean', 'max', 'min', 'sum' or 'first'
     Returns:
         Sample-by-compound metabolomics data matrix with mapped identifiers, any compounds without a matching ID will be dropped
     """
@@ -46,6 +388,9 @@ def map_identifiers(query_df, output_id_type, matrix):
     # output id type can be any of ['HMDB', 'PubChem', 'ChEBI', 'KEGG', 'METLIN','SMILES']
     cpd_mapping_dict = dict(zip(query_df["Query"].tolist(), query_df[output_id_type].tolist()))
     cpd_mapping_dict = {k: v for k, v in cpd_mapping_dict.items() if v not in ["NA", np.nan, None, "None"]}
+    if aggregate is not None:
+        pairs = pd.DataFrame(list(cpd_mapping_dict.items()), columns=["source", "target"], dtype=str)
+        return _rekey_columns(matrix, pairs, aggregate)
     renamed_mat = matrix.drop([i for i in matrix.columns if i not in cpd_mapping_dict.keys()], axis=1)
     renamed_mat = renamed_mat.rename(cpd_mapping_dict, axis=1)
     return renamed_mat
@@ -0,0 +1,271 @@
+"""
+Opt-in instrumentation for sspa methods.
+
+Estimators, ORA/GSEA and the pathway download functions wrap their stages, per-pathway work and network
+requests in spans. Spans are only created while at least one callback is registered, so the cost when
+instrumentation is disabled is a single list check per call.
+
+Example:
+    with sspa.instrumentation.profile() as report:
+        sspa.sspa_SVD(pathways).fit_transform(data)
+    report.slowest_pathways(10)
+    report.stage_times()
+
+Download progress (previously printed) is reported through the 'sspa' logger and request spans, e.g.
+    logging.basicConfig(level=logging.INFO)
+    sspa.instrumentation.add_callback(sspa.instrumentation.LogCallback(names=["request"]))
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+_callbacks = []
+_local = threading.local()
+
+
+class Span:
+    """
+    A timed unit of work
+
+    Attributes:
+        name (str): span type, e.g. 'fit', 'fit_pathway', 'request'
+        attrs (dict): attributes of the span, e.g. method, pathway, n_samples, n_entities, url
+        parent (Span): enclosing span on the same thread, or None
+        start (float): start time (time.perf_counter)
+        end (float): end time (time.perf_counter), None while the span is open
+    """
+    __slots__ = ("name", "attrs", "parent", "start", "end")
+
+    def __init__(self, name, attrs, parent):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attrs):
+        """
+        Add attributes to the span, e.g. sizes only known once the work is done
+        """
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        stack.append(self)
+        self.start = time.perf_counter()
+        for callback in _callbacks:
+            callback.on_span_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _stack().pop()
+        for callback in _callbacks:
+            callback.on_span_end(self)
+        return False
+
+    def __repr__(self):
+        return "Span(%r, %r, duration=%r)" % (self.name, self.attrs, self.duration)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def span(name, **attrs):
+    """
+    Context manager timing a unit of work. Returns a no-op object when no callbacks are registered.
+    Args:
+        name (str): span type
+        **attrs: attributes recorded with the span
+    Returns:
+        Span (or a no-op stand-in) supporting the context manager protocol and set(**attrs)
+    """
+    if not _callbacks:
+        return _NULL_SPAN
+    stack = _stack()
+    return Span(name, attrs, stack[-1] if stack else None)
+
+
+def current():
+    """
+    Returns:
+        the innermost open span of the calling thread, or None
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def attach(parent):
+    """
+    Context manager making parent the enclosing span of the spans created inside it on the calling thread, e.g. in
+    worker threads running the per-pathway work of a span opened on another thread
+    Args:
+        parent (Span): span returned by current on the other thread, or None
+    """
+    if parent is None:
+        yield
+        return
+    stack = _stack()
+    stack.append(parent)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def enabled():
+    """
+    Returns:
+        True if any instrumentation callbacks are registered
+    """
+    return bool(_callbacks)
+
+
+class Callback:
+    """
+    Base class for instrumentation callbacks. Subclasses override on_span_start and/or on_span_end.
+    """
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        pass
+
+
+def add_callback(callback):
+    """
+    Register an instrumentation callback
+    Args:
+        callback (Callback): object with on_span_start(span) and on_span_end(span) methods
+    Returns:
+        the callback
+    """
+    _callbacks.append(callback)
+    return callback
+
+
+def remove_callback(callback):
+    """
+    Unregister an instrumentation callback
+    """
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+class TimingReport(Callback):
+    """
+    Callback collecting finished spans into a structured timing report
+    """
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def on_span_end(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_frame(self):
+        """
+        Returns:
+            pd.DataFrame with one row per finished span: name, duration (s), parent span name and span attributes
+        """
+        rows = [dict(span.attrs, name=span.name, duration=span.duration,
+                     parent=span.parent.name if span.parent is not None else None) for span in self.spans]
+        return pd.DataFrame(rows)
+
+    def stage_times(self):
+        """
+        Returns:
+            pd.DataFrame of total time, call count and mean time per span type (and method, where recorded)
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        keys = ["name", "method"] if "method" in df.columns else ["name"]
+        grouped = df.groupby([df[k].fillna("") for k in keys])["duration"]
+        return pd.DataFrame({"total": grouped.sum(), "count": grouped.count(),
+                             "mean": grouped.mean()}).sort_values("total", ascending=False)
+
+    def slowest_pathways(self, n=10):
+        """
+        Args:
+            n (int): number of pathways to report
+        Returns:
+            pd.DataFrame of the n slowest per-pathway spans with their method, stage and matrix sizes
+        """
+        df = self.to_frame()
+        if df.empty or "pathway" not in df.columns:
+            return pd.DataFrame()
+        return df[df["pathway"].notna()].sort_values("duration", ascending=False).head(n).reset_index(drop=True)
+
+    def requests(self):
+        """
+        Returns:
+            pd.DataFrame of network request spans with URL, duration and response size
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        return df[df["name"] == "request"].reset_index(drop=True)
+
+
+class LogCallback(Callback):
+    """
+    Callback writing finished spans to a logger, e.g. to follow download progress
+    Args:
+        logger (logging.Logger): logger to write to, default is the 'sspa' logger
+        names (list): span types to log, default is all
+        level (int): logging level
+    """
+    def __init__(self, logger=None, names=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("sspa")
+        self.names = names
+        self.level = level
+
+    def on_span_end(self, span):
+        if self.names is None or span.name in self.names:
+            attrs = " ".join("%s=%s" % kv for kv in span.attrs.items())
+            self.logger.log(self.level, "%s %.4fs %s", span.name, span.duration, attrs)
+
+
+@contextmanager
+def profile():
+    """
+    Context manager collecting all spans created inside it into a TimingReport
+    Returns:
+        TimingReport
+    """
+    report = add_callback(TimingReport())
+    try:
+        yield report
+    finally:
+        remove_callback(report)
@@ -0,0 +1,284 @@
+"""
+Memory-budget scheduling for sspa methods.
+
+When a memory ceiling is configured with sspa.set_config(max_memory=...), each method estimates its working set
+from the input shape and the pathway sizes, and chooses how many samples and pathways to process at a time and how
+many worker threads to use so the estimate stays under the ceiling. Estimators store the plan for each stage, with
+the peak traced memory measured while it ran, in their memory_plans_ attribute; plans are also logged to the
+'sspa.memory' logger.
+
+Example:
+    sspa.set_config(max_memory="2GB")
+    model = sspa.sspa_KPCA(pathways).fit(data)
+    model.memory_plans_["fit"]
+"""
+import logging
+import os
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sspa import instrumentation
+from sspa.config import get_config
+
+log = logging.getLogger(__name__)
+
+_ITEMSIZE = 8
+# a python float and its list slot, for matrices passed to gseapy as nested lists
+_FLOAT_OBJECT = 32
+# one (sample, pathway) row of a gseapy long-format res2d table
+_RESULT_ROW = 160
+# gseapy ignores gene sets with more members than this (its default max_size)
+GSEAPY_MAX_SIZE = 500
+
+# stages whose samples (rows) are scored independently and so can be processed in blocks
+_SAMPLE_BLOCKS = {("sspa_SVD", "transform"), ("sspa_KPCA", "transform"), ("sspa_ssClustPA", "transform"),
+                  ("sspa_ssGSEA", "transform"), ("sspa_singscore", "transform")}
+# stages whose pathways can be processed in separate backend calls
+_PATHWAY_BLOCKS = {("sspa_ssGSEA", "transform")}
+
+
+def _costs(method, stage, n_samples, n_features, n_pathways, max_size, n_train, permutations, itemsize=_ITEMSIZE):
+    """
+    Linear working-set model of a method stage, in bytes:
+        fixed + shared * samples + cell * samples * pathways + n_jobs * (worker + sample * samples)
+    where samples and pathways are the block sizes.
+    """
+    b = itemsize
+    n, F, P, k, t = n_samples, n_features, n_pathways, max_size, n_train
+    # per-pathway score vectors and the final DataFrame
+    scores = 2 * n * P * b
+    costs = {"fixed": 0, "shared": 0, "cell": 0, "worker": 0, "sample": 0}
+    if method == "sspa_zscore":
+        # pathway slice, its z-scores and their sum
+        costs.update(fixed=scores, sample=3 * k * b)
+    elif method == "sspa_SVD":
+        if stage == "fit":
+            # pathway slice, centred copy and left singular vectors; fitted loadings are kept
+            costs.update(fixed=P * k * b, worker=k * k * b, sample=3 * k * b)
+        else:
+            costs.update(fixed=scores + P * k * b, sample=2 * k * b)
+    elif method == "sspa_ssClustPA":
+        if stage == "fit":
+            # pathway slice, copy, distances to the two centroids and labels; centroids are kept
+            costs.update(fixed=2 * P * k * b, sample=(3 * k + 4) * b)
+        else:
+            costs.update(fixed=scores + 2 * P * k * b, sample=2 * k * b)
+    elif method == "sspa_KPCA":
+        # each fitted model keeps its training slice and dual coefficients
+        models = P * (t * k + 2 * t) * b
+        if stage == "fit":
+            # n x n kernel, its centred copy and the eigensolver workspace
+            costs.update(fixed=models, worker=(4 * t * t + t * k) * b)
+        else:
+            # samples x n_train kernel between new and training samples, and its centred copy
+            costs.update(fixed=scores + models, sample=(3 * t + k) * b)
+    elif method == "sspa_ssGSEA":
+        # ranked copy of the data, its nested-list conversion and long-format results
+        costs.update(fixed=scores, shared=F * (3 * b + _FLOAT_OBJECT), cell=_RESULT_ROW, worker=2 * F * b)
+    elif method == "sspa_singscore":
+        # float32 rank matrix (cached), and a float64 copy of a block of ranks and its mean ranks
+        costs.update(fixed=scores + n * F * 4, shared=F * b + 2 * P * b)
+    elif method == "sspa_gsea":
+        # nested-list input, per-pathway running sums and null distributions of the permutations,
+        # and a permuted copy of the data per thread
+        costs.update(fixed=n * F * _FLOAT_OBJECT + P * F * b + 2 * P * permutations * b, worker=(n * F + 2 * F) * b)
+    else:
+        raise ValueError("No memory model for method %r" % method)
+    return costs
+
+
+def _estimate(costs, samples, pathways, n_jobs):
+    return (costs["fixed"] + costs["shared"] * samples + costs["cell"] * samples * pathways
+            + n_jobs * (costs["worker"] + costs["sample"] * samples))
+
+
+def _max_jobs(n_jobs, budget, default_jobs):
+    if n_jobs is None:
+        return (os.cpu_count() or 1) if budget is not None else default_jobs
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def aligned_sizes(pathways, columns):
+    """
+    Number of members of each pathway present in the data
+    Args:
+        pathways (dict): pathway dictionary
+        columns (array-like): data matrix columns
+    Returns:
+        dict of pathway identifiers (keys) and aligned sizes (values)
+    """
+    from sspa.pathway_set import as_pathway_set
+    return dict(zip(pathways, as_pathway_set(pathways).coverage(columns).tolist()))
+
+
+class MemoryPlan:
+    """
+    Block sizes and worker count chosen for one stage of a method
+
+    Attributes:
+        method (str): method name, e.g. 'sspa_KPCA'
+        stage (str): 'fit', 'transform' or 'gsea'
+        n_samples (int): number of samples in the input
+        n_pathways (int): number of pathways scored
+        sample_block (int): samples processed at a time
+        pathway_block (int): pathways processed per backend call
+        n_jobs (int): worker threads
+        budget (int): memory ceiling in bytes, None if unlimited
+        estimated_bytes (int): estimated working set of the plan, None if no ceiling is set
+        peak_bytes (int): peak traced memory measured while the plan ran, None until measured
+    """
+    def __init__(self, method, stage, n_samples, n_pathways, sample_block, pathway_block, n_jobs,
+                 budget=None, estimated_bytes=None):
+        self.method = method
+        self.stage = stage
+        self.n_samples = n_samples
+        self.n_pathways = n_pathways
+        self.sample_block = sample_block
+        self.pathway_block = pathway_block
+        self.n_jobs = n_jobs
+        self.budget = budget
+        self.estimated_bytes = estimated_bytes
+        self.peak_bytes = None
+
+    @property
+    def blocked(self):
+        """
+        True if samples or pathways are split into more than one block
+        """
+        return self.sample_block < self.n_samples or self.pathway_block < self.n_pathways
+
+    def sample_blocks(self):
+        """
+        Yields:
+            slice of rows for each sample block
+        """
+        for start in range(0, max(self.n_samples, 1), self.sample_block):
+            yield slice(start, min(start + self.sample_block, self.n_samples))
+
+    def pathway_blocks(self, pathways):
+        """
+        Args:
+            pathways (list): pathway identifiers
+        Yields:
+            list of pathway identifiers for each pathway block
+        """
+        pathways = list(pathways)
+        for start in range(0, len(pathways), self.pathway_block):
+            yield pathways[start:start + self.pathway_block]
+
+    def map(self, func, items):
+        """
+        Apply func to each item using the planned number of worker threads
+        Returns:
+            list of results, in the order of items
+        """
+        if self.n_jobs == 1:
+            return [func(item) for item in items]
+        # spans opened by func in the workers belong to the span open here
+        parent = instrumentation.current()
+
+        def run(item):
+            with instrumentation.attach(parent):
+                return func(item)
+
+        with ThreadPoolExecutor(self.n_jobs) as pool:
+            return list(pool.map(run, items))
+
+    @contextmanager
+    def measure(self):
+        """
+        Context manager recording the peak traced (Python and NumPy) memory allocated inside it in peak_bytes.
+        Memory is only traced when a ceiling is set; if tracemalloc is already tracing, the peak is an upper bound.
+        """
+        if self.budget is None:
+            yield self
+            return
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        try:
+            yield self
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+            self.peak_bytes = max(peak - base, 0)
+            log.info("%r", self)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict of the plan
+        """
+        return {"method": self.method, "stage": self.stage, "n_samples": self.n_samples,
+                "n_pathways": self.n_pathways, "sample_block": self.sample_block,
+                "pathway_block": self.pathway_block, "n_jobs": self.n_jobs, "budget": self.budget,
+                "estimated_bytes": self.estimated_bytes, "peak_bytes": self.peak_bytes}
+
+    def __repr__(self):
+        def mb(value):
+            return "-" if value is None else "%.1fMB" % (value / 1024 ** 2)
+        return ("MemoryPlan(%s %s: %d samples in blocks of %d, %d pathways in blocks of %d, n_jobs=%d, "
+                "budget=%s, estimated=%s, peak=%s)" % (self.method, self.stage, self.n_samples, self.sample_block,
+                                                       self.n_pathways, self.pathway_block, self.n_jobs,
+                                                       mb(self.budget), mb(self.estimated_bytes), mb(self.peak_bytes)))
+
+
+def plan(method, stage, X, pathways, n_train=None, permutations=0, sizes=None, default_jobs=1, itemsize=_ITEMSIZE):
+    """
+    Choose sample and pathway block sizes and a worker count for a method stage under the configured max_memory.
+
+    Workers are reduced first, then the sample block and then the pathway block, for stages that can be split.
+    If the smallest plan still exceeds the ceiling a warning is raised and it is used anyway.
+
+    Args:
+        method (str): method name, e.g. 'sspa_KPCA'
+        stage (str): 'fit', 'transform' or 'gsea'
+        X (pd.DataFrame): input data matrix (samples x entities)
+        pathways (dict): pathways scored in this stage
+        n_train (int): number of training samples of a fitted model, default X.shape[0]
+        permutations (int): number of permutations (GSEA)
+        sizes (dict): aligned pathway sizes, as returned by aligned_sizes, computed if not given
+        default_jobs (int): worker count used when neither max_memory nor n_jobs are configured
+        itemsize (int): bytes per value of the computation dtype, 4 for float32
+    Returns:
+        MemoryPlan
+    """
+    config = get_config()
+    budget = config["max_memory"]
+    n_samples, n_features = X.shape
+    n_pathways = len(pathways)
+    max_jobs = _max_jobs(config["n_jobs"], budget, default_jobs)
+    if budget is None:
+        return MemoryPlan(method, stage, n_samples, n_pathways, max(n_samples, 1), max(n_pathways, 1), max_jobs)
+
+    if sizes is None:
+        sizes = aligned_sizes(pathways, X.columns)
+    max_size = max(sizes.values(), default=0)
+    costs = _costs(method, stage, n_samples, n_features, n_pathways, max_size,
+                   n_train if n_train is not None else n_samples, permutations, itemsize)
+
+    samples, blocks = max(n_samples, 1), max(n_pathways, 1)
+    if _estimate(costs, samples, blocks, 1) > budget and (method, stage) in _SAMPLE_BLOCKS:
+        per_sample = costs["shared"] + costs["sample"] + costs["cell"] * blocks
+        room = budget - costs["fixed"] - costs["worker"]
+        samples = int(min(samples, max(1, room // per_sample if per_sample else samples)))
+    if _estimate(costs, samples, blocks, 1) > budget and (method, stage) in _PATHWAY_BLOCKS:
+        room = budget - _estimate(costs, samples, 0, 1)
+        blocks = int(min(blocks, max(1, room // (costs["cell"] * samples))))
+    estimated = _estimate(costs, samples, blocks, 1)
+    if estimated > budget:
+        warnings.warn("%s %s needs an estimated %.1fMB, more than max_memory=%.1fMB, even in the smallest blocks"
+                      % (method, stage, estimated / 1024 ** 2, budget / 1024 ** 2))
+        n_jobs = 1
+    else:
+        per_worker = costs["worker"] + costs["sample"] * samples
+        room = budget - _estimate(costs, samples, blocks, 0)
+        n_jobs = int(min(max_jobs, max(1, room // per_worker if per_worker else max_jobs)))
+    return MemoryPlan(method, stage, n_samples, n_pathways, samples, blocks, n_jobs,
+                      budget=budget, estimated_bytes=_estimate(costs, samples, blocks, n_jobs))
@@ -0,0 +1,264 @@
+"""
+Streaming output of pathway scores and result tables.
+
+Blocks of scores (samples x pathways, e.g. one per chunk of a chunked transform) and of result rows (ORA and GSEA
+tables) are appended to the output file as they are produced, so the whole table never has to be held in memory.
+The format is chosen by the file extension: Parquet (.parquet, .pq), Arrow IPC (.arrow, .feather) or text (.csv,
+.tsv). Writing Parquet and Arrow files requires pyarrow.
+
+Scores are written wide, a Sample column and one column per pathway, or long, one (Sample, Pathway, Score) row
+per score. In Parquet and Arrow files, sample and pathway identifiers are dictionary-encoded (read back as
+categoricals), and the entity lists of result tables (DA_Metabolites_ID, Leading_edge) are stored as lists of
+dictionary-encoded identifiers rather than joined strings.
+
+Example:
+    with sspa.output.ScoreWriter("scores.parquet", layout="long") as writer:
+        for chunk in sspa.cli.read_chunks("data.csv", chunk_size=5000):
+            writer.write(model.transform(chunk))
+"""
+import numpy as np
+import pandas as pd
+
+from sspa import instrumentation
+
+LAYOUTS = ("wide", "long")
+_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".csv": "csv",
+            ".tsv": "tsv"}
+# joined entity identifier columns of ORA and GSEA results, and their separators
+ENTITY_LISTS = {"DA_Metabolites_ID": ", ", "Leading_edge": ";"}
+
+
+def _format(path):
+    for ext, fmt in _FORMATS.items():
+        if str(path).lower().endswith(ext):
+            return fmt
+    raise ValueError("Unsupported output format %r, expected one of %s" % (str(path), ", ".join(_FORMATS)))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Writing Parquet and Arrow files requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class _Writer:
+    """
+    Append pandas blocks to a Parquet, Arrow IPC or text file, with the schema of the first block
+    """
+    def __init__(self, path):
+        self.path = path
+        self.format = _format(path)
+        self.pa = _require_pyarrow() if self.format in ("parquet", "arrow") else None
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._dictionaries = {}
+
+    def _append(self, df, index):
+        if self.format in ("csv", "tsv"):
+            df.to_csv(self.path, sep="," if self.format == "csv" else "\t", mode="w" if self.rows == 0 else "a",
+                      header=self.rows == 0, index=index)
+            return
+        pa = self.pa
+        table = self._table(df, index)
+        # dictionary indices are widened to int32, so the schema holds for blocks with more distinct values, and
+        # dictionaries of blocks with only missing values are typed as strings
+        schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), pa.string() if pa.types.is_null(
+            field.type.value_type) else field.type.value_type)) if pa.types.is_dictionary(field.type) else field
+            for field in table.schema], metadata=table.schema.metadata)
+        table = self._encode(table.cast(schema))
+        if self._writer is None:
+            self._schema = table.schema
+            if self.format == "parquet":
+                self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema,
+                                               options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+        self._writer.write_table(table.cast(self._schema))
+
+    def _table(self, df, index):
+        return self.pa.Table.from_pandas(df, preserve_index=index)
+
+    def _encode(self, table):
+        if self.format != "arrow":
+            return table
+        # Arrow files cannot replace a dictionary between batches, so the dictionaries grow instead: each batch
+        # indexes all the values of the column seen so far
+        pa = self.pa
+        for n, field in enumerate(table.schema):
+            column = table.column(n).combine_chunks()
+            if pa.types.is_dictionary(field.type):
+                table = table.set_column(n, field.name, self._grow(field.name, column))
+            elif pa.types.is_list(field.type) and pa.types.is_dictionary(field.type.value_type):
+                column = pa.ListArray.from_arrays(column.offsets, self._grow(field.name, column.values))
+                table = table.set_column(n, field.name, column)
+        return table
+
+    def _grow(self, name, array):
+        pa = self.pa
+        seen = self._dictionaries.setdefault(name, {})
+        codes = [seen.setdefault(value, len(seen)) for value in array.dictionary.to_pylist()]
+        indices = pa.compute.take(pa.array(codes, pa.int32()), array.indices)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(list(seen), array.dictionary.type))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ScoreWriter(_Writer):
+    """
+    Stream blocks of pathway scores to a file
+    Args:
+        path (str): output file, the format is chosen by the extension (.parquet, .pq, .arrow, .feather, .csv, .tsv)
+        layout (str): 'wide' (default), a Sample column and one column per pathway, or 'long', one row of Sample,
+        Pathway and Score per score
+    """
+    def __init__(self, path, layout="wide"):
+        if layout not in LAYOUTS:
+            raise ValueError("layout must be one of %s, got %r" % (", ".join(map(repr, LAYOUTS)), layout))
+        super().__init__(path)
+        self.layout = layout
+        self.pathways = None
+
+    def write(self, scores):
+        """
+        Append a block of scores
+        Args:
+            scores (pd.DataFrame): samples x pathways scores, e.g. returned by transform, with the same pathways in
+            every block
+        """
+        pathways = [str(pathway) for pathway in scores.columns]
+        if self.pathways is None:
+            self.pathways = pathways
+        elif pathways != self.pathways:
+            raise ValueError("Score blocks must have the same pathways, in the same order, as the first block")
+        codes, samples = pd.factorize(scores.index)
+        samples = samples.astype(str)
+        if self.layout == "wide":
+            block = pd.DataFrame(scores.to_numpy(), columns=pathways,
+                                 index=pd.CategoricalIndex(pd.Categorical.from_codes(codes, samples), name="Sample"))
+            self._append(block, index=True)
+        else:
+            n_samples, n_pathways = scores.shape
+            block = pd.DataFrame({
+                "Sample": pd.Categorical.from_codes(np.repeat(codes, n_pathways), samples),
+                "Pathway": pd.Categorical.from_codes(np.tile(np.arange(n_pathways), n_samples), pathways),
+                "Score": scores.to_numpy().ravel()})
+            self._append(block, index=False)
+        self.rows += len(scores)
+
+    def _table(self, df, index):
+        if self.layout == "long" or self._schema is None:
+            return super()._table(df, index)
+        # wide blocks have a column per pathway, converted directly rather than through pandas once the schema is
+        # known (from_pandas has a per-column overhead)
+        pa = self.pa
+        values = np.asfortranarray(df.to_numpy())
+        samples = pa.DictionaryArray.from_arrays(pa.array(df.index.codes, pa.int32()), pa.array(df.index.categories))
+        return pa.Table.from_arrays([pa.array(values[:, n]) for n in range(values.shape[1])] + [samples],
+                                    schema=self._schema)
+
+
+class ResultWriter(_Writer):
+    """
+    Stream blocks of result rows (e.g. ORA or GSEA results) to a file. The index, pathway identifier and name
+    columns are dictionary-encoded and joined entity identifier columns are stored as lists of dictionary-encoded
+    identifiers in Parquet and Arrow files
+    Args:
+        path (str): output file, the format is chosen by the extension (.parquet, .pq, .arrow, .feather, .csv, .tsv)
+        index (bool): write the index, default True
+        entity_lists (dict): joined entity identifier columns and their separators, default ENTITY_LISTS
+    """
+    dictionary = ("ID", "Pathway_ID", "Pathway_name")
+
+    def __init__(self, path, index=True, entity_lists=None):
+        super().__init__(path)
+        self.index = index
+        self.entity_lists = ENTITY_LISTS if entity_lists is None else entity_lists
+
+    def write(self, df):
+        """
+        Append a block of rows
+        Args:
+            df (pd.DataFrame): result rows, with the same columns in every block
+        """
+        if self.format in ("csv", "tsv"):
+            self._append(df, index=self.index)
+        else:
+            df = df.copy()
+            df.columns = [str(c) for c in df.columns]
+            for column in self.dictionary:
+                if column in df.columns:
+                    df[column] = df[column].astype("category")
+            if self.index and df.index.dtype == object:
+                df.index = df.index.astype("category")
+            self._append(df, index=self.index)
+        self.rows += len(df)
+
+    def _encode(self, table):
+        pa = self.pa
+        for column, separator in self.entity_lists.items():
+            if column not in table.column_names or not pa.types.is_string(table.schema.field(column).type):
+                continue
+            joined = table.column(column).combine_chunks()
+            # empty strings are rows without entities, stored as empty lists
+            lists = pa.compute.split_pattern(pa.compute.if_else(pa.compute.equal(joined, ""), None, joined),
+                                             separator)
+            lists = pa.compute.fill_null(lists, pa.scalar([], lists.type))
+            encoded = pa.ListArray.from_arrays(lists.offsets, lists.values.dictionary_encode())
+            table = table.set_column(table.column_names.index(column), column, encoded)
+        return super()._encode(table)
+
+
+def _chunk_dependent(model):
+    # models whose scores are standardised over the samples transformed together
+    method = type(model).__name__
+    if method == "sspa_ssGSEA":
+        return True
+    return (method == "sspa_zscore" and getattr(model, "mean_", None) is None
+            and getattr(model, "packed_", None) is None)
+
+
+def write_scores(model, X, path, layout="wide", chunk_size=None):
+    """
+    Transform samples a chunk at a time and stream their scores to a file, so the scores of all samples are never
+    held in memory. Models standardising scores over the samples of each transform (sspa_ssGSEA and sspa_zscore
+    fitted with fit) would score each chunk differently: they raise a ValueError unless all samples are transformed
+    at once. Fit sspa_zscore with partial_fit (or load a saved model) to score it in chunks
+    Args:
+        model: fitted sspa estimator
+        X (pd.DataFrame): samples x entities matrix, or an iterable of such chunks, e.g. from sspa.cli.read_chunks
+        path (str): output file, see ScoreWriter
+        layout (str): 'wide' or 'long', see ScoreWriter
+        chunk_size (int): samples transformed at a time when X is a pd.DataFrame, default all samples
+    Returns:
+        number of samples written
+    """
+    whole = isinstance(X, pd.DataFrame) and (chunk_size is None or chunk_size >= len(X))
+    if not whole and _chunk_dependent(model):
+        raise ValueError("%s standardises scores over the samples of each transform, so chunked scores would differ "
+                         "from scoring all samples at once: pass all samples as one DataFrame without chunk_size%s"
+                         % (type(model).__name__, ", or fit it with partial_fit" if type(model).__name__ ==
+                            "sspa_zscore" else ""))
+    chunks = X
+    if isinstance(X, pd.DataFrame):
+        step = chunk_size or max(len(X), 1)
+        chunks = (X.iloc[start:start + step] for start in range(0, len(X), step))
+    with instrumentation.span("write_scores", method=type(model).__name__, layout=layout), \
+            ScoreWriter(path, layout) as writer:
+        for chunk in chunks:
+            writer.write(model.transform(chunk))
+    return writer.rows
@@ -0,0 +1,423 @@
+import numpy as np
+import pandas as pd
+
+# tokens treated as missing entries in GMT-like pathway tables
+_MISSING = ("", "None", "nan")
+
+
+class PathwaySet:
+    """
+    Compact long-format representation of a collection of pathways.
+
+    Pathway members are stored in compressed sparse row (CSR) layout: the members of pathway i are
+    entities[entity_codes[indptr[i]:indptr[i + 1]]], in the order they were read. Members are stored as read
+    so the pathways of GMT files round-trip field for field (see to_gmt); set operations (to_dict,
+    incidence_matrix) skip duplicated and missing entries.
+
+    Args:
+        pathway_ids (array-like): pathway identifiers
+        pathway_names (array-like): pathway names (or descriptions), one per pathway
+        indptr (array-like): CSR row pointer of length len(pathway_ids) + 1
+        entity_codes (array-like): position of each pathway member in entities
+        entities (array-like): unique entity identifiers
+    """
+    def __init__(self, pathway_ids, pathway_names, indptr, entity_codes, entities):
+        self.pathway_ids = np.asarray(pathway_ids, dtype=object)
+        self.pathway_names = np.asarray(pathway_names, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.entity_codes = np.asarray(entity_codes, dtype=np.int64)
+        self.entities = np.asarray(entities, dtype=object)
+        if len(self.indptr) != len(self.pathway_ids) + 1 or len(self.pathway_names) != len(self.pathway_ids):
+            raise ValueError('indptr must have one more element than there are pathways, with one name per pathway')
+        self._positions = None
+        self._entity_index = None
+        self._entity_lookup = None
+
+    @classmethod
+    def from_long(cls, df, pathway_col="Pathway_ID", entity_col="Entity", name_col="Pathway_name"):
+        """
+        Create a PathwaySet from a long-format table with one row per (pathway, entity) pair. Rows without a pathway
+        identifier are dropped
+        Args:
+            df (pd.DataFrame): long-format pathway table
+            pathway_col (str): column containing pathway identifiers
+            entity_col (str): column containing entity identifiers
+            name_col (str): column containing pathway names, optional
+        Returns:
+            PathwaySet
+        """
+        df = df[df[pathway_col].notna()]
+        pathway_codes, pathway_ids = pd.factorize(df[pathway_col])
+        entity_codes, entities = pd.factorize(df[entity_col].astype(str))
+        order = np.argsort(pathway_codes, kind="stable")
+        indptr = np.r_[0, np.cumsum(np.bincount(pathway_codes, minlength=len(pathway_ids)))]
+        if name_col in df.columns:
+            names = df.groupby(pathway_col, sort=False)[name_col].first().reindex(pathway_ids).values
+        else:
+            names = [""] * len(pathway_ids)
+        return cls(pathway_ids, names, indptr, entity_codes[order], entities)
+
+    @classmethod
+    def from_dict(cls, pathways, names=None):
+        """
+        Create a PathwaySet from a dictionary of pathway identifiers (keys) and entity lists (values)
+        Args:
+            pathways (dict): pathway dictionary, e.g. as returned by sspa.utils.pathwaydf_to_dict
+            names (dict): optional dictionary of pathway identifiers (keys) and pathway names (values)
+        Returns:
+            PathwaySet
+        """
+        names = names or {}
+        vocab = {}
+        codes = [vocab.setdefault(str(e), len(vocab)) for members in pathways.values() for e in members]
+        indptr = np.r_[0, np.cumsum([len(v) for v in pathways.values()])]
+        return cls(list(pathways), [names.get(k, "") for k in pathways], indptr, codes, list(vocab))
+
+    @classmethod
+    def from_wide(cls, pathway_df):
+        """
+        Create a PathwaySet from a GMT-like (wide) pathway DataFrame, as returned by the process_* functions
+        Args:
+            pathway_df (pd.DataFrame): pathway DataFrame with pathway identifiers as the index,
+                a Pathway_name column and one entity per remaining column
+        Returns:
+            PathwaySet
+        """
+        members = pathway_df.drop(["Pathway_name"], axis=1).to_numpy(dtype=object)
+        present = pd.notna(members)
+        present[present] = ~np.isin(members[present].astype(str), _MISSING)
+        entity_codes, entities = pd.factorize(members[present].astype(str))
+        indptr = np.r_[0, np.cumsum(present.sum(axis=1))]
+        return cls(pathway_df.index, pathway_df["Pathway_name"].values, indptr, entity_codes, entities)
+
+    @classmethod
+    def read_gmt(cls, infile, id_column=0):
+        """
+        Stream a .gmt file into a PathwaySet without building a padded table
+        Args:
+            infile (str): path to a GMT file (tab separated: pathway identifier, pathway name/description, entities...)
+            id_column (int): 0 if the pathway identifier is the first field (default), 1 if it is the second field
+                as in the Reactome GMT files
+        Returns:
+            PathwaySet
+        """
+        pathway_ids, names, sizes, codes, vocab = [], [], [], [], {}
+        with open(infile, "r") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if fields == [""]:
+                    continue
+                pathway_ids.append(fields[id_column])
+                names.append(fields[1 - id_column] if len(fields) > 1 else "")
+                members = fields[2:]
+                sizes.append(len(members))
+                codes.extend([vocab.setdefault(e, len(vocab)) for e in members])
+        indptr = np.r_[0, np.cumsum(sizes, dtype=np.int64)]
+        return cls(pathway_ids, names, indptr, codes, list(vocab))
+
+    def to_gmt(self, outfile, id_column=0):
+        """
+        Stream the pathways to a .gmt file, one line per pathway.
+        A file read with read_gmt is written back field for field when the same id_column is used, normalised to
+        one newline-terminated (LF) line per pathway: blank lines are dropped, CRLF line endings become LF, a missing
+        final newline is added and a line with a single field gains an empty name field. Normalised files are
+        written back byte for byte.
+        Args:
+            outfile (str): path of the GMT file to write
+            id_column (int): 0 to write the pathway identifier as the first field (default), 1 to write it second
+        """
+        with open(outfile, "w") as f:
+            for n, (pathway, name) in enumerate(zip(self.pathway_ids, self.pathway_names)):
+                head = [str(pathway), str(name)] if id_column == 0 else [str(name), str(pathway)]
+                members = self.entities[self.entity_codes[self.indptr[n]:self.indptr[n + 1]]]
+                f.write("\t".join(head + members.tolist()) + "\n")
+
+    def __len__(self):
+        return len(self.pathway_ids)
+
+    def __repr__(self):
+        return "PathwaySet(%d pathways, %d entities, %d memberships)" % (len(self), len(self.entities), len(self.entity_codes))
+
+    @property
+    def sizes(self):
+        """
+        Number of stored members of each pathway
+        """
+        return np.diff(self.indptr)
+
+    def members(self, pathway):
+        """
+        Members of a single pathway
+        Args:
+            pathway (str): pathway identifier
+        Returns:
+            list of entity identifiers
+        """
+        n = self._position(pathway)
+        return self.entities[self.entity_codes[self.indptr[n]:self.indptr[n + 1]]].tolist()
+
+    def _position(self, pathway):
+        if self._positions is None:
+            self._positions = {k: n for n, k in enumerate(self.pathway_ids)}
+        return self._positions[pathway]
+
+    def to_long(self):
+        """
+        Returns:
+            long-format pd.DataFrame with Pathway_ID, Pathway_name and Entity columns, one row per pathway member
+        """
+        rows = np.repeat(np.arange(len(self)), self.sizes)
+        return pd.DataFrame({"Pathway_ID": self.pathway_ids[rows],
+                             "Pathway_name": self.pathway_names[rows],
+                             "Entity": self.entities[self.entity_codes]})
+
+    def to_wide(self):
+        """
+        Convert to the legacy GMT-like DataFrame used by the process_* functions, with a Pathway_name column
+        followed by one column per member, padded with None
+        Returns:
+            GMT-like pd.DataFrame
+        """
+        sizes = self.sizes
+        width = int(sizes.max()) if len(sizes) else 0
+        members = np.full((len(self), width), None, dtype=object)
+        rows = np.repeat(np.arange(len(self)), sizes)
+        cols = np.arange(len(self.entity_codes)) - np.repeat(self.indptr[:-1], sizes)
+        members[rows, cols] = self.entities[self.entity_codes]
+        wide = pd.DataFrame(members, index=pd.Index(self.pathway_ids, dtype=object), dtype="object")
+        wide.insert(0, "Pathway_name", self.pathway_names)
+        return wide
+
+    def to_dict(self, min_size=2):
+        """
+        Convert to a dictionary of pathway identifiers (keys) and lists of unique entities (values),
+        equivalent to sspa.utils.pathwaydf_to_dict
+        Args:
+            min_size (int): minimum number of unique entities for a pathway to be included
+        Returns:
+            python dict pathway representation
+        """
+        valid = ~np.isin(self.entities.astype(str), _MISSING)
+        pathway_dict = {}
+        for n, pathway in enumerate(self.pathway_ids):
+            codes = self.entity_codes[self.indptr[n]:self.indptr[n + 1]]
+            codes = pd.unique(codes[valid[codes]])
+            if len(codes) >= min_size:
+                pathway_dict[pathway] = self.entities[codes].tolist()
+        return pathway_dict
+
+    def subset(self, pathway_ids):
+        """
+        Args:
+            pathway_ids (list): identifiers of the pathways to keep, in the order they should appear
+        Returns:
+            PathwaySet with only the given pathways, sharing the entity vocabulary
+        """
+        rows = np.array([self._position(k) for k in pathway_ids], dtype=np.int64).reshape(-1)
+        sizes = self.sizes[rows]
+        starts = np.repeat(self.indptr[rows], sizes)
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return PathwaySet(self.pathway_ids[rows], self.pathway_names[rows], np.r_[0, np.cumsum(sizes)],
+                          self.entity_codes[starts + offsets], self.entities)
+
+    def incidence_matrix(self):
+        """
+        Returns:
+            scipy.sparse.csr_matrix of shape (pathways, entities) with a 1 where an entity is a member of a pathway
+        """
+        import scipy.sparse as sp
+
+        valid = ~np.isin(self.entities.astype(str), _MISSING)
+        data = valid[self.entity_codes].astype(np.int8)
+        incidence = sp.csr_matrix((data, self.entity_codes, self.indptr), shape=(len(self), len(self.entities)))
+        incidence.sum_duplicates()
+        incidence.eliminate_zeros()
+        incidence.data[:] = 1
+        return incidence
+
+    def entity_index(self):
+        """
+        Inverted index from entities to the pathways containing them, built on first use and cached
+        Returns:
+            scipy.sparse.csc_matrix of shape (pathways, entities); the pathways containing entity j are
+            pathway_ids[index.indices[index.indptr[j]:index.indptr[j + 1]]]
+        """
+        if self._entity_index is None:
+            self._entity_index = self.incidence_matrix().tocsc()
+        return self._entity_index
+
+    def _lookup(self, entities):
+        if self._entity_lookup is None:
+            self._entity_lookup = pd.Index(self.entities, dtype=object)
+        return self._entity_lookup.get_indexer(pd.Index(entities, dtype=object))
+
+    def pathways_containing(self, entities, min_count=1):
+        """
+        Args:
+            entities (list): entity identifiers
+            min_count (int): minimum number of the entities a pathway must contain
+        Returns:
+            array of identifiers of the pathways containing at least min_count of the entities
+        """
+        return self.pathway_ids[self.coverage(entities).values >= min_count]
+
+    def coverage(self, columns):
+        """
+        Number of columns that are members of each pathway, computed in a single pass over the entity index
+        Args:
+            columns (array-like): entity identifiers, e.g. data matrix columns
+        Returns:
+            pd.Series of coverage indexed by pathway identifiers
+        """
+        codes = self._lookup(columns)
+        hits = self.entity_index()[:, codes[codes >= 0]].indices
+        return pd.Series(np.bincount(hits, minlength=len(self)), index=self.pathway_ids)
+
+    def align(self, columns):
+        """
+        Align pathways to data columns
+        Args:
+            columns (array-like): data matrix columns
+        Returns:
+            scipy.sparse.csr_matrix of shape (pathways, columns) with a 1 where a column is a member of a pathway,
+            column indices of each row sorted
+        """
+        import scipy.sparse as sp
+
+        codes = self._lookup(columns)
+        positions = np.flatnonzero(codes >= 0)
+        aligned = self.entity_index()[:, codes[positions]].tocsr()
+        aligned = sp.csr_matrix((aligned.data, positions[aligned.indices], aligned.indptr),
+                                shape=(len(self), len(codes)))
+        aligned.sort_indices()
+        return aligned
+
+    def _overlap_pairs(self, metric, threshold, top_k, entities, include_self, block_size):
+        incidence = self.incidence_matrix().astype(np.int32)
+        if entities is not None:
+            incidence = incidence[:, np.isin(self.entities.astype(str), np.asarray(entities, dtype=str))]
+        sizes = np.asarray(incidence.sum(axis=1)).ravel()
+        transposed = incidence.T.tocsr()
+        pairs = []
+        for start in range(0, len(self), block_size):
+            shared = (incidence[start:start + block_size] @ transposed).tocoo()
+            rows, cols, counts = shared.row.astype(np.int64) + start, shared.col.astype(np.int64), shared.data
+            if not include_self:
+                keep = rows != cols
+                rows, cols, counts = rows[keep], cols[keep], counts[keep]
+            union = sizes[rows] + sizes[cols] - counts
+            jaccard = counts / union
+            overlap = counts / np.minimum(sizes[rows], sizes[cols])
+            value = {"jaccard": jaccard, "overlap": overlap, "shared": counts.astype(float)}[metric]
+            keep = np.flatnonzero(value >= threshold)
+            if top_k is not None:
+                # rank pairs within each row by decreasing similarity, ties broken by column
+                order = keep[np.lexsort((cols[keep], -value[keep], rows[keep]))]
+                rank = np.arange(len(order)) - np.searchsorted(rows[order], rows[order])
+                keep = np.sort(order[rank < top_k])
+            pairs.append((rows[keep], cols[keep], counts[keep], jaccard[keep], overlap[keep], value[keep]))
+        if not pairs:
+            return (np.zeros(0, dtype=np.int64),) * 3 + (np.zeros(0),) * 3
+        return tuple(np.concatenate(a) for a in zip(*pairs))
+
+    def overlap(self, metric="jaccard", threshold=0.0, top_k=None, entities=None, include_self=False, block_size=1024):
+        """
+        Pairwise pathway similarity computed from sparse incidence matrix products, one block of rows at a time.
+        Only pathway pairs sharing at least one entity are stored.
+        Args:
+            metric (str): 'jaccard' (shared / union), 'overlap' (overlap coefficient, shared / smaller pathway size)
+                or 'shared' (number of shared entities)
+            threshold (float): only keep similarities of at least this value
+            top_k (int): only keep the top_k most similar pathways of each pathway
+            entities (list): restrict pathways to these entities (e.g. the measured data columns) before comparing
+            include_self (bool): keep the similarity of each pathway with itself
+            block_size (int): number of pathways (rows) compared at a time, bounding the memory used
+        Returns:
+            scipy.sparse.csr_matrix of shape (pathways, pathways), rows and columns in the order of pathway_ids
+        """
+        import scipy.sparse as sp
+
+        if metric not in ("jaccard", "overlap", "shared"):
+            raise ValueError("metric must be one of 'jaccard', 'overlap' or 'shared'")
+        rows, cols, _, _, _, value = self._overlap_pairs(metric, threshold, top_k, entities, include_self, block_size)
+        return sp.csr_matrix((value, (rows, cols)), shape=(len(self), len(self)))
+
+    def overlap_table(self, metric="jaccard", threshold=0.0, top_k=None, entities=None, block_size=1024):
+        """
+        Long-format table of overlapping pathway pairs, selected as in overlap
+        Returns:
+            pd.DataFrame with Pathway_ID_1, Pathway_ID_2, Shared, Jaccard and Overlap_coefficient columns,
+            one row per ordered pathway pair
+        """
+        if metric not in ("jaccard", "overlap", "shared"):
+            raise ValueError("metric must be one of 'jaccard', 'overlap' or 'shared'")
+        rows, cols, counts, jaccard, overlap, _ = self._overlap_pairs(metric, threshold, top_k, entities, False, block_size)
+        return pd.DataFrame({"Pathway_ID_1": self.pathway_ids[rows], "Pathway_ID_2": self.pathway_ids[cols],
+                             "Shared": counts, "Jaccard": jaccard, "Overlap_coefficient": overlap})
+
+
+def as_pathway_set(pathways):
+    """
+    Args:
+        pathways: PathwaySet, GMT-like pathway DataFrame or pathway dictionary
+    Returns:
+        PathwaySet
+    """
+    if isinstance(pathways, PathwaySet):
+        return pathways
+    if isinstance(pathways, pd.DataFrame):
+        return PathwaySet.from_wide(pathways)
+    # pathway dictionaries returned by sspa.utils.pathwaydf_to_dict carry the PathwaySet built with them
+    pathway_set = getattr(pathways, "_pathway_set", None)
+    if pathway_set is not None:
+        return pathway_set
+    return PathwaySet.from_dict(pathways)
+
+
+def collapse_redundant(results, pathways, threshold=0.5, metric="overlap", id_col="ID", p_col="P-adjust",
+                       alpha=0.05, entities=None):
+    """
+    Collapse redundant significant pathways in enrichment results.
+
+    Significant pathways (p_col <= alpha) are visited from the most to the least significant. A pathway whose
+    similarity to an already kept pathway is at least threshold is removed and listed under the kept pathway it is
+    most similar to. Pathways that are not significant are left as they are.
+
+    Args:
+        results (pd.DataFrame): enrichment results, e.g. from sspa_ora or sspa_gsea
+        pathways: PathwaySet, GMT-like pathway DataFrame or pathway dictionary used for the analysis
+        threshold (float): similarity at or above which pathways are redundant
+        metric (str): similarity metric, 'overlap' (overlap coefficient) or 'jaccard'
+        id_col (str): column of results containing pathway identifiers
+        p_col (str): column of results containing the p-values used to rank pathways
+        alpha (float): significance cutoff on p_col
+        entities (list): restrict pathways to these entities (e.g. the background set) before comparing
+    Returns:
+        results without the redundant pathways and with a Redundant_pathways column listing the pathways collapsed
+        into each kept pathway
+    """
+    pathway_set = as_pathway_set(pathways)
+    significant = results[results[p_col].astype(float) <= alpha].sort_values(p_col, kind="stable")
+    known = set(pathway_set.pathway_ids)
+    ids = [k for k in significant[id_col] if k in known]
+    similarity = pathway_set.subset(ids).overlap(metric, threshold=threshold, entities=entities).tocsr()
+
+    # pathways are kept in the order they are visited, so of equally similar kept pathways the earliest kept is the
+    # one with the lowest position
+    kept = np.zeros(len(ids), dtype=bool)
+    collapsed = {}
+    for i, pathway in enumerate(ids):
+        start, stop = similarity.indptr[i], similarity.indptr[i + 1]
+        neighbours, scores = similarity.indices[start:stop], similarity.data[start:stop]
+        mask = kept[neighbours]
+        if mask.any():
+            neighbours, scores = neighbours[mask], scores[mask]
+            representative = ids[neighbours[scores == scores.max()].min()]
+            collapsed.setdefault(representative, []).append(pathway)
+        else:
+            kept[i] = True
+
+    removed = {k for members in collapsed.values() for k in members}
+    res = results[~results[id_col].isin(removed)].copy()
+    res["Redundant_pathways"] = res[id_col].map(lambda k: "; ".join(collapsed.get(k, [])))
+    return res
@@ -1,6 +1,6 @@
 import pandas as pd
-import pkg_resources
-import sspa.download_pathways 
+from sspa.utils import _resource_stream
+from sspa.pathway_set import PathwaySet
 
 def process_reactome(organism, infile=None, download_latest=False, filepath=None, omics_type='metabolomics', identifiers=None):
     '''
@@ -20,14 +20,15 @@ def process_reactome(organism, infile=None, download_latest=False, filepath=None
     # Process CHEBI to reactome data
 
     if download_latest:
-        pathways_df = sspa.download_pathways.download_reactome(organism, filepath, omics_type, identifiers)
+        from sspa.download_pathways import download_reactome
+        pathways_df = download_reactome(organism, filepath, omics_type, identifiers)
         return pathways_df
     
     else:
         if omics_type != 'metabolomics':
             raise ValueError('Proteomics/multi-omics pathways only accessible when download_latest=True')
         if infile == None or infile == "R78":
-            stream = pkg_resources.resource_stream(__name__, 'pathway_databases/ChEBI2Reactome_All_Levels_R78.txt')
+            stream = _resource_stream('pathway_databases/ChEBI2Reactome_All_Levels_R78.txt')
             f = pd.read_csv(stream, sep="\t", header=None, encoding='latin-1')
         else:
             f = pd.read_csv(infile, sep="\t", header=None)
@@ -59,14 +60,15 @@ def process_kegg(organism, infile=None, download_latest=False, filepath=None, om
         GMT-like pd.DataFrame containing KEGG pathways
     '''
     if download_latest:
-        pathways_df = sspa.download_pathways.download_KEGG(organism, filepath, omics_type)
+        from sspa.download_pathways import download_KEGG
+        pathways_df = download_KEGG(organism, filepath, omics_type)
         return pathways_df
 
     else:
         if omics_type != 'metabolomics':
             raise ValueError('Proteomics/multi-omics pathways only accessible when download_latest=True')
         if infile == None or infile == "R98":
-            stream = pkg_resources.resource_stream(__name__, 'pathway_databases/KEGG_human_pathways_compounds_R98.csv')
+            stream = _resource_stream('pathway_databases/KEGG_human_pathways_compounds_R98.csv')
             pathways_df = pd.read_csv(stream, index_col=0, encoding='latin-1')
         else:
             pathways_df = pd.read_csv(infile, index_col=0)
@@ -93,7 +95,8 @@ def process_pathbank(organism, infile=None, download_latest=False, filepath=None
         GMT-like pd.DataFrame containing PathBank pathways
     '''
     if download_latest:
-        pathways_df = sspa.download_pathways.download_pathbank(organism, filepath, omics_type)
+        from sspa.download_pathways import download_pathbank
+        pathways_df = download_pathbank(organism, filepath, omics_type)
         return pathways_df
 
     else:
@@ -114,14 +117,8 @@ def process_gmt(infile):
     if infile[-4:] == ".csv":
         pathways_df = pd.read_csv(infile, index_col=0, dtype='object')
     elif infile[-4:] == ".gmt":
-        input_gmt = []
-        with open(infile, "r") as f:
-            for i in f:
-                input_gmt.append(i.strip("\n").split("\t"))
-        pathways_df = pd.DataFrame(input_gmt)
-        pathways_df = pathways_df.rename({0:"Pathway_ID", 1:"Pathway_name"}, axis=1)
-        pathways_df.index = pathways_df["Pathway_ID"]
-        pathways_df = pathways_df.drop("Pathway_ID", axis=1)
+        pathways_df = PathwaySet.read_gmt(infile).to_wide()
+        pathways_df.index.name = "Pathway_ID"
 
     pathways_df = pathways_df.dropna(axis=0, how='all', subset=pathways_df.columns.tolist()[1:])
     pathways_df = pathways_df.dropna(axis=1, how='all')
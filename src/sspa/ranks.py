@@ -0,0 +1,104 @@
+"""
+Per-sample rank matrices shared by the rank-based methods.
+
+Ranking every sample is the most expensive step of rank-based scoring. rank_samples ranks the entities of each
+sample once and caches the rank matrix on the fingerprint of the data (see sspa.utils.fingerprint), so scoring the
+same data with several rank-based methods, or with several pathway collections, ranks it once. Cached matrices are
+float32 (ranks and average tied ranks are exact below 2**23 entities) and read-only. The cache keeps the most
+recently used matrices, cache_size of them.
+
+Example:
+    ranks = sspa.ranks.rank_samples(data)
+    sspa.sspa_singscore(pathways).fit_transform(data)  # reads the cached ranks
+    sspa.ranks.clear_cache()
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import sspa.utils as utils
+from sspa import instrumentation
+
+TIES = ("average", "min")
+# number of rank matrices kept
+cache_size = 4
+# samples ranked at a time, bounding the argsort temporaries
+_BLOCK = 1024
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _rank_block(values, ties):
+    # NaN values rank last and tie with each other, as pandas' na_option='bottom'
+    if np.isnan(values).any():
+        values = np.where(np.isnan(values), np.inf, values)
+    order = np.argsort(values, axis=1)
+    ordered = np.take_along_axis(values, order, axis=1)
+    n = values.shape[1]
+    positions = np.broadcast_to(np.arange(n, dtype=np.float32), values.shape)
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    if starts.all():
+        ranked = positions + 1
+    else:
+        # the first (and last) sorted position of each run of tied values
+        first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+        if ties == "min":
+            ranked = first + 1
+        else:
+            ends = np.ones(values.shape, dtype=bool)
+            ends[:, :-1] = starts[:, 1:]
+            last = np.minimum.accumulate(np.where(ends, positions, n)[:, ::-1], axis=1)[:, ::-1]
+            ranked = (first + last) / np.float32(2) + 1
+    ranks = np.empty(values.shape, dtype=np.float32)
+    np.put_along_axis(ranks, order, ranked, axis=1)
+    return ranks
+
+
+def rank_samples(X, ties="average", cache=True):
+    """
+    Rank the entities of each sample in ascending order, from 1
+    Args:
+        X (pd.DataFrame): data matrix (samples x entities), dense or sparse (see sspa.utils.sparse_values)
+        ties (str): rank of tied values, 'average' (as ssGSEA) or 'min' (as singscore)
+        cache (bool): read and store the rank matrix in the cache
+    Returns:
+        read-only column-major float32 np.ndarray of ranks (samples x entities), in the column order of X
+    """
+    if ties not in TIES:
+        raise ValueError("ties must be one of %s, got %r" % (", ".join(map(repr, TIES)), ties))
+    key = (utils.fingerprint(X), ties) if cache else None
+    if cache:
+        with _lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    sparse = utils.sparse_values(X, "csr")
+    values = X.to_numpy() if sparse is None else None
+    # column-major, as DataFrame values, so products with pathway indicator matrices read it without a copy
+    ranks = np.empty(X.shape, dtype=np.float32, order="F")
+    with instrumentation.span("rank", n_samples=X.shape[0], n_features=X.shape[1], ties=ties):
+        for start in range(0, X.shape[0], _BLOCK):
+            rows = slice(start, start + _BLOCK)
+            block = values[rows] if sparse is None else sparse[rows].toarray()
+            # argsort along rows of the (column-major) DataFrame values is much faster on a C-ordered copy
+            ranks[rows] = _rank_block(np.ascontiguousarray(block, dtype=float), ties)
+    ranks.flags.writeable = False
+
+    if cache:
+        with _lock:
+            _cache[key] = ranks
+            while len(_cache) > cache_size:
+                _cache.popitem(last=False)
+    return ranks
+
+
+def clear_cache():
+    """
+    Drop the cached rank matrices
+    """
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,401 @@
+"""
+Compact storage of fitted sspa_SVD, sspa_KPCA, sspa_ssClustPA and sspa_zscore models.
+
+Only the parameters needed to score new samples are stored, packed into a few contiguous arrays in an uncompressed
+.npz file so they can be memory-mapped on load:
+
+    columns, pathway_ids        training entities and fitted pathways
+    indptr, col_idx             CSR layout: pathway i uses columns[col_idx[indptr[i]:indptr[i + 1]]]
+    weight, offset              linear methods (SVD loadings, ssClustPA unit centroid difference, z-score
+                                reference statistics): score = X[:, cols] @ weight[i] - offset[i]
+    X_fit, gamma, alpha,        KPCA: training slices (n_train x nnz), RBF gamma, scaled first dual coefficients and
+    K_fit_rows, K_fit_all       the kernel centring terms, one row per pathway
+
+Floating point parameters are stored, and new data scored, in the dtype the model was fitted with (float32 or
+float64, recorded in the metadata).
+
+Example:
+    model = sspa.sspa_KPCA(pathways, keep_X=False).fit(data)
+    model.save("kpca.npz")
+    scores = sspa.sspa_KPCA.load("kpca.npz").transform(new_data)
+"""
+import json
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from sspa import instrumentation, memory
+
+FORMAT_VERSION = 1
+_LINEAR = ("sspa_SVD", "sspa_ssClustPA", "sspa_zscore")
+
+
+def _pathway_columns(model):
+    """
+    Training columns used by each fitted pathway, in training column order (as selected by X.drop in fit)
+    """
+    features = getattr(model, "feature_names_in_", None)
+    if features is None and getattr(model, "X_", None) is not None:
+        features = np.asarray(model.X_.columns, dtype=object)
+    if features is None:
+        raise ValueError("Model does not record its training columns, refit it before saving")
+    features = np.asarray(features, dtype=object)
+    return features, [np.flatnonzero(np.isin(features, model.pathways_filt[k])) for k in model.pathway_ids]
+
+
+def pack(model):
+    """
+    Pack the inference parameters of a fitted model into contiguous arrays
+    Args:
+        model: fitted sspa_SVD, sspa_KPCA or sspa_ssClustPA estimator, or sspa_zscore fitted with partial_fit
+    Returns:
+        dict of array names and numpy arrays
+    """
+    method = type(model).__name__
+    if getattr(model, "packed_", None) is not None:
+        return dict(model.packed_.arrays)
+    if method == "sspa_zscore":
+        return _pack_zscore(model)
+    features, positions = _pathway_columns(model)
+    indptr = np.r_[0, np.cumsum([len(p) for p in positions], dtype=np.int64)]
+    col_idx = np.concatenate(positions).astype(np.int64) if positions else np.zeros(0, dtype=np.int64)
+    dtype = getattr(model, "dtype_", np.dtype(np.float64))
+    meta = {"min_entity": model.min_entity, "random_state": model.random_state,
+            "n_samples_fit": getattr(model, "n_samples_fit_", None), "dtype": dtype.name}
+    arrays = {"columns": features.astype(str), "pathway_ids": np.asarray(model.pathway_ids, dtype=object).astype(str),
+              "indptr": indptr, "col_idx": col_idx}
+
+    if method == "sspa_SVD":
+        weight = [m.components_[0] for m in model.fitted_models]
+        offset = [m.mean_ @ m.components_[0] for m in model.fitted_models]
+    elif method == "sspa_ssClustPA":
+        weight = []
+        for m in model.fitted_models:
+            vec = m.cluster_centers_[0] - m.cluster_centers_[1]
+            weight.append(vec / np.linalg.norm(vec))
+        offset = np.zeros(len(weight))
+    elif method == "sspa_KPCA":
+        alpha = []
+        for m in model.fitted_models:
+            scaled = np.zeros_like(m.eigenvectors_[:, 0])
+            if m.eigenvalues_[0] != 0:
+                scaled = m.eigenvectors_[:, 0] / np.sqrt(m.eigenvalues_[0])
+            alpha.append(scaled)
+        n_train = model.fitted_models[0].X_fit_.shape[0] if model.fitted_models else 0
+        gamma, K_fit_rows, K_fit_all = zip(*map(_kernel_centring, model.fitted_models)) if model.fitted_models \
+            else ((), (), ())
+        arrays.update(X_fit=np.hstack([m.X_fit_ for m in model.fitted_models]) if model.fitted_models
+                      else np.zeros((0, 0)),
+                      gamma=np.array(gamma, dtype=float),
+                      alpha=np.array(alpha, dtype=dtype).reshape(-1, n_train),
+                      K_fit_rows=np.array(K_fit_rows, dtype=dtype).reshape(-1, n_train),
+                      K_fit_all=np.array(K_fit_all, dtype=dtype))
+        meta.update(format_version=FORMAT_VERSION, method=method, n_samples_fit=n_train)
+    else:
+        raise TypeError("Cannot pack %s models" % method)
+
+    if method in _LINEAR:
+        return pack_linear(method, features, model.pathway_ids, indptr, col_idx, weight, offset, **meta)
+    arrays["meta"] = np.array(json.dumps(meta))
+    return arrays
+
+
+def _kernel_centring(model):
+    """
+    RBF gamma and kernel centring terms (training kernel column means and overall mean) of a fitted KernelPCA,
+    recomputed from its training data rather than read from scikit-learn internals (gamma_ is only set from
+    scikit-learn 1.1)
+    """
+    from sklearn.metrics.pairwise import rbf_kernel
+    gamma = model.gamma if model.gamma is not None else 1.0 / model.X_fit_.shape[1]
+    K_fit_rows = rbf_kernel(model.X_fit_, gamma=gamma).mean(axis=0)
+    return gamma, K_fit_rows, K_fit_rows.mean()
+
+
+def _pack_zscore(model):
+    if getattr(model, "mean_", None) is None:
+        raise ValueError("sspa_zscore scores depend on the data being transformed unless reference statistics are "
+                         "accumulated with partial_fit; only models fitted with partial_fit can be saved")
+    return pack_zscore(model.pathways, model.feature_names_in_, model.mean_, model.var_, model.min_entity,
+                       n_samples_fit=int(model.n_samples_seen_.max(initial=0)),
+                       dtype=getattr(model, "dtype_", np.dtype(np.float64)).name)
+
+
+def pack_zscore(pathways, columns, mean, var, min_entity, n_samples_fit=None, dtype="float64"):
+    """
+    Pack z-score pathway scoring against per-entity statistics as a linear model:
+    sum((x - mean) / std) / sqrt(k) = x @ (1 / (std * sqrt(k))) - sum(mean / std) / sqrt(k)
+    Args:
+        pathways (dict): pathway dictionary
+        columns (array-like): entity identifiers of the statistics
+        mean (array-like): per-entity means
+        var (array-like): per-entity (population) variances
+        min_entity (int): minimum number of pathway members among columns
+        n_samples_fit (int): number of samples the statistics were computed from
+        dtype (str): floating point type of the packed weights and offsets
+    Returns:
+        dict of array names and numpy arrays, see pack_linear
+    """
+    from sspa.utils import group_pathways
+    features = np.asarray(columns, dtype=object)
+    positions = {k: p for p, ids in group_pathways(pathways, pd.Index(features), min_entity) for k in ids}
+    pathway_ids = [k for k in pathways if k in positions]
+    positions = [positions[k] for k in pathway_ids]
+    indptr = np.r_[0, np.cumsum([len(p) for p in positions], dtype=np.int64)]
+    col_idx = np.concatenate(positions).astype(np.int64) if positions else np.zeros(0, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(np.asarray(var, dtype=float))
+        scale = np.repeat(1 / np.sqrt(np.diff(indptr)), np.diff(indptr))
+        weight = scale / std[col_idx]
+        offset = np.add.reduceat(np.asarray(mean)[col_idx] * weight, indptr[:-1]) if len(col_idx) else np.zeros(0)
+    return pack_linear("sspa_zscore", features, pathway_ids, indptr, col_idx, weight, offset,
+                       min_entity=min_entity, random_state=None, n_samples_fit=n_samples_fit, dtype=dtype)
+
+
+def pack_linear(method, columns, pathway_ids, indptr, col_idx, weight, offset, **meta):
+    """
+    Pack the parameters of a linear model, scoring pathway i as X[:, cols] @ weight[i] - offset[i]
+    Args:
+        method (str): estimator class name
+        columns (array-like): training entity identifiers
+        pathway_ids (list): fitted pathway identifiers
+        indptr (array-like): row pointer of length len(pathway_ids) + 1
+        col_idx (array-like): position in columns of each weight
+        weight (list or array): weights, concatenated or one array per pathway
+        offset (array-like): offset of each pathway
+        **meta: stored with the model, e.g. min_entity, random_state, n_samples_fit and dtype, the floating point type
+            weights and offsets are stored and scores computed in (default float64)
+    Returns:
+        dict of array names and numpy arrays
+    """
+    if isinstance(weight, list):
+        weight = np.concatenate(weight) if weight else np.zeros(0)
+    meta = dict(meta, format_version=FORMAT_VERSION, method=method)
+    dtype = np.dtype(meta.get("dtype") or np.float64)
+    return {"columns": np.asarray(columns, dtype=object).astype(str),
+            "pathway_ids": np.asarray(pathway_ids, dtype=object).astype(str),
+            "indptr": np.asarray(indptr, dtype=np.int64), "col_idx": np.asarray(col_idx, dtype=np.int64),
+            "weight": np.asarray(weight, dtype=dtype), "offset": np.asarray(offset, dtype=dtype),
+            "meta": np.array(json.dumps(meta))}
+
+
+def save(model, path):
+    """
+    Save the inference parameters of a fitted model to an uncompressed .npz file
+    Args:
+        model: fitted sspa_SVD, sspa_KPCA or sspa_ssClustPA estimator, or sspa_zscore fitted with partial_fit
+        path (str): output file path
+    """
+    arrays = pack(model)
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _read_npz(path, mmap=True):
+    """
+    Read the arrays of an .npz file, memory-mapping the stored (uncompressed) members
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # skip the zip local file header to reach the .npy data
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if len(shape) == 0 or 0 in shape:
+                arrays[name] = np.lib.format.read_array(archive.open(info), allow_pickle=False)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+class PackedModel:
+    """
+    Inference parameters of a fitted model in packed form, see the module documentation for the layout
+    Args:
+        arrays (dict): packed arrays, as returned by pack
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.meta = json.loads(str(arrays["meta"]))
+        self.method = self.meta["method"]
+        # models saved before dtype was recorded are float64
+        self.dtype = np.dtype(self.meta.get("dtype") or np.float64)
+        self.columns = arrays["columns"]
+        self.pathway_ids = arrays["pathway_ids"].tolist()
+        self.indptr = np.asarray(arrays["indptr"])
+        self.col_idx = np.asarray(arrays["col_idx"])
+        self._weights = None
+        self._used = np.unique(self.col_idx)
+        self._aligned = None
+
+    def pathway_columns(self):
+        """
+        Returns:
+            dict of pathway identifiers (keys) and the training columns each pathway uses (values)
+        """
+        names = self.columns[self.col_idx].tolist()
+        return {k: names[self.indptr[n]:self.indptr[n + 1]] for n, k in enumerate(self.pathway_ids)}
+
+    def sizes(self):
+        return dict(zip(self.pathway_ids, np.diff(self.indptr).tolist()))
+
+    def _weight_matrix(self):
+        # columns x pathways sparse matrix of the linear weights
+        if self._weights is None:
+            import scipy.sparse as sp
+            rows = np.repeat(np.arange(len(self.pathway_ids)), np.diff(self.indptr))
+            self._weights = sp.csc_matrix((np.asarray(self.arrays["weight"]), (self.col_idx, rows)),
+                                          shape=(len(self.columns), len(self.pathway_ids)))
+        return self._weights
+
+    def transform(self, X, values=None):
+        """
+        Score samples with the packed model. Linear models score sparse data (see sspa.utils.sparse_values) without
+        densifying it; pathways with a non-finite weight, e.g. from an entity with zero variance, score NaN.
+        Args:
+            X (pd.DataFrame): omics data matrix containing (at least) the training columns used by the model
+            values (scipy.sparse matrix): sparse matrix of X if already converted (linear models)
+        Returns:
+            pandas DataFrame of pathway scores. Columns represent pathways and rows represent samples.
+        """
+        import scipy.sparse as sp
+        from sspa.utils import sparse_values
+
+        positions = self._align(X.columns)
+        if values is None and self.method in _LINEAR:
+            values = sparse_values(X)
+        values = X.to_numpy(dtype=self.dtype) if values is None else values.astype(self.dtype, copy=False)
+
+        self.plan_ = memory.plan(self.method, "transform", X, self.sizes(), sizes=self.sizes(),
+                                 n_train=self.meta["n_samples_fit"], itemsize=self.dtype.itemsize)
+        with self.plan_.measure(), instrumentation.span("transform", method=self.method, n_samples=X.shape[0],
+                                                        n_features=X.shape[1], packed=True):
+            if self.method in _LINEAR and sp.issparse(values):
+                scores = self._sparse_scores(values, positions)
+            elif self.method in _LINEAR:
+                present = positions >= 0
+                if present.all():
+                    weights = self._weight_matrix()
+                else:
+                    weights = self._weight_matrix()[present]
+                    positions = positions[present]
+                scores = (weights.T @ values[:, positions].T).T - np.asarray(self.arrays["offset"])
+            else:
+                scores = np.vstack([self._kpca_scores(values[rows], positions) for rows in self.plan_.sample_blocks()])
+        return pd.DataFrame(scores, index=X.index, columns=self.pathway_ids)
+
+    def _sparse_scores(self, values, positions, block_size=256):
+        # weights are indexed by the columns of X rather than X sliced to the training columns, and the sparse
+        # product is densified one block of pathways at a time to bound its intermediate size
+        import scipy.sparse as sp
+
+        n_pathways = len(self.pathway_ids)
+        rows = np.repeat(np.arange(n_pathways), np.diff(self.indptr))
+        weights = sp.csc_matrix((np.asarray(self.arrays["weight"]), (positions[self.col_idx], rows)),
+                                shape=(values.shape[1], n_pathways))
+        scores = np.empty((values.shape[0], n_pathways), dtype=self.dtype)
+        for start in range(0, n_pathways, block_size):
+            block = slice(start, start + block_size)
+            scores[:, block] = (values @ weights[:, block]).toarray()
+        scores -= np.asarray(self.arrays["offset"])
+        scores[:, self._nonfinite()] = np.nan
+        return scores
+
+    def _nonfinite(self):
+        # pathways with a non-finite weight; implicit zeros of sparse data would skip their products
+        weight = np.asarray(self.arrays["weight"])
+        rows = np.repeat(np.arange(len(self.pathway_ids)), np.diff(self.indptr))
+        return np.bincount(rows[~np.isfinite(weight)], minlength=len(self.pathway_ids)) > 0
+
+    def _align(self, columns):
+        # positions of the training columns in X, cached for repeated calls with the same columns (e.g. serving)
+        if self._aligned is not None and (self._aligned[0] is columns or self._aligned[0].equals(columns)):
+            return self._aligned[1]
+        positions = columns.get_indexer(self.columns)
+        if (positions[self._used] < 0).any():
+            missing = self.columns[self._used[positions[self._used] < 0]]
+            raise ValueError("X is missing %d entities used by the fitted model, e.g. %s" % (len(missing), missing[0]))
+        self._aligned = (columns, positions)
+        return positions
+
+    def _kpca_scores(self, values, positions):
+        from sklearn.metrics.pairwise import rbf_kernel
+
+        X_fit, alpha = self.arrays["X_fit"], self.arrays["alpha"]
+        K_fit_rows, K_fit_all, gamma = self.arrays["K_fit_rows"], self.arrays["K_fit_all"], self.arrays["gamma"]
+
+        def score_pathway(n):
+            start, stop = self.indptr[n], self.indptr[n + 1]
+            with instrumentation.span("transform_pathway", method=self.method, pathway=self.pathway_ids[n],
+                                      n_samples=values.shape[0], n_entities=int(stop - start)):
+                K = rbf_kernel(values[:, positions[self.col_idx[start:stop]]], X_fit[:, start:stop], gamma=gamma[n])
+                K_pred_cols = (np.sum(K, axis=1) / K.shape[1])[:, None]
+                K -= K_fit_rows[n]
+                K -= K_pred_cols
+                K += K_fit_all[n]
+                return K @ alpha[n]
+
+        scores = self.plan_.map(score_pathway, range(len(self.pathway_ids)))
+        return np.column_stack(scores) if scores else np.zeros((values.shape[0], 0))
+
+
+def load(path, mmap=True, cls=None):
+    """
+    Load a model saved with save
+    Args:
+        path (str): path of the saved model
+        mmap (bool): memory-map the parameter arrays instead of reading them into memory
+        cls (type): expected estimator class, default is the class the model was saved from
+    Returns:
+        estimator with the fitted pathways and a packed_ model used by transform
+    """
+    import sspa
+
+    packed = PackedModel(_read_npz(path, mmap=mmap))
+    if cls is None:
+        cls = getattr(sspa, packed.method)
+    elif cls.__name__ != packed.method:
+        raise TypeError("%s contains a %s model, not %s" % (path, packed.method, cls.__name__))
+
+    model = cls.__new__(cls)
+    model.pathway_df = None
+    model.min_entity = packed.meta["min_entity"]
+    model.random_state = packed.meta["random_state"]
+    model.keep_X = False
+    model.X_ = None
+    model.y_ = None
+    model.pathways = model.pathways_filt = packed.pathway_columns()
+    model.pathway_ids = list(packed.pathway_ids)
+    model.fitted_models = []
+    model.feature_names_in_ = packed.columns.astype(object)
+    model.n_samples_fit_ = packed.meta["n_samples_fit"]
+    model.dtype = packed.dtype.name
+    model.dtype_ = packed.dtype
+    model.packed_ = packed
+    model.is_fitted_ = True
+    if packed.method != "sspa_KPCA":
+        # packed parameters propagate missing values
+        model.nan_policy = "propagate"
+    if packed.method in ("sspa_SVD", "sspa_KPCA", "sspa_ssClustPA"):
+        model.warm_start = False
+    if packed.method == "sspa_zscore":
+        model.mean_ = model.var_ = model.n_samples_seen_ = None
+    if packed.method == "sspa_SVD":
+        from sspa.sspa_svd import MolecularImportance
+        model.molecular_importance = MolecularImportance(model.feature_names_in_, model.pathway_ids, packed.indptr,
+                                                         packed.col_idx, packed.arrays["weight"])
+    return model
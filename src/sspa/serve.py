@@ -0,0 +1,376 @@
+"""
+Local HTTP scoring service for fitted sspa models (asyncio, standard library only).
+
+Models and their pathways are loaded once at start-up. Concurrent requests for the same model are collected into
+micro-batches, so a single vectorised transform scores all queued samples (up to max_batch). Scoring runs on one
+worker thread so the event loop keeps queueing requests while a batch is scored: under load, batches grow to the
+number of requests that arrived during the previous batch, and a lone request is scored without waiting. Setting
+max_wait holds each batch open for that many seconds to collect more requests instead.
+
+Endpoints:
+    POST /score/<model>     JSON body, either one sample {"sample": {"entity": value, ...}, "id": "S1"} or several
+                            {"samples": {"S1": {"entity": value, ...}, ...}}, or values in the order of the model
+                            entities {"values": [...], "id": "S1"} (fastest to parse)
+                            returns {"index": [...], "columns": [pathways], "data": [[scores], ...]}
+    GET /models             loaded models with their method, number of pathways and entities
+    GET /models/<model>     the same for one model, with the ordered entity identifiers
+    GET /metrics            request counts, throughput, latency percentiles (ms) and micro-batch sizes
+    GET /health             {"status": "ok"}
+
+Example:
+    sspa serve --model svd=svd.npz --model zscore=zscore.npz --port 8000
+
+    server = sspa.serve.ScoringServer({"svd": sspa.sspa_SVD.load("svd.npz")})
+    asyncio.run(server.serve_forever())
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sspa import utils
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """
+    Invalid request, answered with status 400 (or the given status)
+    """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Metrics:
+    """
+    Latency and throughput of the requests to one model
+    Args:
+        window (int): number of most recent requests used for latency percentiles
+    """
+    def __init__(self, window=10000):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.samples = 0
+        self.errors = 0
+        self.batches = 0
+        self.latency = deque(maxlen=window)
+        self.batch_time = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def record_request(self, samples, seconds):
+        self.requests += 1
+        self.samples += samples
+        self.latency.append(seconds)
+
+    def record_batch(self, samples, seconds):
+        self.batches += 1
+        self.batch_sizes.append(samples)
+        self.batch_time.append(seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict of request, sample and error counts, throughput (samples/s since start), latency percentiles in
+            milliseconds and the mean and maximum micro-batch size
+        """
+        uptime = time.perf_counter() - self.started
+
+        def percentiles(values):
+            if not values:
+                return {}
+            ms = np.asarray(values) * 1000
+            return {"p50": float(np.percentile(ms, 50)), "p90": float(np.percentile(ms, 90)),
+                    "p99": float(np.percentile(ms, 99)), "max": float(ms.max())}
+
+        return {"requests": self.requests, "samples": self.samples, "errors": self.errors, "batches": self.batches,
+                "uptime_s": uptime, "throughput_samples_s": self.samples / uptime if uptime else 0.0,
+                "latency_ms": percentiles(self.latency), "batch_ms": percentiles(self.batch_time),
+                "batch_size": {"mean": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                               "max": int(max(self.batch_sizes, default=0))}}
+
+
+class ModelEndpoint:
+    """
+    A fitted model with its micro-batching queue
+    Args:
+        name (str): model name used in the URL
+        model: fitted sspa estimator with feature_names_in_ (e.g. loaded with sspa_SVD.load)
+        executor (ThreadPoolExecutor): executor scoring the batches
+        max_batch (int): maximum number of samples scored in one transform
+        max_wait (float): seconds to wait for more requests after the first one of a batch arrives, default is to
+            score whatever is queued
+    """
+    def __init__(self, name, model, executor, max_batch=64, max_wait=0.0):
+        if getattr(model, "feature_names_in_", None) is None:
+            raise ValueError("Model %r does not record its training entities" % name)
+        if type(model).__name__ == "sspa_zscore" and getattr(model, "packed_", None) is None \
+                and getattr(model, "mean_", None) is None:
+            raise ValueError("Model %r: single-sample z-scores need reference statistics, fit it with partial_fit"
+                             % name)
+        self.name = name
+        self.model = model
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = Metrics()
+        self.columns = np.asarray(model.feature_names_in_, dtype=object)
+        # one Index object for all batches, so the model's column alignment is computed once
+        self.index = pd.Index(self.columns)
+        self._positions = {c: n for n, c in enumerate(self.columns.tolist())}
+        # entities the scored pathways use, which every request must provide
+        groups = utils.group_pathways(model.pathways, self.index, getattr(model, "min_entity", 0))
+        self.required = np.unique(np.concatenate([positions for positions, _ in groups])) if groups \
+            else np.zeros(0, dtype=np.int64)
+        self.queue = None
+        self._task = None
+
+    def describe(self):
+        return {"name": self.name, "method": type(self.model).__name__,
+                "pathways": len(self.model.pathway_ids) if getattr(self.model, "pathway_ids", None) else
+                len(self.model.pathways_filt), "entities": len(self.columns)}
+
+    def vector(self, sample):
+        """
+        Convert a {entity: value} mapping, or a list of values in the order of the training entities, to a vector
+        """
+        if isinstance(sample, list):
+            if len(sample) != len(self.columns):
+                raise RequestError("Expected %d values for model %r, got %d" % (len(self.columns), self.name, len(sample)))
+            x = np.array(sample, dtype=float)
+        elif isinstance(sample, dict):
+            x = np.full(len(self.columns), np.nan)
+            positions = self._positions
+            for entity, value in sample.items():
+                n = positions.get(entity)
+                if n is not None:
+                    x[n] = np.nan if value is None else value
+        else:
+            raise RequestError("Each sample must be an object of entity identifiers and values")
+        missing = self.required[np.isnan(x[self.required])]
+        if len(missing):
+            raise RequestError("Sample is missing %d entities used by model %r, e.g. %s"
+                               % (len(missing), self.name, self.columns[missing[0]]))
+        return x
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, ids, vectors):
+        """
+        Queue samples for the next micro-batch
+        Returns:
+            (pathway identifiers, list of score arrays, one per sample)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((ids, vectors, future))
+        return await future
+
+    def _transform(self, ids, values):
+        start = time.perf_counter()
+        scores = self.model.transform(pd.DataFrame(values, index=ids, columns=self.index))
+        self.metrics.record_batch(len(ids), time.perf_counter() - start)
+        return scores.columns.tolist(), scores.to_numpy()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                if self.queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0 and self.max_wait <= 0:
+                        # let requests already read by the event loop join the batch
+                        await asyncio.sleep(0)
+                        if not self.queue.empty():
+                            continue
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self.queue.get_nowait()
+                batch.append(item)
+                size += len(item[0])
+
+            ids = [i for item in batch for i in item[0]]
+            values = np.vstack([v for item in batch for v in item[1]])
+            try:
+                pathways, scores = await loop.run_in_executor(self.executor, self._transform, ids, values)
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            start = 0
+            for item_ids, _, future in batch:
+                if not future.done():
+                    future.set_result((pathways, scores[start:start + len(item_ids)]))
+                start += len(item_ids)
+
+
+class ScoringServer:
+    """
+    asyncio HTTP server scoring samples with preloaded models
+    Args:
+        models (dict): model names (keys) and fitted estimators or paths of models saved with save (values)
+        host (str): interface to listen on, default is the local machine only
+        port (int): port to listen on, 0 to pick a free port
+        max_batch (int): maximum number of samples scored in one transform
+        max_wait (float): seconds to wait for more requests after the first request of a batch
+    """
+    def __init__(self, models, host="127.0.0.1", port=8000, max_batch=64, max_wait=0.0):
+        from sspa import serialization
+
+        self.host = host
+        self.port = port
+        # a single scoring thread: batches run one at a time while the event loop queues new requests
+        self.executor = ThreadPoolExecutor(1)
+        self.endpoints = {}
+        for name, model in models.items():
+            if isinstance(model, str):
+                model = serialization.load(model)
+            self.endpoints[name] = ModelEndpoint(name, model, self.executor, max_batch, max_wait)
+        self._server = None
+
+    async def start(self):
+        """
+        Start listening; the bound port is available as self.port afterwards
+        """
+        for endpoint in self.endpoints.values():
+            endpoint.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for endpoint in self.endpoints.values():
+            await endpoint.stop()
+        self.executor.shutdown(wait=False)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                parts = request_line.decode("latin-1").split()
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # the body cannot be told apart from the next request, so the connection is closed
+                    status, payload = 400, {"error": "Invalid Content-Length %r" % headers["content-length"]}
+                    close = True
+                else:
+                    body = await reader.readexactly(length)
+                    if len(parts) < 2:
+                        break
+                    status, payload = await self._dispatch(parts[0], parts[1], body)
+                    close = headers.get("connection", "").lower() == "close"
+                data = json.dumps(payload).encode()
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n"
+                             % (status, _REASONS[status].encode(), len(data),
+                                b"Connection: close\r\n" if close else b"") + data)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        path = path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/models":
+            return 200, {"models": [e.describe() for e in self.endpoints.values()]}
+        if path.startswith("/models/") and path[len("/models/"):] in self.endpoints:
+            endpoint = self.endpoints[path[len("/models/"):]]
+            return 200, dict(endpoint.describe(), columns=endpoint.columns.tolist())
+        if path == "/metrics":
+            return 200, {name: e.metrics.snapshot() for name, e in self.endpoints.items()}
+        if not path.startswith("/score/"):
+            return 404, {"error": "Unknown path %s" % path}
+        endpoint = self.endpoints.get(path[len("/score/"):])
+        if endpoint is None:
+            return 404, {"error": "Unknown model %s" % path[len("/score/"):]}
+        if method != "POST":
+            return 405, {"error": "Use POST to score samples"}
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body or b"{}")
+            if "values" in request:
+                ids, samples = [str(request.get("id", "sample"))], [request["values"]]
+            elif "sample" in request:
+                ids, samples = [str(request.get("id", "sample"))], [request["sample"]]
+            elif isinstance(request.get("samples"), dict):
+                ids, samples = list(request["samples"]), list(request["samples"].values())
+            else:
+                raise RequestError('Expected a JSON object with "sample" or "samples"')
+            vectors = [endpoint.vector(sample) for sample in samples]
+            if not vectors:
+                raise RequestError("No samples to score")
+            pathways, scores = await endpoint.score(ids, vectors)
+        except (RequestError, ValueError, TypeError) as error:
+            endpoint.metrics.errors += 1
+            return getattr(error, "status", 400), {"error": str(error)}
+        except Exception as error:
+            endpoint.metrics.errors += 1
+            return 500, {"error": "%s: %s" % (type(error).__name__, error)}
+        endpoint.metrics.record_request(len(ids), time.perf_counter() - start)
+        scores = np.where(np.isfinite(scores), scores, None).tolist()
+        return 200, {"index": ids, "columns": pathways, "data": scores}
+
+
+def serve(models, host="127.0.0.1", port=8000, max_batch=64, max_wait=0.0):
+    """
+    Run a scoring server until interrupted
+    Args:
+        models (dict): model names (keys) and fitted estimators or paths of saved models (values)
+        host (str): interface to listen on
+        port (int): port to listen on
+        max_batch (int): maximum number of samples scored in one transform
+        max_wait (float): seconds to wait for more requests after the first request of a batch
+    """
+    server = ScoringServer(models, host, port, max_batch, max_wait)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
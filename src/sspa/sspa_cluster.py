@@ -2,12 +2,15 @@ import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
 import sspa.utils as utils
+from sspa import fit_cache, instrumentation, memory, serialization
+from sspa.config import resolve_dtype
 from sklearn.utils.validation import check_is_fitted
 from sklearn.base import BaseEstimator
 
 class sspa_ssClustPA(BaseEstimator):
     """
-    K-means based clustering method for single sample pathway analysis
+    K-means based clustering method for single sample pathway analysis. With sparse input (see
+    sspa.utils.sparse_values) k-means and the projections run on sparse pathway submatrices.
 
     Args:
         mat (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
@@ -15,12 +18,22 @@ class sspa_ssClustPA(BaseEstimator):
         pathways (pd.DataFrame): Dictionary of pathway identifiers (keys) and corresponding list of pathway entities (values).
         Entity identifiers must match those in the matrix columns
         min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
+        keep_X (bool): keep the training matrix as X_ after fitting. Set to False to reduce the memory held by fitted models
+        dtype (str): 'float32' or 'float64', floating point type of the fitted models and scores. Default is the dtype set
+        with sspa.set_config, float64 if none is set
+        nan_policy (str): 'propagate' (default) or 'omit'. With 'omit', missing values are imputed from the centroid of
+        their cluster while fitting (k-means EM) and from the centroid nearest on the observed entities when scoring
+        warm_start (bool): when refitting, start the k-means of each pathway from its previous centroids rather than
+        from a k-means++ initialisation, which also keeps the order of the two clusters (the sign of the scores).
+        Pathways whose aligned column set changed are fitted from scratch, as are all pathways if the previous fit
+        scores through packed parameters. Warm started fits are not read from or stored in the fit cache
 
     Returns:
         pandas DataFrame of pathway scores derived using the ssClustPA/(proj) method. Columns represent pathways and rows represent samples.
     """
 
-    def __init__(self, pathway_df, min_entity=2, random_state=0):
+    def __init__(self, pathway_df, min_entity=2, random_state=0, keep_X=True, dtype=None, nan_policy="propagate",
+                 warm_start=False):
         self.pathway_df = pathway_df
         self.min_entity = min_entity
         self.pathways = utils.pathwaydf_to_dict(pathway_df)
@@ -28,7 +41,12 @@ class sspa_ssClustPA(BaseEstimator):
         self.fitted_models = []
         self.pathway_ids = []
         self.random_state = random_state
+        self.keep_X = keep_X
+        self.dtype = dtype
+        self.nan_policy = nan_policy
+        self.warm_start = warm_start
 
+    @fit_cache.cached
     def fit(self, X, y=None):
         """
         Fit the model with X.
@@ -40,19 +58,88 @@ class sspa_ssClustPA(BaseEstimator):
             self : object
         """
 
-        self.X_ = X
+        utils.check_nan_policy(self.nan_policy)
+        # models of the previous fit, read before the fitted state is reset
+        previous = utils.previous_fit(self) if self.warm_start else {}
+        self.X_ = X if self.keep_X else None
         self.y_ = y
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_samples_fit_ = X.shape[0]
+        self.dtype_ = resolve_dtype(self.dtype)
+        self.packed_ = None
 
-        for pathway, compounds in self.pathways.items():
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            if single_pathway_matrix.shape[1] >= self.min_entity:
+        # pathways with identical aligned column sets are fitted once
+        groups = utils.group_pathways(self.pathways, X.columns, self.min_entity)
+        self.dedup_report_ = utils.dedup_report(groups)
+        # k-means runs on sparse pathway submatrices of sparse data
+        sparse = utils.sparse_values(X)
+
+        def fit_pathway(group):
+            positions, pathways = group
+            model, order = utils.warm_start_model(previous, X.columns[positions], pathways)
+            init = None if model is None else model.cluster_centers_[:, order]
+            with instrumentation.span("fit_pathway", method="sspa_ssClustPA", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=X.shape[0], n_entities=len(positions), warm_start=model is not None):
+                if sparse is None:
+                    return self._fit_pathway(X.iloc[:, positions].to_numpy(dtype=self.dtype_), init=init)
+                return self._fit_pathway(sparse[:, positions].tocsr().astype(self.dtype_), init=init)
+
+        plan = memory.plan("sspa_ssClustPA", "fit", X, {ids[0]: self.pathways[ids[0]] for _, ids in groups},
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("fit", method="sspa_ssClustPA", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            models = plan.map(fit_pathway, groups)
+        self._set_fitted(groups, models)
+        return self
+
+    def _fit_pathway(self, values, max_iter=100, init=None):
+        if init is None:
+            kmeans = KMeans(n_clusters=2, random_state=self.random_state, n_init='auto')
+        else:
+            kmeans = KMeans(n_clusters=2, random_state=self.random_state, init=init, n_init=1)
+        missing = utils.missing_mask(values, self.nan_policy)
+        if missing is None:
+            return kmeans.fit(values)
+
+        # missing values start from the entity means and are replaced by the centroid of their cluster, k-means
+        # restarting from the previous centroids until the clusters are stable
+        observed = ~missing
+        means = np.where(missing, 0, values).sum(axis=0) / np.maximum(observed.sum(axis=0), 1)
+        values = np.where(missing, means.astype(values.dtype), values)
+        labels = None
+        for _ in range(max_iter):
+            kmeans.fit(values)
+            values[missing] = kmeans.cluster_centers_[kmeans.labels_][missing]
+            if labels is not None and np.array_equal(labels, kmeans.labels_):
+                break
+            labels = kmeans.labels_
+            kmeans = KMeans(n_clusters=2, random_state=self.random_state, init=kmeans.cluster_centers_, n_init=1)
+        return kmeans
+
+    def _score_pathway(self, model, values):
+        # projection onto the unit vector between the two cluster centroids
+        vec = model.cluster_centers_[0] - model.cluster_centers_[1]
+        unit_vec = vec / np.linalg.norm(vec)
+        missing = utils.missing_mask(values, self.nan_policy)
+        if missing is not None:
+            # missing values are taken from the centroid nearest on the observed entities
+            distances = np.stack([(np.where(missing, 0, values - centre) ** 2).sum(axis=1)
+                                  for centre in model.cluster_centers_])
+            values = np.where(missing, model.cluster_centers_[np.argmin(distances, axis=0)], values)
+        return values @ unit_vec
+
+    def _set_fitted(self, groups, models):
+        # fitted models of unique column sets, as returned by group_pathways, shared by their pathways
+        fitted = {k: model for (_, pathways), model in zip(groups, models) for k in pathways}
+        self.pathway_ids, self.fitted_models = [], []
+        for pathway in self.pathways:
+            if pathway in fitted:
                 self.pathway_ids.append(pathway)
-                kmeans = KMeans(n_clusters=2, random_state=self.random_state, n_init='auto')
-                self.fitted_models.append(kmeans.fit(single_pathway_matrix.to_numpy()))
+                self.fitted_models.append(fitted[pathway])
 
         self.pathways_filt = {k: v for k, v in self.pathways.items() if k in self.pathway_ids}
         self.is_fitted_ = True
-        return self
     
     def transform(self, X, y=None):
         """
@@ -66,19 +153,70 @@ class sspa_ssClustPA(BaseEstimator):
         """
         check_is_fitted(self, 'is_fitted_')
 
-        scores = []
-        for n, compounds in enumerate(self.pathways_filt.values()):
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            centroids1 = self.fitted_models[n].cluster_centers_[0]
-            centroids2 = self.fitted_models[n].cluster_centers_[1]
-            vec = centroids1 - centroids2
-            unit_vec = vec / np.linalg.norm(vec)
-            proj_data = unit_vec.dot(single_pathway_matrix.T)
-            scores.append(proj_data)
+        if getattr(self, "packed_", None) is not None:
+            scores_df = self.packed_.transform(X)
+            self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=self.packed_.plan_)
+            return scores_df
 
-        scores_df = pd.DataFrame(scores, columns=X.index, index=self.pathway_ids).T
+        # pathways sharing a fitted model and aligned column set are scored once
+        dtype = getattr(self, "dtype_", np.dtype(np.float64))
+        models = dict(zip(self.pathway_ids, self.fitted_models))
+        groups = utils.group_pathways(self.pathways_filt, X.columns, tags={k: id(m) for k, m in models.items()})
+        plan = memory.plan("sspa_ssClustPA", "transform", X, self.pathways_filt,
+                           itemsize=dtype.itemsize)
+        self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=plan)
+        # sparse data is sliced into sparse sample blocks and pathway submatrices
+        sparse = utils.sparse_values(X)
+        blocks = []
+        with plan.measure(), instrumentation.span("transform", method="sspa_ssClustPA", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            for rows in plan.sample_blocks():
+                if sparse is None:
+                    X_block = X.iloc[rows]
+                else:
+                    X_block = sparse[rows] if plan.sample_block < plan.n_samples else sparse
+
+                def transform_pathway(group):
+                    positions, pathways = group
+                    with instrumentation.span("transform_pathway", method="sspa_ssClustPA", pathway=pathways[0], n_pathways=len(pathways),
+                                              n_samples=X_block.shape[0], n_entities=len(positions)):
+                        if sparse is None:
+                            single_pathway_matrix = X_block.iloc[:, positions].to_numpy(dtype=dtype)
+                        else:
+                            single_pathway_matrix = X_block[:, positions].astype(dtype)
+                        return self._score_pathway(models[pathways[0]], single_pathway_matrix)
+
+                blocks.append(plan.map(transform_pathway, groups))
+        group_scores = [np.concatenate(pathway_scores) for pathway_scores in zip(*blocks)]
+        scores = {k: v for (_, pathways), v in zip(groups, group_scores) for k in pathways}
+        scores = [scores[k] for k in self.pathway_ids]
+        scores_df = utils.scores_frame(scores, X.index, self.pathway_ids)
         return scores_df
     
+    def save(self, path):
+        """
+        Save the parameters needed to transform new data to an uncompressed .npz file.
+        See sspa.serialization for the format.
+
+        Args:
+            path (str): output file path
+        """
+        check_is_fitted(self, 'is_fitted_')
+        serialization.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model saved with save. The loaded model can transform new data but not be refitted.
+
+        Args:
+            path (str): path of the saved model
+            mmap (bool): memory-map the parameter arrays instead of reading them into memory
+            Returns:
+            fitted sspa_ssClustPA
+        """
+        return serialization.load(path, mmap=mmap, cls=cls)
+
     def fit_transform(self, X, y=None):
         """
         Fit the model with X and transform X.
@@ -24,7 +24,7 @@ def sspa_fgsea(mat, metadata, pathway_df, min_entity=2):
     pathway_names = pathway_df["Pathway_name"].to_dict()
     pathways = utils.pathwaydf_to_dict(pathway_df)
     compounds_present = mat.columns.tolist()
-    pathways = {k: v for k, v in pathways.items() if len([i for i in compounds_present if i in v]) >= min_entity}
+    pathways = utils.filter_pathways(pathways, compounds_present, min_entity)
 
     # Get rankings - SNR
     mat['Target'] = pd.factorize(metadata)[0]
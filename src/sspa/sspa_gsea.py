@@ -1,9 +1,9 @@
 import numpy as np
 import pandas as pd
 import sspa.utils as utils
-import gseapy
+from sspa import instrumentation, memory, pathway_set
 
-def sspa_gsea(mat, metadata, pathway_df, ranking_metric='signal_to_noise', min_entity=2):
+def sspa_gsea(mat, metadata, pathway_df, ranking_metric='signal_to_noise', min_entity=2, collapse_redundant=None):
     """Run GSEA using gseapy package by zqfang (https://github.com/zqfang/GSEApy)
 
     Args:
@@ -13,21 +13,30 @@ def sspa_gsea(mat, metadata, pathway_df, ranking_metric='signal_to_noise', min_e
         ranking_metric (str): Ranking metric for molecules in GSEA. Default is signal-to-noise ratio. 
             Other options are 't_test' and see GSEApy package https://github.com/zqfang/GSEApy/blob/2b5419e14615b6fd19a575ff065256dc7099bbec/gseapy/gsea.py#L135 for more options. 
         min_entity (int, optional): minimum number of molecules mapping to pathways for GSEA to be performed. Defaults to 2.
+        collapse_redundant (float, optional): if set, significant pathways (FDR <= 0.25) whose overlap coefficient with a more
+            significant pathway is at least this value are removed and listed in a Redundant_pathways column
+            (see sspa.pathway_set.collapse_redundant). Pathways are compared on the measured molecules only.
     """
+    import gseapy
     
     pathway_names = pathway_df["Pathway_name"].to_dict()
     pathways = utils.pathwaydf_to_dict(pathway_df)
     compounds_present = mat.columns.tolist()
-    pathways = {k: v for k, v in pathways.items() if len([i for i in compounds_present if i in v]) >= min_entity}
+    pathways = utils.filter_pathways(pathways, compounds_present, min_entity)
 
-    gsea_res = gseapy.gsea(data=mat.T, 
-                 gene_sets=pathways, 
-                 cls=metadata,
-                 min_size=min_entity,
-                 permutation_type='phenotype',
-                 permutation_num=1000, # reduce number to speed up test
-                 outdir=None,  # do not write output to disk
-                 method=ranking_metric)
+    # gseapy runs 4 threads by default
+    plan = memory.plan("sspa_gsea", "gsea", mat, pathways, permutations=1000, default_jobs=4)
+    with plan.measure(), instrumentation.span("backend", method="sspa_gsea", backend="gseapy.gsea",
+                                              n_samples=mat.shape[0], n_features=mat.shape[1], n_pathways=len(pathways)):
+        gsea_res = gseapy.gsea(data=mat.T, 
+                     gene_sets=pathways, 
+                     cls=metadata,
+                     min_size=min_entity,
+                     permutation_type='phenotype',
+                     permutation_num=1000, # reduce number to speed up test
+                     outdir=None,  # do not write output to disk
+                     method=ranking_metric,
+                     threads=plan.n_jobs)
 
     res_df = gsea_res.res2d
     res_df = res_df.rename(columns={'Term': 'Pathway_ID', 'NOM p-val': 'P-value', 'FDR q-val': 'P-adjust FDR', 'FWER p-val': 'P-adjust FWER',
@@ -35,5 +44,8 @@ def sspa_gsea(mat, metadata, pathway_df, ranking_metric='signal_to_noise', min_e
     res_df = res_df.drop(['Name'], axis=1)
     name_col = res_df['Pathway_ID'].map(pathway_names)
     res_df.insert(1, 'Pathway_name', name_col)
+    if collapse_redundant is not None:
+        res_df = pathway_set.collapse_redundant(res_df, pathway_df, threshold=collapse_redundant, id_col="Pathway_ID",
+                                                p_col="P-adjust FDR", alpha=0.25, entities=compounds_present)
 
     return res_df
\ No newline at end of file
@@ -27,7 +27,7 @@ def sspa_gsva(mat, pathway_df, min_entity=2):
 
     pathways = utils.pathwaydf_to_dict(pathway_df)
     compounds_present = mat.columns.tolist()
-    pathways = {k: v for k, v in pathways.items() if len([i for i in compounds_present if i in v]) >= min_entity}
+    pathways = utils.filter_pathways(pathways, compounds_present, min_entity)
 
     with localconverter(ro.default_converter + pandas2ri.converter):
         r_mat = ro.conversion.py2rpy(mat.T)
@@ -1,8 +1,10 @@
+import numpy as np
 import pandas as pd
 from sklearn.decomposition import KernelPCA
 import sspa.utils as utils
+from sspa import fit_cache, instrumentation, memory, serialization
+from sspa.config import resolve_dtype
 from sklearn.utils.validation import check_is_fitted
-from sklearn.utils.estimator_checks import check_estimator
 from sklearn.base import BaseEstimator
 
 class sspa_KPCA(BaseEstimator):
@@ -13,9 +15,16 @@ class sspa_KPCA(BaseEstimator):
         pathway_df (pd.DataFrame): pandas DataFrame of pathway identifiers (keys) and corresponding list of pathway entities (values).
         Entity identifiers must match those in the matrix columns
         min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
+        keep_X (bool): keep the training matrix as X_ after fitting. Set to False to reduce the memory held by fitted models
+        dtype (str): 'float32' or 'float64', floating point type of the fitted models and scores. Default is the dtype set
+        with sspa.set_config, float64 if none is set
+        warm_start (bool): when refitting, keep the previous model of pathways whose training submatrix (samples and
+        values of the aligned columns) is unchanged. The eigenvectors of kernel PCA are indexed by training samples and
+        have no starting point in a grown cohort, other pathways are fitted from scratch. Warm started fits are not
+        read from or stored in the fit cache
 
     """
-    def __init__(self, pathway_df, min_entity=2, random_state=0):
+    def __init__(self, pathway_df, min_entity=2, random_state=0, keep_X=True, dtype=None, warm_start=False):
         self.pathway_df = pathway_df
         self.min_entity = min_entity
         self.pathways = utils.pathwaydf_to_dict(pathway_df)
@@ -23,7 +32,11 @@ class sspa_KPCA(BaseEstimator):
         self.fitted_models = []
         self.pathway_ids = []
         self.random_state = random_state
+        self.keep_X = keep_X
+        self.dtype = dtype
+        self.warm_start = warm_start
 
+    @fit_cache.cached
     def fit(self, X, y=None):
         """
         Fit the model with X.
@@ -35,19 +48,56 @@ class sspa_KPCA(BaseEstimator):
             self : object
         """
 
-        self.X_ = X
+        # models of the previous fit, read before the fitted state is reset
+        previous = utils.previous_fit(self) if self.warm_start else {}
+        self.X_ = X if self.keep_X else None
         self.y_ = y
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_samples_fit_ = X.shape[0]
+        self.dtype_ = resolve_dtype(self.dtype)
+        self.packed_ = None
+
+        # pathways with identical aligned column sets are fitted once
+        groups = utils.group_pathways(self.pathways, X.columns, self.min_entity)
+        self.dedup_report_ = utils.dedup_report(groups)
+
+        def fit_pathway(group):
+            positions, pathways = group
+            model, order = utils.warm_start_model(previous, X.columns[positions], pathways)
+            with instrumentation.span("fit_pathway", method="sspa_KPCA", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=X.shape[0], n_entities=len(positions), warm_start=model is not None):
+                values = X.iloc[:, positions].to_numpy(dtype=self.dtype_)
+                if model is not None and model.X_fit_.dtype == values.dtype and np.array_equal(model.X_fit_[:, order], values):
+                    return model
+                return self._fit_pathway(values)
+
+        plan = memory.plan("sspa_KPCA", "fit", X, {ids[0]: self.pathways[ids[0]] for _, ids in groups},
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("fit", method="sspa_KPCA", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            models = plan.map(fit_pathway, groups)
+        self._set_fitted(groups, models)
+        return self
 
-        for pathway, compounds in self.pathways.items():
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            if single_pathway_matrix.shape[1] >= self.min_entity:
+    def _fit_pathway(self, values):
+        kpca = KernelPCA(n_components=2, kernel="rbf", random_state=self.random_state)
+        return kpca.fit(values)
+
+    def _score_pathway(self, model, values):
+        return model.transform(values)[:, 0]
+
+    def _set_fitted(self, groups, models):
+        # fitted models of unique column sets, as returned by group_pathways, shared by their pathways
+        fitted = {k: model for (_, pathways), model in zip(groups, models) for k in pathways}
+        self.pathway_ids, self.fitted_models = [], []
+        for pathway in self.pathways:
+            if pathway in fitted:
                 self.pathway_ids.append(pathway)
-                kpca = KernelPCA(n_components=2, kernel="rbf", random_state=self.random_state)
-                self.fitted_models.append(kpca.fit(single_pathway_matrix.to_numpy()))
+                self.fitted_models.append(fitted[pathway])
 
         self.pathways_filt = {k: v for k, v in self.pathways.items() if k in self.pathway_ids}
         self.is_fitted_ = True
-        return self
 
     def transform(self, X, y=None):
 
@@ -64,16 +114,64 @@ class sspa_KPCA(BaseEstimator):
         # Check if fit has been called
         check_is_fitted(self, 'is_fitted_')
 
+        if getattr(self, "packed_", None) is not None:
+            scores_df = self.packed_.transform(X)
+            self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=self.packed_.plan_)
+            return scores_df
+
         # For each fitted model, transform the data
-        scores = []
-        for n, compounds in enumerate(self.pathways_filt.values()):
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            new_data = self.fitted_models[n].transform(single_pathway_matrix.to_numpy())
-            scores.append(new_data[:, 0])
-        scores_df = pd.DataFrame(scores, columns=X.index, index=self.pathway_ids).T
+        # pathways sharing a fitted model and aligned column set are scored once
+        dtype = getattr(self, "dtype_", np.dtype(np.float64))
+        models = dict(zip(self.pathway_ids, self.fitted_models))
+        groups = utils.group_pathways(self.pathways_filt, X.columns, tags={k: id(m) for k, m in models.items()})
+        plan = memory.plan("sspa_KPCA", "transform", X, self.pathways_filt, n_train=self.n_samples_fit_,
+                           itemsize=dtype.itemsize)
+        self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=plan)
+        blocks = []
+        with plan.measure(), instrumentation.span("transform", method="sspa_KPCA", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            for rows in plan.sample_blocks():
+                X_block = X.iloc[rows]
+
+                def transform_pathway(group):
+                    positions, pathways = group
+                    with instrumentation.span("transform_pathway", method="sspa_KPCA", pathway=pathways[0], n_pathways=len(pathways),
+                                              n_samples=X_block.shape[0], n_entities=len(positions)):
+                        single_pathway_matrix = X_block.iloc[:, positions]
+                        return self._score_pathway(models[pathways[0]], single_pathway_matrix.to_numpy(dtype=dtype))
+
+                blocks.append(plan.map(transform_pathway, groups))
+        group_scores = [np.concatenate(pathway_scores) for pathway_scores in zip(*blocks)]
+        scores = {k: v for (_, pathways), v in zip(groups, group_scores) for k in pathways}
+        scores = [scores[k] for k in self.pathway_ids]
+        scores_df = utils.scores_frame(scores, X.index, self.pathway_ids)
 
         return scores_df
     
+    def save(self, path):
+        """
+        Save the parameters needed to transform new data to an uncompressed .npz file.
+        See sspa.serialization for the format.
+
+        Args:
+            path (str): output file path
+        """
+        check_is_fitted(self, 'is_fitted_')
+        serialization.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model saved with save. The loaded model can transform new data but not be refitted.
+
+        Args:
+            path (str): path of the saved model
+            mmap (bool): memory-map the parameter arrays instead of reading them into memory
+            Returns:
+            fitted sspa_KPCA
+        """
+        return serialization.load(path, mmap=mmap, cls=cls)
+
     def fit_transform(self, X, y=None):
         """
         Fit the model with X and transform X.
@@ -84,10 +182,7 @@ class sspa_KPCA(BaseEstimator):
             Returns: 
             pandas DataFrame of pathway scores derived using the kPCA method. Columns represent pathways and rows represent samples.
         """
-        self.X_ = X
-        self.y_ = y
-
-        self.fit(X)
+        self.fit(X, y)
         return self.transform(X)
 
     def fit_transform_(self, X, y=None):
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+import sspa.utils as utils
+from sspa import instrumentation, memory
+from sspa.config import resolve_dtype
+from sspa.sspa_zscore import sspa_zscore
+from sspa.sspa_svd import sspa_SVD
+from sspa.sspa_cluster import sspa_ssClustPA
+from sspa.sspa_kpca import sspa_KPCA
+from sklearn.utils.validation import check_is_fitted
+from sklearn.base import BaseEstimator
+
+METHODS = {"zscore": sspa_zscore, "svd": sspa_SVD, "cluster": sspa_ssClustPA, "kpca": sspa_KPCA}
+# most to least expensive, the first requested method sets the memory plan
+_PLAN_ORDER = ["kpca", "cluster", "svd", "zscore"]
+
+
+class sspa_multi(BaseEstimator):
+    """
+    Score pathways with several ssPA methods in a single pass over the data.
+
+    Pathways are aligned to the data columns once, each unique pathway submatrix is extracted once and every
+    requested method is fitted and scored on the same slice. z-scores are standardised once for the whole matrix
+    rather than once per pathway. Scores match those of the individual estimators.
+
+    Args:
+        pathway_df (pd.DataFrame): pandas DataFrame of pathway identifiers (keys) and corresponding list of pathway entities (values).
+        Entity identifiers must match those in the matrix columns
+        methods (list): methods to run, any of 'zscore', 'svd', 'cluster' (ssClustPA) and 'kpca'. Default is all four
+        min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
+        random_state (int): random state of the SVD, ssClustPA and kPCA models
+        keep_X (bool): keep the training matrix as X_ after fitting. Set to False to reduce the memory held by fitted models
+        dtype (str): 'float32' or 'float64', floating point type of the fitted models and scores. Default is the dtype set
+        with sspa.set_config, float64 if none is set
+        nan_policy (str): 'propagate' (default) or 'omit', see the individual estimators. kPCA does not support missing
+        values
+
+    """
+    def __init__(self, pathway_df, methods=("zscore", "svd", "cluster", "kpca"), min_entity=2, random_state=0, keep_X=True,
+                 dtype=None, nan_policy="propagate"):
+        unknown = [m for m in methods if m not in METHODS]
+        if unknown:
+            raise ValueError("Unknown methods %s, expected any of %s" % (unknown, list(METHODS)))
+        self.pathway_df = pathway_df
+        self.methods = methods
+        self.min_entity = min_entity
+        self.random_state = random_state
+        self.keep_X = keep_X
+        self.dtype = dtype
+        self.nan_policy = nan_policy
+        self.pathways = utils.pathwaydf_to_dict(pathway_df)
+
+    def _new_estimators(self):
+        estimators = {}
+        for method in self.methods:
+            params = {"min_entity": self.min_entity, "dtype": self.dtype}
+            if method != "zscore":
+                params.update(random_state=self.random_state, keep_X=self.keep_X)
+            if method != "kpca":
+                params["nan_policy"] = self.nan_policy
+            estimator = METHODS[method](self.pathway_df, **params)
+            # share the pathway dictionary of this estimator
+            estimator.pathways = self.pathways
+            estimators[method] = estimator
+        return estimators
+
+    def _plan_method(self):
+        method = next(m for m in _PLAN_ORDER if m in self.methods)
+        return METHODS[method].__name__
+
+    def fit(self, X, y=None):
+        """
+        Fit the model of each method with X.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            self : object
+        """
+        utils.check_nan_policy(self.nan_policy)
+        self.X_ = X if self.keep_X else None
+        self.y_ = y
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_samples_fit_ = X.shape[0]
+        self.dtype_ = resolve_dtype(self.dtype)
+        self.estimators_ = self._new_estimators()
+        fitted = {m: e for m, e in self.estimators_.items() if m != "zscore"}
+
+        # pathways are selected and grouped into unique column sets once for all methods
+        self.groups_ = utils.group_pathways(self.pathways, X.columns, self.min_entity)
+        self.dedup_report_ = utils.dedup_report(self.groups_)
+        values = X.to_numpy(dtype=self.dtype_)
+
+        def fit_pathway(group):
+            positions, pathways = group
+            with instrumentation.span("fit_pathway", method="sspa_multi", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=X.shape[0], n_entities=len(positions)):
+                single_pathway_matrix = values[:, positions]
+                return {m: e._fit_pathway(single_pathway_matrix) for m, e in fitted.items()}
+
+        plan = memory.plan(self._plan_method(), "fit", X, {ids[0]: self.pathways[ids[0]] for _, ids in self.groups_},
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("fit", method="sspa_multi", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(self.groups_), methods=",".join(self.methods)):
+            models = plan.map(fit_pathway, self.groups_) if fitted else []
+
+        for method, estimator in fitted.items():
+            estimator.X_, estimator.y_ = self.X_, y
+            estimator.feature_names_in_, estimator.n_samples_fit_ = self.feature_names_in_, self.n_samples_fit_
+            estimator.dtype_ = self.dtype_
+            estimator.packed_, estimator.n_samples_seen_ = None, None
+            estimator.dedup_report_ = self.dedup_report_
+            estimator._set_fitted(self.groups_, [m[method] for m in models])
+        if "zscore" in self.estimators_:
+            self.estimators_["zscore"].fit(X, y)
+        grouped = {k for _, ids in self.groups_ for k in ids}
+        self.pathway_ids = [k for k in self.pathways if k in grouped]
+        self.is_fitted_ = True
+        return self
+
+    def transform(self, X, y=None):
+        """
+        Transform X with each method.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            pandas DataFrame of pathway scores with two column levels, method and pathway, e.g. scores["svd"].
+            Rows represent samples. All methods score the pathways selected when fitting.
+        """
+        check_is_fitted(self, 'is_fitted_')
+        fitted = {m: e for m, e in self.estimators_.items() if m != "zscore"}
+        models = {m: dict(zip(e.pathway_ids, e.fitted_models)) for m, e in fitted.items()}
+
+        # regroup on the columns of X, keeping pathways fitted on different column sets apart
+        fit_group = {k: n for n, (_, ids) in enumerate(self.groups_) for k in ids}
+        pathways = {k: self.pathways[k] for k in self.pathway_ids}
+        groups = utils.group_pathways(pathways, X.columns, tags=fit_group)
+        values = X.to_numpy(dtype=self.dtype_)
+        zscores = observed = None
+        if "zscore" in self.estimators_:
+            # entity z-scores do not depend on the pathway, standardise the matrix once
+            missing = utils.missing_mask(values, self.estimators_["zscore"].nan_policy)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                zscores = stats.zscore(values, axis=0, nan_policy="propagate" if missing is None else "omit")
+            if missing is not None:
+                # missing values are left out of the pathway sums and their normalisation
+                zscores[missing] = 0
+                observed = ~missing
+
+        plan = memory.plan(self._plan_method(), "transform", X, pathways, n_train=self.n_samples_fit_,
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=plan)
+        blocks = []
+        with plan.measure(), instrumentation.span("transform", method="sspa_multi", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups), methods=",".join(self.methods)):
+            for rows in plan.sample_blocks():
+                values_block = values[rows]
+                zscores_block = zscores[rows] if zscores is not None else None
+
+                def transform_pathway(group):
+                    positions, pathways = group
+                    with instrumentation.span("transform_pathway", method="sspa_multi", pathway=pathways[0],
+                                              n_pathways=len(pathways), n_samples=values_block.shape[0],
+                                              n_entities=len(positions)):
+                        single_pathway_matrix = values_block[:, positions]
+                        scores = {m: e._score_pathway(models[m][pathways[0]], single_pathway_matrix)
+                                  for m, e in fitted.items()}
+                        if zscores is not None and observed is not None:
+                            with np.errstate(divide="ignore", invalid="ignore"):
+                                scores["zscore"] = zscores_block[:, positions].sum(axis=1) / np.sqrt(
+                                    observed[rows][:, positions].sum(axis=1), dtype=self.dtype_)
+                        elif zscores is not None:
+                            scores["zscore"] = zscores_block[:, positions].sum(axis=1) / np.sqrt(len(positions), dtype=self.dtype_)
+                        return scores
+
+                blocks.append(plan.map(transform_pathway, groups))
+
+        panel = {}
+        for method in self.methods:
+            group_scores = [np.concatenate([block[n][method] for block in blocks]) for n in range(len(groups))]
+            scores = {k: v for (_, pathways), v in zip(groups, group_scores) for k in pathways}
+            pathway_ids = [k for k in self.pathway_ids if k in scores]
+            panel[method] = utils.scores_frame([scores[k] for k in pathway_ids], X.index, pathway_ids)
+        return pd.concat(panel, axis=1, names=["Method", "Pathway"])
+
+    def fit_transform(self, X, y=None):
+        """
+        Fit the model of each method with X and transform X.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            pandas DataFrame of pathway scores with two column levels, method and pathway, e.g. scores["svd"].
+            Rows represent samples.
+        """
+        self.fit(X, y)
+        return self.transform(X)
@@ -1,8 +1,7 @@
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
-import statsmodels.api as sm
 import sspa.utils as utils
+from sspa import instrumentation, pathway_set
 
 
 class sspa_ora:
@@ -26,24 +25,33 @@ class sspa_ora:
         self.background_set = custom_background if custom_background is not None else mat.columns.to_list()
 
         # Run differential analysis using t-test or mwu test
-        self.DA_test_res = utils.t_tests(self.data.copy(deep=True), self.metadata, "fdr_bh", testtype=self.testtype)
+        with instrumentation.span("differential_analysis", method="sspa_ora", testtype=self.testtype,
+                                  n_samples=mat.shape[0], n_features=mat.shape[1]):
+            self.DA_test_res = utils.t_tests(self.data.copy(deep=True), self.metadata, "fdr_bh", testtype=self.testtype)
         self.DA_molecules = self.DA_test_res[self.DA_test_res["P-adjust"] <= self.threshold]["Entity"].tolist()
         self.results = []
 
-    def over_representation_analysis(self):
+    def over_representation_analysis(self, collapse_redundant=None, collapse_metric="overlap"):
 
         """
         Function for over representation analysis using Fisher exact test (right tailed)
+        Args:
+            collapse_redundant (float): if set, significant pathways (P-adjust <= 0.05) whose similarity to a more
+                significant pathway is at least this value are removed and listed in a Redundant_pathways column
+                (see sspa.pathway_set.collapse_redundant). Pathways are compared on background identifiers only.
+            collapse_metric (str): similarity used to collapse pathways, 'overlap' (overlap coefficient) or 'jaccard'
         Returns:
             DataFrame of ORA results for each pathway, p-value, FDR p-value, hits ratio, coverage of pathway, and identifiers of differential metabolites 
         """
+        import scipy.stats as stats
+        import statsmodels.api as sm
 
         pathway_names = self.pathways["Pathway_name"].to_dict()
         pathway_dict = utils.pathwaydf_to_dict(self.pathways)
 
         # test only pathways with at least 1 DA compounds
         compounds_present = self.DA_molecules
-        pathways_present = {k: v for k, v in pathway_dict.items() if len([i for i in compounds_present if i in v]) >= 1}
+        pathways_present = utils.filter_pathways(pathway_dict, compounds_present, 1)
 
         pathways_with_compounds = []
         pvalues = []
@@ -51,41 +59,43 @@ class sspa_ora:
         pathway_coverage = [] # pathway coverage / total compounds in original pathway
         compound_in_pathway_by_name = [] # DA compounds in pathway by name
         
-        for pathway in pathways_present:
-            # perform ORA for each pathway
-            pathway_compounds_all = pathway_dict[pathway]
-            pathway_compounds = list(set(pathway_compounds_all) & set(self.background_set))
-            pathway_compounds = [i for i in pathway_compounds if str(i) != "nan"]
-            if not pathway_compounds or len(pathway_compounds) < 2:
-                # ignore pathway if contains no compounds or has less than 2 compounds
-                continue
-            else:
-                DA_in_pathway = len(set(self.DA_molecules) & set(pathway_compounds))
-                # k: compounds in DA list AND pathway
-                compound_in_pathway_by_name += [", ".join(list(set(self.DA_molecules) & set(pathway_compounds)))]
-                # coumpounds in DA list AND pathway using name of Database (KEGG, Reactome, other)
-                DA_not_in_pathway = len(np.setdiff1d(self.DA_molecules, pathway_compounds))
-                # K: compounds in DA list not in pathway
-                compound_in_pathway_not_DA = len(set(pathway_compounds) & set(np.setdiff1d(self.background_set, self.DA_molecules)))
-                # not DA compounds present in pathway
-                compound_not_in_pathway_not_DA = len(
-                    np.setdiff1d(np.setdiff1d(self.background_set, self.DA_molecules), pathway_compounds))
-                # compounds in background list not present in pathway
-                if DA_in_pathway == 0 or (compound_in_pathway_not_DA + DA_in_pathway) < 2:
-                    compound_in_pathway_by_name = compound_in_pathway_by_name[:-1]
+        with instrumentation.span("ora", method="sspa_ora", n_pathways=len(pathways_present)):
+            for pathway in pathways_present:
+                with instrumentation.span("test_pathway", method="sspa_ora", pathway=pathway):
+                    # perform ORA for each pathway
+                    pathway_compounds_all = pathway_dict[pathway]
+                    pathway_compounds = list(set(pathway_compounds_all) & set(self.background_set))
+                    pathway_compounds = [i for i in pathway_compounds if str(i) != "nan"]
+                    if not pathway_compounds or len(pathway_compounds) < 2:
+                        # ignore pathway if contains no compounds or has less than 2 compounds
+                        continue
+                    else:
+                        DA_in_pathway = len(set(self.DA_molecules) & set(pathway_compounds))
+                        # k: compounds in DA list AND pathway
+                        compound_in_pathway_by_name += [", ".join(list(set(self.DA_molecules) & set(pathway_compounds)))]
+                        # coumpounds in DA list AND pathway using name of Database (KEGG, Reactome, other)
+                        DA_not_in_pathway = len(np.setdiff1d(self.DA_molecules, pathway_compounds))
+                        # K: compounds in DA list not in pathway
+                        compound_in_pathway_not_DA = len(set(pathway_compounds) & set(np.setdiff1d(self.background_set, self.DA_molecules)))
+                        # not DA compounds present in pathway
+                        compound_not_in_pathway_not_DA = len(
+                            np.setdiff1d(np.setdiff1d(self.background_set, self.DA_molecules), pathway_compounds))
+                        # compounds in background list not present in pathway
+                        if DA_in_pathway == 0 or (compound_in_pathway_not_DA + DA_in_pathway) < 2:
+                            compound_in_pathway_by_name = compound_in_pathway_by_name[:-1]
 
-                    continue
-                else:
-                    # Create 2 by 2 contingency table
-                    pathway_ratio.append(str(DA_in_pathway) + "/" + str(compound_in_pathway_not_DA + DA_in_pathway))
-                    pathway_coverage.append(
-                        str(compound_in_pathway_not_DA + DA_in_pathway) + "/" + str(len(pathway_compounds_all)))
-                    pathways_with_compounds.append(pathway)
-                    contingency_table = np.array([[DA_in_pathway, compound_in_pathway_not_DA],
-                                                [DA_not_in_pathway, compound_not_in_pathway_not_DA]])
-                    # Run right tailed Fisher's exact test
-                    oddsratio, pvalue = stats.fisher_exact(contingency_table, alternative="greater")
-                    pvalues.append(pvalue)
+                            continue
+                        else:
+                            # Create 2 by 2 contingency table
+                            pathway_ratio.append(str(DA_in_pathway) + "/" + str(compound_in_pathway_not_DA + DA_in_pathway))
+                            pathway_coverage.append(
+                                str(compound_in_pathway_not_DA + DA_in_pathway) + "/" + str(len(pathway_compounds_all)))
+                            pathways_with_compounds.append(pathway)
+                            contingency_table = np.array([[DA_in_pathway, compound_in_pathway_not_DA],
+                                                        [DA_not_in_pathway, compound_not_in_pathway_not_DA]])
+                            # Run right tailed Fisher's exact test
+                            oddsratio, pvalue = stats.fisher_exact(contingency_table, alternative="greater")
+                            pvalues.append(pvalue)
         try:
             padj = sm.stats.multipletests(pvalues, 0.05, method="fdr_bh")
             results = pd.DataFrame(
@@ -101,6 +111,10 @@ class sspa_ora:
                                 columns=["ID", "Hits", "Coverage", "P-value", "P-adjust", "DA_Metabolites_ID"])
             results["Pathway_name"] = results["ID"].map(pathway_names)
             results.insert(1, 'Pathway_name', results.pop('Pathway_name'))
-            
+
+        if collapse_redundant is not None:
+            results = pathway_set.collapse_redundant(results, self.pathways, threshold=collapse_redundant,
+                                                     metric=collapse_metric, id_col="ID", p_col="P-adjust",
+                                                     entities=self.background_set)
         self.results = results
         return results
\ No newline at end of file
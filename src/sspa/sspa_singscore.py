@@ -0,0 +1,139 @@
+# Cite Foroutan et al. 2018
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sspa.utils as utils
+from sspa import instrumentation, memory, ranks
+from sklearn.utils.validation import check_is_fitted
+from sklearn.base import BaseEstimator
+
+
+class sspa_singscore(BaseEstimator):
+    """
+    Foroutan et al 2018 singscore method for single sample pathway analysis.
+
+    The score of a pathway is the mean rank of its entities in the sample, normalised by its theoretical minimum
+    and maximum. With down-regulated entities the score is the sum of the scores of the up set, ranked in
+    ascending order, and of the down set, ranked in descending order. Samples are ranked once (see sspa.ranks, the
+    rank matrix is shared with other rank-based methods) and the mean ranks of all pathways are a single sparse
+    matrix product. Sparse input (see sspa.utils.sparse_values) is densified one block of samples at a time while
+    ranking.
+
+    Args:
+        pathway_df (pd.DataFrame): pandas DataFrame of pathway identifiers (keys) and corresponding list of pathway entities (values).
+        Entity identifiers must match those in the matrix columns
+        down_pathway_df (pd.DataFrame): pathway DataFrame of the down-regulated entities of pathways, with identifiers
+        matching those of pathway_df. Default is None, all entities are up-regulated
+        min_entity (int): minimum number of metabolites mapping to pathways (and to their down sets) for ssPA to be performed
+        ties (str): rank of tied values, 'min' (default, as the singscore package) or 'average'
+        center (bool): subtract 0.5 from the normalised scores of each set, so that they lie in [-0.5, 0.5]
+
+    Returns:
+        pandas DataFrame of pathway scores derived using the singscore method. Columns represent pathways and rows represent samples.
+    """
+
+    def __init__(self, pathway_df, down_pathway_df=None, min_entity=2, ties="min", center=True):
+        self.pathway_df = pathway_df
+        self.down_pathway_df = down_pathway_df
+        self.min_entity = min_entity
+        self.ties = ties
+        self.center = center
+        self.pathways = utils.pathwaydf_to_dict(pathway_df)
+        self.down_pathways = utils.pathwaydf_to_dict(down_pathway_df) if down_pathway_df is not None else {}
+        self.pathways_filt = {}
+        self.pathway_ids = []
+
+    def fit(self, X, y=None):
+        """
+        Fit the model with X.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            self : object
+        """
+        if self.ties not in ranks.TIES:
+            raise ValueError("ties must be one of %s, got %r" % (", ".join(map(repr, ranks.TIES)), self.ties))
+        self.X_ = X
+        self.y_ = y
+
+        self.is_fitted_ = True
+        return self
+
+    def _weights(self, columns):
+        # entity x set indicator matrix of the unique up sets followed by the unique down sets, and the set of
+        # each pathway
+        up = utils.group_pathways(self.pathways, columns, self.min_entity)
+        down = utils.group_pathways({k: v for k, v in self.down_pathways.items() if k in self.pathways}, columns,
+                                    self.min_entity)
+        up_set = {k: n for n, (_, ids) in enumerate(up) for k in ids}
+        down_set = {k: len(up) + n for n, (_, ids) in enumerate(down) for k in ids}
+        pathway_ids = [k for k in self.pathways if k in up_set and (k not in self.down_pathways or k in down_set)]
+        sets = [positions for positions, _ in up + down]
+        indptr = np.r_[0, np.cumsum([len(v) for v in sets], dtype=np.int64)]
+        indices = np.concatenate(sets) if sets else np.zeros(0, dtype=np.int64)
+        weights = sp.csc_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                                shape=(len(columns), len(sets)))
+        return weights, np.diff(indptr), len(up), pathway_ids, up_set, down_set
+
+    def transform(self, X, y=None):
+        """
+        Transform X.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            pandas DataFrame of pathway scores derived using the singscore method. Columns represent pathways and rows represent samples.
+        """
+        check_is_fitted(self, 'is_fitted_')
+        n_samples, n_entities = X.shape
+        weights, sizes, n_up, pathway_ids, up_set, down_set = self._weights(X.columns)
+        self.pathway_ids = pathway_ids
+        self.pathways_filt = {k: self.pathways[k] for k in pathway_ids}
+
+        plan = memory.plan("sspa_singscore", "transform", X, self.pathways_filt)
+        self.memory_plans_ = {"transform": plan}
+        with plan.measure(), instrumentation.span("transform", method="sspa_singscore", n_samples=n_samples,
+                                                  n_features=n_entities, unique_sets=len(sizes)):
+            rank_matrix = ranks.rank_samples(X, ties=self.ties)
+            # rank sums are integers (or halves), exact in float32 below 2**23 so the ranks are not copied
+            exact = n_entities * sizes.max(initial=0) < 2 ** 23
+            if not exact:
+                weights = weights.astype(np.float64)
+            set_scores = np.empty((n_samples, len(sizes)), order="F")
+            for rows in plan.sample_blocks():
+                block = rank_matrix[rows] if exact else rank_matrix[rows].astype(np.float64)
+                set_scores[rows] = block @ weights
+
+            # the normalised mean rank (mean - (k + 1) / 2) / (n - k) of a set of size k is an affine function of
+            # its rank sum; down sets are ranked in descending order, with ranks n + 1 - rank
+            with np.errstate(divide="ignore", invalid="ignore"):
+                span = n_entities - sizes
+                scale = 1 / (sizes * span)
+                shift = -(sizes + 1) / 2 / span
+                scale[n_up:] *= -1
+                shift[n_up:] += (n_entities + 1) / span[n_up:]
+                if self.center:
+                    shift -= 0.5
+                set_scores *= scale
+                set_scores += shift
+
+            scores = set_scores[:, [up_set[k] for k in pathway_ids]]
+            has_down = [n for n, k in enumerate(pathway_ids) if k in down_set]
+            scores[:, has_down] += set_scores[:, [down_set[pathway_ids[n]] for n in has_down]]
+        return pd.DataFrame(scores, index=X.index, columns=pathway_ids)
+
+    def fit_transform(self, X, y=None):
+        """
+        Fit the model with X and transform X.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            pandas DataFrame of pathway scores derived using the singscore method. Columns represent pathways and rows represent samples.
+        """
+        self.fit(X)
+        return self.transform(X)
@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 import sspa.utils as utils
-import gseapy
+from sspa import enrichment, instrumentation, memory, ranks
 from sklearn.utils.validation import check_is_fitted
 from sklearn.base import BaseEstimator
 
@@ -9,6 +10,13 @@ class sspa_ssGSEA(BaseEstimator):
     Barbie et al ssGSEA method for single sample pathway analysis. 
 
     Uses the ssgsea function of the gseapy package (https://github.com/zqfang/GSEApy) as a backend. 
+    Sparse input (see sspa.utils.sparse_values) is densified one block of samples at a time, set max_memory to bound
+    the block size. Samples are ranked with sspa.ranks, so the rank matrix is shared with other rank-based methods,
+    unless gseapy would alter the data before ranking it (missing or infinite values, duplicated entities).
+
+    With backend='native', enrichment scores are computed by sspa.enrichment from the shared rank matrix rather than
+    by gseapy, in a single pass over the samples (Numba-compiled when numba is installed). Scores match gseapy's,
+    except for data with missing values (ranked last, rather than filled) or duplicated entities.
 
     All credit for ssGSEA code goes to developers of the GSEAPY python package (credit: 
     Zhuoqing Fang, Xinyuan Liu, Gary Peltz, GSEApy: 
@@ -19,15 +27,17 @@ class sspa_ssGSEA(BaseEstimator):
         pathway_df (pd.DataFrame): pandas DataFrame of pathway identifiers (keys) and corresponding list of pathway entities (values).
         Entity identifiers must match those in the matrix columns
         min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
+        backend (str): 'gseapy' (default) or 'native', see above
 
 
     Returns:
         pandas DataFrame of pathway scores derived using the ssGSEA method. Columns represent pathways and rows represent samples.
     """
 
-    def __init__(self, pathway_df, min_entity=2):
+    def __init__(self, pathway_df, min_entity=2, backend="gseapy"):
         self.pathway_df = pathway_df
         self.min_entity = min_entity
+        self.backend = backend
         self.pathways = utils.pathwaydf_to_dict(pathway_df)
         self.pathways_filt = {}
         self.fitted_models = []
@@ -60,18 +70,108 @@ class sspa_ssGSEA(BaseEstimator):
             pandas DataFrame of pathway scores derived using the ssGSEA method. Columns represent pathways and rows represent samples.
         """
         check_is_fitted(self, 'is_fitted_')
+        if self.backend not in ("gseapy", "native"):
+            raise ValueError("backend must be 'gseapy' or 'native', got %r" % (self.backend,))
+
+        # gseapy runs 4 threads by default
+        plan = memory.plan("sspa_ssGSEA", "transform", X, self.pathways, default_jobs=4)
+        self.memory_plans_ = {"transform": plan}
+        # samples are ranked over all entities, so sparse data is densified one block of samples at a time
+        sparse = utils.sparse_values(X, "csr")
+        if self.backend == "native":
+            with plan.measure(), instrumentation.span("transform", method="sspa_ssGSEA", backend="native",
+                                                      n_samples=X.shape[0], n_features=X.shape[1],
+                                                      n_pathways=len(self.pathways)):
+                return self._transform_native(X, plan, sparse)
 
-        ssgsea_res = gseapy.ssgsea(data=X.T,
-                gene_sets=self.pathways,
-                min_size=self.min_entity,
-                outdir=None,
-                sample_norm_method='rank', # choose 'custom' will only use the raw value of `data`
-                no_plot=True)
-        ssgsea_scores = ssgsea_res.res2d.pivot(index='Term', columns='Name', values='NES').T
+        import gseapy
+        shared_ranks = X.columns.is_unique and np.isfinite(X.to_numpy() if sparse is None else sparse.data).all()
+        with plan.measure(), instrumentation.span("backend", method="sspa_ssGSEA", backend="gseapy.ssgsea",
+                                                  n_samples=X.shape[0], n_features=X.shape[1], n_pathways=len(self.pathways)):
+            if not plan.blocked:
+                data, norm_method = self._ranked_block(X, sparse, slice(None), shared_ranks)
+                ssgsea_res = gseapy.ssgsea(data=data,
+                        gene_sets=self.pathways,
+                        min_size=self.min_entity,
+                        outdir=None,
+                        sample_norm_method=norm_method, # choose 'custom' will only use the raw value of `data`
+                        threads=plan.n_jobs,
+                        no_plot=True)
+                ssgsea_scores = ssgsea_res.res2d.pivot(index='Term', columns='Name', values='NES').T
+            else:
+                ssgsea_scores = self._transform_blocks(X, plan, sparse, shared_ranks)
         res_df = pd.DataFrame(ssgsea_scores, index=X.index)
         res_df = res_df.astype(float)
         return res_df
     
+    @staticmethod
+    def _dense_block(X, sparse, rows):
+        if sparse is None:
+            return X.iloc[rows]
+        return pd.DataFrame(sparse[rows].toarray(), index=X.index[rows], columns=X.columns)
+
+    @classmethod
+    def _ranked_block(cls, X, sparse, rows, shared_ranks):
+        """
+        data and sample_norm_method arguments of gseapy.ssgsea for a block of samples. With shared_ranks, gseapy's
+        'rank' normalisation (10000 * rank / number of entities) is computed from sspa.ranks, reading the cached rank
+        matrix of X when all samples are scored at once.
+        """
+        if not shared_ranks:
+            return cls._dense_block(X, sparse, rows).T, 'rank'
+        if rows == slice(None):
+            ranked = ranks.rank_samples(X)
+        else:
+            ranked = ranks.rank_samples(cls._dense_block(X, sparse, rows), cache=False)
+        metric = 10000 * ranked.astype(float) / X.shape[1]
+        return pd.DataFrame(metric.T, index=X.columns, columns=X.index[rows]), 'custom'
+
+    def _transform_blocks(self, X, plan, sparse=None, shared_ranks=False):
+        """
+        Run ssGSEA over blocks of samples and pathways. Enrichment scores of a sample only depend on its own values,
+        so they are computed per block and normalised by the range of scores over all blocks, as gseapy does.
+        """
+        import gseapy
+
+        sizes = memory.aligned_sizes(self.pathways, X.columns)
+        pathways = [k for k, v in sizes.items() if self.min_entity <= v <= memory.GSEAPY_MAX_SIZE]
+        sample_blocks = []
+        for rows in plan.sample_blocks():
+            pathway_blocks = []
+            data, norm_method = self._ranked_block(X, sparse, rows, shared_ranks)
+            for block in plan.pathway_blocks(pathways):
+                ssgsea_res = gseapy.ssgsea(data=data,
+                        gene_sets={k: self.pathways[k] for k in block},
+                        min_size=self.min_entity,
+                        outdir=None,
+                        sample_norm_method=norm_method,
+                        threads=plan.n_jobs,
+                        no_plot=True)
+                pathway_blocks.append(ssgsea_res.res2d.pivot(index='Term', columns='Name', values='ES').astype(float))
+            sample_blocks.append(pd.concat(pathway_blocks, axis=0))
+        es = pd.concat(sample_blocks, axis=1).T.sort_index(axis=1)
+        return es / (es.max().max() - es.min().min())
+
+    def _transform_native(self, X, plan, sparse=None):
+        """
+        ssGSEA enrichment scores (running sums weighted by |normalised rank| ** 0.25) of the pathways of gseapy's size
+        range, normalised by the range of all scores as gseapy does, with columns in gseapy's (sorted) order.
+        """
+        groups = [(positions, ids) for positions, ids in utils.group_pathways(self.pathways, X.columns, self.min_entity)
+                  if len(positions) <= memory.GSEAPY_MAX_SIZE]
+        ranked = None if plan.blocked else ranks.rank_samples(X)
+        es = np.empty((X.shape[0], len(groups)))
+        for rows in plan.sample_blocks():
+            block = ranked[rows] if ranked is not None else ranks.rank_samples(self._dense_block(X, sparse, rows),
+                                                                              cache=False)
+            # gseapy's 'rank' sample normalisation
+            es[rows] = enrichment.enrichment_scores(10000 * block.astype(float) / X.shape[1],
+                                                    [positions for positions, _ in groups], weight=0.25, statistic="sum")
+        columns = {k: n for n, (_, ids) in enumerate(groups) for k in ids}
+        pathway_ids = sorted(columns)
+        es = pd.DataFrame(es[:, [columns[k] for k in pathway_ids]], index=X.index, columns=pathway_ids)
+        return es / (es.max().max() - es.min().min())
+
     def fit_transform(self, X, y=None):
         """
         Fit the model with X and transform X.
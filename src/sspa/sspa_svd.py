@@ -1,22 +1,154 @@
+from collections.abc import Mapping
 import pandas as pd
 import numpy as np
 import sspa.utils as utils
+from sspa import fit_cache, instrumentation, memory, serialization
+from sspa.config import resolve_dtype
 from sklearn.decomposition import PCA
+from sklearn.utils.extmath import svd_flip
 from sklearn.utils.validation import check_is_fitted
 from sklearn.base import BaseEstimator
 
 
+def _loading_sign(component):
+    # sign making the largest absolute loading positive, as svd_flip on the loadings does in PCA from scikit-learn 1.5.
+    # Earlier PCA flipped on the sample scores, which partial_fit (scatter matrices only) cannot compute, so fitted PCA
+    # models are given this sign too and every fitting path agrees whatever the scikit-learn version
+    return svd_flip(np.ones((1, 1)), np.array(component, ndmin=2), u_based_decision=False)[0][0, 0]
+
+
+class MolecularImportance(Mapping):
+    """
+    PC1 loadings (molecular importances) of the entities of each fitted pathway, stored as a single sparse
+    entity x pathway matrix: the loadings of pathway i are loadings[indptr[i]:indptr[i + 1]], for the entities
+    entities[entity_idx[indptr[i]:indptr[i + 1]]].
+
+    For compatibility, indexing by pathway identifier returns a one-column 'PC1_Loadings' DataFrame.
+
+    Args:
+        entities (array-like): training entity identifiers
+        pathway_ids (list): fitted pathway identifiers
+        indptr (array-like): row pointer of length len(pathway_ids) + 1
+        entity_idx (array-like): position of each loading's entity in entities
+        loadings (array-like): PC1 loadings
+    """
+    def __init__(self, entities, pathway_ids, indptr, entity_idx, loadings):
+        self.entities = np.asarray(entities, dtype=object)
+        self.pathway_ids = list(pathway_ids)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.entity_idx = np.asarray(entity_idx)
+        self.loadings = np.asarray(loadings)
+        self._positions = None
+        self._entity_order = None
+
+    def _position(self, pathway):
+        if self._positions is None:
+            self._positions = {k: n for n, k in enumerate(self.pathway_ids)}
+        return self._positions[pathway]
+
+    def __getitem__(self, pathway):
+        return self.pathway(pathway).to_frame('PC1_Loadings')
+
+    def __iter__(self):
+        return iter(self.pathway_ids)
+
+    def __len__(self):
+        return len(self.pathway_ids)
+
+    def __repr__(self):
+        return "MolecularImportance(%d pathways, %d loadings)" % (len(self), len(self.loadings))
+
+    def pathway(self, pathway):
+        """
+        Args:
+            pathway (str): pathway identifier
+        Returns:
+            pd.Series of PC1 loadings indexed by entity, a view on the stored loadings
+        """
+        n = self._position(pathway)
+        start, stop = self.indptr[n], self.indptr[n + 1]
+        return pd.Series(self.loadings[start:stop], index=self.entities[self.entity_idx[start:stop]], name=pathway)
+
+    def entity(self, entity):
+        """
+        Args:
+            entity (str): entity identifier
+        Returns:
+            pd.Series of the PC1 loadings of the entity in each fitted pathway containing it, indexed by pathway
+        """
+        if self._entity_order is None:
+            order = np.argsort(self.entity_idx, kind="stable")
+            self._entity_order = order, np.searchsorted(self.entity_idx[order], np.arange(len(self.entities) + 1))
+        order, entity_ptr = self._entity_order
+        matches = np.flatnonzero(self.entities == entity)
+        rows = np.concatenate([order[entity_ptr[i]:entity_ptr[i + 1]] for i in matches]) if len(matches) else order[:0]
+        pathways = np.searchsorted(self.indptr, rows, side="right") - 1
+        return pd.Series(self.loadings[rows], index=np.asarray(self.pathway_ids, dtype=object)[pathways], name=entity)
+
+    def top_k(self, k=10, absolute=True):
+        """
+        Top entities of each pathway by loading
+        Args:
+            k (int): number of entities per pathway
+            absolute (bool): rank by absolute loading (the sign of PC1 is arbitrary)
+        Returns:
+            long-format pd.DataFrame with Pathway_ID, Entity, PC1_Loadings and Rank (from 1) columns
+        """
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        key = np.abs(self.loadings) if absolute else self.loadings
+        order = np.lexsort((-key, rows))
+        rank = np.arange(len(order)) - self.indptr[rows[order]]
+        keep = order[rank < k]
+        return pd.DataFrame({"Pathway_ID": np.asarray(self.pathway_ids, dtype=object)[rows[keep]],
+                             "Entity": self.entities[self.entity_idx[keep]],
+                             "PC1_Loadings": self.loadings[keep],
+                             "Rank": rank[rank < k] + 1})
+
+    def to_long(self):
+        """
+        Returns:
+            long-format pd.DataFrame with Pathway_ID, Entity and PC1_Loadings columns, one row per loading
+        """
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        return pd.DataFrame({"Pathway_ID": np.asarray(self.pathway_ids, dtype=object)[rows],
+                             "Entity": self.entities[self.entity_idx],
+                             "PC1_Loadings": self.loadings})
+
+    def to_sparse(self):
+        """
+        Returns:
+            scipy.sparse.csc_matrix of shape (entities, pathways) of PC1 loadings
+        """
+        import scipy.sparse as sp
+        return sp.csc_matrix((self.loadings, self.entity_idx, self.indptr), shape=(len(self.entities), len(self)))
+
+
 class sspa_SVD(BaseEstimator):
     """
     Tomfohr et al 2005 PLAGE (SVD) method for single sample pathway analysis
 
+    Sparse input (see sspa.utils.sparse_values) is fitted from the scatter matrix of each pathway and scored through
+    packed parameters, without centring or densifying the data.
+
     Args:
         pathway_df (pd.DataFrame): pandas DataFrame of pathway identifiers (keys) and corresponding list of pathway entities (values).
         Entity identifiers must match those in the matrix columns
         min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
+        keep_X (bool): keep the training matrix as X_ after fitting. Set to False to reduce the memory held by fitted models
+        dtype (str): 'float32' or 'float64', floating point type of the fitted models and scores. Default is the dtype set
+        with sspa.set_config, float64 if none is set
+        nan_policy (str): 'propagate' (default) or 'omit'. With 'omit', missing values are imputed from the rank one
+        reconstruction of their pathway while fitting (iterative SVD) and samples are scored by least squares on their
+        observed entities. Models scoring through packed parameters (incrementally fitted, fitted on sparse data or
+        loaded) propagate missing values
+        warm_start (bool): when refitting, start the power iteration of each pathway from its previous PC1 loadings
+        rather than computing the decomposition from scratch. Pathways whose aligned column set changed, pathways with
+        missing values and sparse input are fitted from scratch, as are all pathways if the previous fit scores through
+        packed parameters. Warm started fits are not read from or stored in the fit cache
 
     """
-    def __init__(self, pathway_df, min_entity=2, random_state=0):
+    def __init__(self, pathway_df, min_entity=2, random_state=0, keep_X=True, dtype=None, nan_policy="propagate",
+                 warm_start=False):
         self.pathway_df = pathway_df
         self.min_entity = min_entity
         self.pathways = utils.pathwaydf_to_dict(pathway_df)
@@ -24,8 +156,13 @@ class sspa_SVD(BaseEstimator):
         self.fitted_models = []
         self.pathway_ids = []
         self.random_state = random_state
-        self.molecular_importance = {}
+        self.keep_X = keep_X
+        self.dtype = dtype
+        self.nan_policy = nan_policy
+        self.warm_start = warm_start
+        self.molecular_importance = MolecularImportance([], [], [0], [], [])
 
+    @fit_cache.cached
     def fit(self, X, y=None):
         """
         Fit the model with X.
@@ -37,24 +174,276 @@ class sspa_SVD(BaseEstimator):
             self : object
         """
 
-        self.X_ = X
+        utils.check_nan_policy(self.nan_policy)
+        # models of the previous fit, read before the fitted state is reset
+        previous = utils.previous_fit(self) if self.warm_start else {}
+        self.X_ = X if self.keep_X else None
         self.y_ = y
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_samples_fit_ = X.shape[0]
+        self.dtype_ = resolve_dtype(self.dtype)
+        self.n_samples_seen_ = None
+        self.packed_ = None
 
-        for pathway, compounds in self.pathways.items():
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            if single_pathway_matrix.shape[1] >= self.min_entity:
+        # pathways with identical aligned column sets are fitted once
+        groups = utils.group_pathways(self.pathways, X.columns, self.min_entity)
+        self.dedup_report_ = utils.dedup_report(groups)
+        values = utils.sparse_values(X)
+        if values is not None:
+            utils.missing_mask(values, self.nan_policy)
+            return self._fit_sparse(X, values, groups)
+
+        def fit_pathway(group):
+            positions, pathways = group
+            model, order = utils.warm_start_model(previous, X.columns[positions], pathways)
+            with instrumentation.span("fit_pathway", method="sspa_SVD", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=X.shape[0], n_entities=len(positions), warm_start=model is not None):
+                return self._fit_pathway(X.iloc[:, positions].to_numpy(dtype=self.dtype_),
+                                         init=None if model is None else model.components_[0][order])
+
+        plan = memory.plan("sspa_SVD", "fit", X, {ids[0]: self.pathways[ids[0]] for _, ids in groups},
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("fit", method="sspa_SVD", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            models = plan.map(fit_pathway, groups)
+        self._set_fitted(groups, models)
+        return self
+
+    def _fit_sparse(self, X, values, groups):
+        # the leading component of each pathway is computed from its scatter matrix X'X - n * mean mean', so sparse
+        # slices are never centred (densified); the centring is folded into the offsets of the packed linear model
+        n = X.shape[0]
+
+        def fit_pathway(group):
+            positions, pathways = group
+            with instrumentation.span("fit_pathway", method="sspa_SVD", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=n, n_entities=len(positions), sparse=True):
+                single_pathway_matrix = values[:, positions]
+                mean = np.asarray(single_pathway_matrix.mean(axis=0)).ravel()
+                scatter = (single_pathway_matrix.T @ single_pathway_matrix).toarray() - n * np.outer(mean, mean)
+                return mean, self._leading_component(scatter)
+
+        plan = memory.plan("sspa_SVD", "fit", X, {ids[0]: self.pathways[ids[0]] for _, ids in groups},
+                           itemsize=self.dtype_.itemsize)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("fit", method="sspa_SVD", n_samples=n, n_features=X.shape[1],
+                                                  unique_sets=len(groups), nnz=values.nnz):
+            models = plan.map(fit_pathway, groups)
+        fitted = {k: (positions, model) for (positions, pathways), model in zip(groups, models) for k in pathways}
+        self.pathway_ids = [k for k in self.pathways if k in fitted]
+        self.pathways_filt = {k: self.pathways[k] for k in self.pathway_ids}
+        self.fitted_models = []
+        self._set_packed([fitted[k][0] for k in self.pathway_ids], [fitted[k][1][0] for k in self.pathway_ids],
+                         [fitted[k][1][1] for k in self.pathway_ids], n)
+        self.is_fitted_ = True
+        return self
+
+    @staticmethod
+    def _leading_component(scatter):
+        component = np.linalg.eigh(scatter)[1][:, -1]
+        return component * _loading_sign(component)
+
+    def _set_packed(self, positions, means, components, n_samples):
+        # linear model scoring pathway i as X[:, positions[i]] @ components[i] - means[i] @ components[i]
+        indptr = np.r_[0, np.cumsum([len(v) for v in positions], dtype=np.int64)]
+        col_idx = np.concatenate(positions) if components else np.zeros(0, dtype=np.int64)
+        offset = [mean @ component for mean, component in zip(means, components)]
+        self.packed_ = serialization.PackedModel(serialization.pack_linear(
+            "sspa_SVD", self.feature_names_in_, self.pathway_ids, indptr, col_idx, components, offset,
+            min_entity=self.min_entity, random_state=self.random_state, n_samples_fit=n_samples, dtype=self.dtype_.name))
+        self.molecular_importance = self._molecular_importance(self.pathway_ids, positions, components)
+
+    def _fit_pathway(self, values, max_iter=100, tol=1e-6, init=None):
+        pca = PCA(n_components=1, random_state=self.random_state)
+        missing = utils.missing_mask(values, self.nan_policy)
+        if missing is None:
+            warm = self._power_iteration(values, init) if init is not None else None
+            if warm is not None:
+                return warm
+            pca.fit(values)
+            pca.components_ *= _loading_sign(pca.components_[0])
+            return pca
+
+        # missing values start from the entity means and are replaced by the rank one reconstruction until it
+        # stops changing, relative to the scale of the observed values
+        observed = ~missing
+        means = np.where(missing, 0, values).sum(axis=0) / np.maximum(observed.sum(axis=0), 1)
+        values = np.where(missing, means.astype(values.dtype), values)
+        scale = max(np.abs(values[observed]).max(initial=0), 1e-12)
+        for _ in range(max_iter):
+            pca.fit(values)
+            filled = pca.inverse_transform(pca.transform(values))[missing]
+            change = np.abs(filled - values[missing]).max()
+            values[missing] = filled
+            if change <= tol * scale:
+                break
+        pca.components_ *= _loading_sign(pca.components_[0])
+        return pca
+
+    def _power_iteration(self, values, init):
+        # PC1 of the centred slice by power iteration from the previous loadings, None if it would not converge
+        # within the cost of fitting from scratch (about n k^2 operations, an iteration costs about 4 n k)
+        n, k = values.shape
+        if n < 2:
+            return None
+        mean = values.mean(axis=0)
+        centred = values - mean
+        component = init.astype(values.dtype) / np.linalg.norm(init)
+        tol = np.sqrt(np.finfo(values.dtype).eps)
+        max_iter = max(10, k // 4)
+        change = np.inf
+        for n_iter in range(1, max_iter + 1):
+            updated = centred.T @ (centred @ component)
+            norm = np.linalg.norm(updated)
+            if not norm > 0:
+                return None
+            updated /= norm
+            # the error of the loadings is about change * rate / (1 - rate), rate being the ratio of the second to
+            # the first eigenvalue as estimated from successive changes
+            difference = np.linalg.norm(updated - component)
+            rate, change = difference / change, difference
+            component = updated
+            if change <= tol and change * rate <= tol * (1 - rate):
+                break
+            if n_iter >= 3 and (rate >= 1 or n_iter + np.log(tol * (1 - rate) / change) / np.log(rate) > max_iter):
+                return None
+        else:
+            return None
+        component *= _loading_sign(component)
+
+        projected = centred @ component
+        explained = projected @ projected / (n - 1)
+        total = np.einsum("ij,ij->", centred, centred) / (n - 1)
+        pca = PCA(n_components=1, random_state=self.random_state)
+        pca.n_features_in_, pca.n_samples_, pca.n_components_ = k, n, 1
+        pca.mean_ = mean
+        pca.components_ = component[np.newaxis, :]
+        pca.explained_variance_ = np.array([explained], dtype=values.dtype)
+        pca.explained_variance_ratio_ = pca.explained_variance_ / total
+        pca.singular_values_ = np.sqrt(pca.explained_variance_ * (n - 1))
+        pca.noise_variance_ = (total - explained) / (min(n, k) - 1) if min(n, k) > 1 else 0.0
+        return pca
+
+    def _score_pathway(self, model, values):
+        missing = utils.missing_mask(values, self.nan_policy)
+        if missing is None and not isinstance(values, np.ndarray):
+            # sparse slices are projected without centring them, PCA only accepts sparse input from scikit-learn 1.4
+            component = model.components_[0]
+            return np.asarray(values @ component).ravel() - model.mean_ @ component
+        if missing is None:
+            return model.transform(values)[:, 0]
+
+        # samples with missing values are scored by least squares on the loadings of their observed entities
+        rows = missing.any(axis=1)
+        scores = np.empty(values.shape[0], dtype=values.dtype)
+        if not rows.all():
+            scores[~rows] = model.transform(values[~rows])[:, 0]
+        component = model.components_[0]
+        centred = values[rows] - model.mean_
+        centred[missing[rows]] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores[rows] = (centred @ component) / ((~missing[rows]) @ component ** 2)
+        return scores
+
+    def _set_fitted(self, groups, models):
+        # fitted models of unique column sets, as returned by group_pathways, shared by their pathways
+        fitted = {k: (model, positions) for (positions, pathways), model in zip(groups, models) for k in pathways}
+        self.pathway_ids, self.fitted_models = [], []
+        fitted_ids, positions, loadings = [], [], []
+        for pathway in self.pathways:
+            if pathway in fitted:
+                pca, columns = fitted[pathway]
                 self.pathway_ids.append(pathway)
-                pca = PCA(n_components=1, random_state=self.random_state)
-                self.fitted_models.append(pca.fit(single_pathway_matrix.to_numpy()))
+                self.fitted_models.append(pca)
 
                 # use loadings for PC1 molecular importances within the pathway
-                loadings = pca.components_[0]
-                self.molecular_importance[pathway] = pd.DataFrame(loadings, index=single_pathway_matrix.columns, columns=['PC1_Loadings'])
+                fitted_ids.append(pathway)
+                positions.append(columns)
+                loadings.append(pca.components_[0])
+        self.molecular_importance = self._molecular_importance(fitted_ids, positions, loadings)
 
         self.pathways_filt = {k: v for k, v in self.pathways.items() if k in self.pathway_ids}
         self.is_fitted_ = True
-        return self
     
+    def partial_fit(self, X, y=None):
+        """
+        Incrementally fit the model with a batch of samples.
+
+        The mean and scatter (centred cross-product) matrix of each pathway are updated with the batch (Chan et al.
+        parallel algorithm) and the leading component is recomputed from the scatter matrix, so the cost of an
+        update depends on the batch and pathway sizes but not on the number of samples seen so far. Loadings and
+        scores match fit on the concatenated batches up to floating point error. Pathways are selected on the
+        first batch and later batches must contain the same entities. Incrementally fitted models score through
+        packed parameters (see sspa.serialization) rather than fitted_models; calling fit starts over, and calling
+        partial_fit after fit continues from the data passed to fit (as IncrementalPCA does), which must have been
+        kept (keep_X=True); loaded models cannot be updated. Statistics
+        are accumulated in float64 whatever the dtype, which only sets the precision of the packed parameters.
+        Batches with missing values raise a ValueError, whatever the nan_policy: use fit with nan_policy='omit'.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            self : object
+        """
+        utils.check_nan_policy(self.nan_policy)
+        if getattr(self, "n_samples_seen_", None) is None and getattr(self, "is_fitted_", False):
+            # a model fitted with fit first accumulates the scatter matrices of its training data
+            training = getattr(self, "X_", None)
+            if training is None:
+                raise ValueError("partial_fit can only update a model fitted with keep_X=True, start from a new "
+                                 "estimator")
+            self.is_fitted_ = False
+            self.partial_fit(training)
+        if getattr(self, "n_samples_seen_", None) is None:
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+            self.dtype_ = resolve_dtype(self.dtype)
+            positions = {k: np.flatnonzero(X.columns.isin(v)) for k, v in self.pathways.items()}
+            positions = {k: v for k, v in positions.items() if len(v) >= self.min_entity}
+            self.pathway_ids = list(positions)
+            self.pathways_filt = {k: self.pathways[k] for k in self.pathway_ids}
+            self.fitted_models = []
+            self.pathway_positions_ = list(positions.values())
+            self.pathway_means_ = [np.zeros(len(v)) for v in self.pathway_positions_]
+            self.pathway_scatter_ = [np.zeros((len(v), len(v))) for v in self.pathway_positions_]
+            self.n_samples_seen_ = 0
+
+        order = X.columns.get_indexer(self.feature_names_in_)
+        if (order < 0).any():
+            raise ValueError("X is missing %d entities seen in earlier batches" % (order < 0).sum())
+        values = X.to_numpy(dtype=float)[:, order]
+        if np.isnan(values).any():
+            # the scatter matrices have no masked form, a single missing value would make them all NaN
+            raise ValueError("partial_fit does not support missing values (nan_policy=%r), impute them or use fit "
+                             "with nan_policy='omit'" % self.nan_policy)
+        n_a, n_b = self.n_samples_seen_, values.shape[0]
+        n = n_a + n_b
+        mean_b = values.mean(axis=0)
+        centred = values - mean_b
+
+        def update_pathway(i):
+            positions = self.pathway_positions_[i]
+            with instrumentation.span("fit_pathway", method="sspa_SVD", pathway=self.pathway_ids[i],
+                                      n_samples=n_b, n_entities=len(positions)):
+                batch = centred[:, positions]
+                delta = mean_b[positions] - self.pathway_means_[i]
+                self.pathway_scatter_[i] += batch.T @ batch + np.outer(delta, delta) * (n_a * n_b / n)
+                self.pathway_means_[i] += delta * n_b / n
+                return self._leading_component(self.pathway_scatter_[i])
+
+        plan = memory.plan("sspa_SVD", "fit", X, self.pathways_filt)
+        self.memory_plans_ = {"fit": plan}
+        with plan.measure(), instrumentation.span("partial_fit", method="sspa_SVD", n_samples=n_b, n_features=X.shape[1]):
+            components = plan.map(update_pathway, range(len(self.pathway_ids)))
+
+        self.n_samples_seen_ = self.n_samples_fit_ = n
+        self._set_packed(self.pathway_positions_, self.pathway_means_, components, n)
+        self.X_ = None
+        self.y_ = y
+        self.is_fitted_ = True
+        return self
+
     def transform(self, X, y=None):
             
         """
@@ -70,16 +459,78 @@ class sspa_SVD(BaseEstimator):
             # Check if fit has been called
         check_is_fitted(self, 'is_fitted_')
 
+        if getattr(self, "packed_", None) is not None:
+            scores_df = self.packed_.transform(X)
+            self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=self.packed_.plan_)
+            return scores_df
+
         # For each fitted model, transform the data
-        scores = []
-        for n, compounds in enumerate(self.pathways_filt.values()):
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            new_data = self.fitted_models[n].transform(single_pathway_matrix.to_numpy())
-            scores.append(new_data[:, 0])
-        scores_df = pd.DataFrame(scores, columns=X.index, index=self.pathway_ids).T
+        # pathways sharing a fitted model and aligned column set are scored once
+        dtype = getattr(self, "dtype_", np.dtype(np.float64))
+        models = dict(zip(self.pathway_ids, self.fitted_models))
+        groups = utils.group_pathways(self.pathways_filt, X.columns, tags={k: id(m) for k, m in models.items()})
+        plan = memory.plan("sspa_SVD", "transform", X, self.pathways_filt,
+                           itemsize=dtype.itemsize)
+        self.memory_plans_ = dict(getattr(self, "memory_plans_", {}), transform=plan)
+        # sparse data is sliced into sparse sample blocks and pathway submatrices
+        sparse = utils.sparse_values(X)
+        blocks = []
+        with plan.measure(), instrumentation.span("transform", method="sspa_SVD", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            for rows in plan.sample_blocks():
+                if sparse is None:
+                    X_block = X.iloc[rows]
+                else:
+                    X_block = sparse[rows] if plan.sample_block < plan.n_samples else sparse
+
+                def transform_pathway(group):
+                    positions, pathways = group
+                    with instrumentation.span("transform_pathway", method="sspa_SVD", pathway=pathways[0], n_pathways=len(pathways),
+                                              n_samples=X_block.shape[0], n_entities=len(positions)):
+                        if sparse is None:
+                            single_pathway_matrix = X_block.iloc[:, positions].to_numpy(dtype=dtype)
+                        else:
+                            single_pathway_matrix = X_block[:, positions].astype(dtype)
+                        return self._score_pathway(models[pathways[0]], single_pathway_matrix)
+
+                blocks.append(plan.map(transform_pathway, groups))
+        group_scores = [np.concatenate(pathway_scores) for pathway_scores in zip(*blocks)]
+        scores = {k: v for (_, pathways), v in zip(groups, group_scores) for k in pathways}
+        scores = [scores[k] for k in self.pathway_ids]
+        scores_df = utils.scores_frame(scores, X.index, self.pathway_ids)
 
         return scores_df
     
+    def _molecular_importance(self, pathway_ids, positions, loadings):
+        indptr = np.r_[0, np.cumsum([len(p) for p in positions], dtype=np.int64)]
+        return MolecularImportance(self.feature_names_in_, pathway_ids, indptr,
+                                   np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64),
+                                   np.concatenate(loadings) if loadings else np.zeros(0))
+
+    def save(self, path):
+        """
+        Save the parameters needed to transform new data to an uncompressed .npz file.
+        See sspa.serialization for the format.
+
+        Args:
+            path (str): output file path
+        """
+        check_is_fitted(self, 'is_fitted_')
+        serialization.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model saved with save. The loaded model can transform new data but not be refitted.
+
+        Args:
+            path (str): path of the saved model
+            mmap (bool): memory-map the parameter arrays instead of reading them into memory
+            Returns:
+            fitted sspa_SVD
+        """
+        return serialization.load(path, mmap=mmap, cls=cls)
+
     def fit_transform(self, X, y=None):
             
             """
@@ -108,18 +559,25 @@ class sspa_SVD(BaseEstimator):
         self.X_ = X
         self.y_ = y
 
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
         scores = []
+        fitted_ids, positions, loadings = [], [], []
         for pathway, compounds in self.pathways.items():
             single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
             if single_pathway_matrix.shape[1] >= self.min_entity:
                 self.pathway_ids.append(pathway)
                 pca = PCA(n_components=1, random_state=self.random_state)
-                scores.append(pca.fit_transform(single_pathway_matrix)[:, 0])
+                score = pca.fit_transform(single_pathway_matrix)[:, 0]
+                sign = _loading_sign(pca.components_[0])
+                pca.components_ *= sign
+                scores.append(score * sign)
 
                 # use loadings for PC1 molecular importances within the pathway
-                loadings = pca.components_[0]
-                self.molecular_importance[pathway] = pd.DataFrame(loadings, index=single_pathway_matrix.columns, columns=['PC1_Loadings'])
+                fitted_ids.append(pathway)
+                positions.append(np.flatnonzero(X.columns.isin(compounds)))
+                loadings.append(pca.components_[0])
 
+        self.molecular_importance = self._molecular_importance(fitted_ids, positions, loadings)
         scores_df = pd.DataFrame(scores, columns=X.index, index=self.pathway_ids).T
         self.is_fitted_ = True
         return scores_df
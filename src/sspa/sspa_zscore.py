@@ -3,27 +3,36 @@ import pandas as pd
 import numpy as np
 import scipy.stats as stats
 import sspa.utils as utils
+from sspa import instrumentation, memory, serialization
+from sspa.config import resolve_dtype
 from sklearn.utils.validation import check_is_fitted
 from sklearn.base import BaseEstimator
 
 class sspa_zscore(BaseEstimator):
     """
-    Lee at al 2008 z-score method for single sample pathway analysis
+    Lee at al 2008 z-score method for single sample pathway analysis.
+    Sparse input (a DataFrame of sparse columns, see sspa.utils.sparse_values) is scored without being densified.
     Args:
         mat (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
         Do not include metadata columns
         pathways (pd.DataFrame): Dictionary of pathway identifiers (keys) and corresponding list of pathway entities (values).
         Entity identifiers must match those in the matrix columns
         min_entity (int): minimum number of metabolites mapping to pathways for ssPA to be performed
-
+        dtype (str): 'float32' or 'float64', floating point type the z-scores are computed in. Default is the dtype set
+        with sspa.set_config, float64 if none is set
+        nan_policy (str): 'propagate' (default) gives NaN scores for pathways with missing values, 'omit' leaves missing
+        values out of the entity statistics and sums each sample's z-scores over its observed pathway members, divided
+        by the square root of their number
 
     Returns:
         pandas DataFrame of pathway scores derived using the z-score method. Columns represent pathways and rows represent samples.
     """
 
-    def __init__(self, pathway_df, min_entity=2):
+    def __init__(self, pathway_df, min_entity=2, dtype=None, nan_policy="propagate"):
         self.pathway_df = pathway_df
         self.min_entity = min_entity
+        self.dtype = dtype
+        self.nan_policy = nan_policy
         self.pathways = utils.pathwaydf_to_dict(pathway_df)
         self.pathways_filt = {}
         self.fitted_models = []
@@ -39,9 +48,85 @@ class sspa_zscore(BaseEstimator):
             Returns: 
             self : object
         """
+        utils.check_nan_policy(self.nan_policy)
         self.X_ = X
         self.y_ = y
+        self.dtype_ = resolve_dtype(self.dtype)
+        # z-scores are computed from the statistics of the data being transformed
+        self.mean_ = None
+        self.var_ = None
+        self.n_samples_seen_ = None
+        self.packed_ = None
+
+        self.is_fitted_ = True
+        return self
+
+    def partial_fit(self, X, y=None):
+        """
+        Update running per-entity means and variances with a batch of samples (Chan et al. parallel algorithm).
+        After partial_fit, transform computes z-scores from the accumulated statistics instead of those of the
+        data being transformed, so scoring the whole cohort matches fit_transform on the concatenated batches.
+        Calling fit discards the accumulated statistics, and calling partial_fit after fit continues from the
+        statistics of the data passed to fit (as IncrementalPCA does); loaded models cannot be updated. Statistics are
+        accumulated in float64 whatever the dtype. With nan_policy='omit' each entity counts its observed values only.
+
+        Args:
+            X (pd.DataFrame): pandas DataFrame omics data matrix consisting of m rows (samples) and n columns (entities).
+            Do not include metadata columns
+            Returns:
+            self : object
+        """
+        utils.check_nan_policy(self.nan_policy)
+        if getattr(self, "n_samples_seen_", None) is None and getattr(self, "is_fitted_", False):
+            # a model fitted with fit first accumulates the statistics of its training data
+            training = getattr(self, "X_", None)
+            if training is None:
+                raise ValueError("partial_fit cannot update a loaded model, start from a new estimator")
+            self.is_fitted_ = False
+            self.partial_fit(training)
+        if getattr(self, "n_samples_seen_", None) is None:
+            self.feature_names_in_ = pd.Index([])
+            self.mean_ = np.zeros(0)
+            self.var_ = np.zeros(0)
+            self.n_samples_seen_ = np.zeros(0, dtype=np.int64)
+            self.dtype_ = resolve_dtype(self.dtype)
 
+        # entities not seen in earlier batches are added with empty statistics
+        new = X.columns.difference(self.feature_names_in_, sort=False)
+        if len(new):
+            self.feature_names_in_ = self.feature_names_in_.append(new)
+            self.mean_ = np.r_[self.mean_, np.zeros(len(new))]
+            self.var_ = np.r_[self.var_, np.zeros(len(new))]
+            self.n_samples_seen_ = np.r_[self.n_samples_seen_, np.zeros(len(new), dtype=np.int64)]
+
+        with instrumentation.span("partial_fit", method="sspa_zscore", n_samples=X.shape[0], n_features=X.shape[1]):
+            positions = self.feature_names_in_.get_indexer(X.columns)
+            values = X.to_numpy(dtype=float)
+            missing = utils.missing_mask(values, self.nan_policy)
+            if missing is not None:
+                # entities are updated with their observed values
+                n_b = (~missing).sum(axis=0)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    mean_b = np.nansum(values, axis=0) / n_b
+                m2_b = np.nansum((values - mean_b) ** 2, axis=0)
+                observed = n_b > 0
+                positions, n_b, mean_b, m2_b = positions[observed], n_b[observed], mean_b[observed], m2_b[observed]
+            elif values.shape[0]:
+                n_b = values.shape[0]
+                mean_b = values.mean(axis=0)
+                m2_b = ((values - mean_b) ** 2).sum(axis=0)
+            if missing is not None or values.shape[0]:
+                n_a = self.n_samples_seen_[positions]
+                n = n_a + n_b
+                delta = mean_b - self.mean_[positions]
+                m2 = self.var_[positions] * n_a + m2_b + delta ** 2 * n_a * n_b / n
+                self.mean_[positions] += delta * n_b / n
+                self.var_[positions] = m2 / n
+                self.n_samples_seen_[positions] = n
+
+        self.X_ = None
+        self.y_ = y
+        self.packed_ = None
         self.is_fitted_ = True
         return self
     
@@ -57,23 +142,120 @@ class sspa_zscore(BaseEstimator):
         """
         check_is_fitted(self, 'is_fitted_')
 
-        scores = []
-        pathway_ids = []
+        if getattr(self, "packed_", None) is not None:
+            with np.errstate(invalid="ignore"):
+                scores_df = self.packed_.transform(X)
+            self.memory_plans_ = {"transform": self.packed_.plan_}
+            return scores_df
+
+        dtype = getattr(self, "dtype_", np.dtype(np.float64))
+        values = utils.sparse_values(X)
+        if values is not None:
+            utils.missing_mask(values, self.nan_policy)
+            return self._transform_sparse(X, values)
 
-        for pathway, compounds in self.pathways.items():
-            single_pathway_matrix = X.drop(X.columns.difference(compounds), axis=1)
-            if single_pathway_matrix.shape[1] >= self.min_entity:
-                pathway_ids.append(pathway)
-                pathway_mat = single_pathway_matrix.T.values
+        running = None
+        if getattr(self, "mean_", None) is not None:
+            running = (self.feature_names_in_.get_indexer(X.columns), self.mean_.astype(dtype),
+                       np.sqrt(self.var_).astype(dtype))
 
-                zscores = stats.zscore(pathway_mat, axis=1)
+        # pathways with identical aligned column sets are scored once
+        groups = utils.group_pathways(self.pathways, X.columns, self.min_entity)
+        self.dedup_report_ = utils.dedup_report(groups)
+
+        def transform_pathway(group):
+            positions, pathways = group
+            with instrumentation.span("transform_pathway", method="sspa_zscore", pathway=pathways[0], n_pathways=len(pathways),
+                                      n_samples=X.shape[0], n_entities=len(positions)):
+                pathway_mat = X.iloc[:, positions].to_numpy(dtype=dtype).T
+                missing = utils.missing_mask(pathway_mat, self.nan_policy)
+
+                if running is None:
+                    zscores = stats.zscore(pathway_mat, axis=1, nan_policy="propagate" if missing is None else "omit")
+                else:
+                    stat_positions, mean, std = running
+                    stat_positions = stat_positions[positions]
+                    if (stat_positions < 0).any():
+                        raise ValueError("Entities of pathway %s were not seen by partial_fit" % pathways[0])
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        zscores = (pathway_mat - mean[stat_positions, None]) / std[stat_positions, None]
+                if missing is not None:
+                    # missing members are left out of the sum and its normalisation
+                    zscores[missing] = 0
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        return zscores.sum(axis=0) / np.sqrt((~missing).sum(axis=0), dtype=dtype)
                 sum_zscore = np.sum(zscores, axis=0)
-                pathway_act = sum_zscore / np.sqrt(pathway_mat.shape[0])
-                scores.append(pathway_act)
+                return sum_zscore / np.sqrt(pathway_mat.shape[0], dtype=dtype)
+
+        plan = memory.plan("sspa_zscore", "transform", X, {ids[0]: self.pathways[ids[0]] for _, ids in groups},
+                           itemsize=dtype.itemsize)
+        self.memory_plans_ = {"transform": plan}
+        scored = {}
+        with plan.measure(), instrumentation.span("transform", method="sspa_zscore", n_samples=X.shape[0], n_features=X.shape[1],
+                                                  unique_sets=len(groups)):
+            for (_, pathways), activity in zip(groups, plan.map(transform_pathway, groups)):
+                scored.update((pathway, activity) for pathway in pathways)
+
+        pathway_ids = [k for k in self.pathways if k in scored]
+        scores = [scored[k] for k in pathway_ids]
 
-        pathway_activities_df = pd.DataFrame(scores, columns=X.index, index=pathway_ids).T
+        pathway_activities_df = utils.scores_frame(scores, X.index, pathway_ids)
         return pathway_activities_df
 
+    def _transform_sparse(self, X, values):
+        # z-scoring a sparse matrix would fill in its zeros, so scores are computed as a linear model of X whose
+        # offsets fold in the centring, see serialization.pack_zscore
+        with instrumentation.span("statistics", method="sspa_zscore", n_samples=X.shape[0], n_features=X.shape[1],
+                                  nnz=values.nnz):
+            if getattr(self, "mean_", None) is not None:
+                stat_positions = self.feature_names_in_.get_indexer(X.columns)
+                seen = stat_positions >= 0
+                mean = np.where(seen, self.mean_[stat_positions], np.nan)
+                var = np.where(seen, self.var_[stat_positions], np.nan)
+            else:
+                n = X.shape[0]
+                mean = np.asarray(values.sum(axis=0)).ravel() / n
+                # squared deviations of the stored values, plus those of the implicit zeros
+                entity = np.repeat(np.arange(values.shape[1]), np.diff(values.indptr))
+                m2 = np.bincount(entity, weights=(values.data - mean[entity]) ** 2, minlength=values.shape[1])
+                var = (m2 + (n - np.diff(values.indptr)) * mean ** 2) / n
+                seen = None
+            packed = serialization.PackedModel(serialization.pack_zscore(
+                self.pathways, X.columns, mean, var, self.min_entity, n_samples_fit=X.shape[0],
+                dtype=getattr(self, "dtype_", np.dtype(np.float64)).name))
+        if seen is not None:
+            unseen = np.flatnonzero(~seen[packed.col_idx])
+            if len(unseen):
+                pathway = packed.pathway_ids[np.searchsorted(packed.indptr, unseen[0], side="right") - 1]
+                raise ValueError("Entities of pathway %s were not seen by partial_fit" % pathway)
+        scores_df = packed.transform(X, values)
+        self.memory_plans_ = {"transform": packed.plan_}
+        return scores_df
+
+    def save(self, path):
+        """
+        Save the reference statistics accumulated by partial_fit to an uncompressed .npz file, packed as a linear
+        model of the pathways with at least min_entity of the entities seen. See sspa.serialization for the format.
+
+        Args:
+            path (str): output file path
+        """
+        check_is_fitted(self, 'is_fitted_')
+        serialization.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model saved with save. The loaded model scores new data against the saved reference statistics.
+
+        Args:
+            path (str): path of the saved model
+            mmap (bool): memory-map the parameter arrays instead of reading them into memory
+            Returns:
+            fitted sspa_zscore
+        """
+        return serialization.load(path, mmap=mmap, cls=cls)
+
     def fit_transform(self, X, y=None):
         """
         Fit the model with X and transform X.
@@ -1,8 +1,16 @@
+import os
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import pkg_resources
-import scipy.stats as stats
-import statsmodels.api as sm
+
+
+def _resource_stream(path):
+    """
+    Opens a data file shipped with the package (binary mode)
+    """
+    return open(os.path.join(os.path.dirname(__file__), path), 'rb')
+
 
 def load_example_data(omicstype="metabolomics", processed=True):
     """
@@ -22,11 +30,11 @@ def load_example_data(omicstype="metabolomics", processed=True):
 
     if omicstype == "metabolomics":
         if processed:
-            stream = pkg_resources.resource_stream(__name__, 'example_data/Su_covid_metabolomics_processed.csv')
+            stream = _resource_stream('example_data/Su_covid_metabolomics_processed.csv')
             f = pd.read_csv(stream, index_col=0, encoding='latin-1')
             return f
         else:
-            stream = pkg_resources.resource_stream(__name__, 'example_data/Su_metab_data_raw.csv')
+            stream = _resource_stream('example_data/Su_metab_data_raw.csv')
             f = pd.read_csv(stream, index_col=0, encoding='latin-1')
             return f
 
@@ -44,6 +52,9 @@ def t_tests(matrix, classes, multiple_correction_method, testtype="ttest"):
     Returns:
         pd.DataFrame containing p-values and corrected p-values for each metabolite
     """
+    import scipy.stats as stats
+    import statsmodels.api as sm
+
     matrix_copy = matrix.copy(deep=True)
     metabolites = matrix_copy.columns.tolist()
     matrix_copy['Target'] = pd.factorize(classes)[0]
@@ -69,14 +80,95 @@ def t_tests(matrix, classes, multiple_correction_method, testtype="ttest"):
     return results
 
 
+# pathway dictionaries (and their PathwaySet) of recently converted pathway DataFrames, by content hash
+_PATHWAY_DICTS = OrderedDict()
+_PATHWAY_DICTS_SIZE = 8
+_pathway_dicts_lock = threading.Lock()
+
+
+def _drops_pathway_set(method):
+    def changed(self, *args, **kwargs):
+        self._pathway_set = None
+        return method(self, *args, **kwargs)
+    return changed
+
+
+class _PathwayDict(dict):
+    """
+    Pathway dictionary carrying the PathwaySet (and so the entity index) built once with the memoized conversion.
+    The PathwaySet is dropped when the dictionary is changed; entity lists should be replaced rather than changed
+    in place
+    """
+    def __init__(self, pathways, pathway_set=None):
+        super().__init__(pathways)
+        self._pathway_set = pathway_set
+
+    __setitem__ = _drops_pathway_set(dict.__setitem__)
+    __delitem__ = _drops_pathway_set(dict.__delitem__)
+    clear = _drops_pathway_set(dict.clear)
+    pop = _drops_pathway_set(dict.pop)
+    popitem = _drops_pathway_set(dict.popitem)
+    setdefault = _drops_pathway_set(dict.setdefault)
+    update = _drops_pathway_set(dict.update)
+    if hasattr(dict, "__ior__"):
+        __ior__ = _drops_pathway_set(dict.__ior__)
+
+
+def _sha1():
+    import hashlib
+
+    # usedforsecurity (a content hash, not a signature) is only accepted from Python 3.9
+    try:
+        return hashlib.sha1(usedforsecurity=False)
+    except TypeError:
+        return hashlib.sha1()
+
+
+def _pathway_df_hash(df):
+    values = df.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    digest = _sha1()
+    digest.update(str(values.shape).encode())
+    digest.update(np.packbits(missing).tobytes())
+    digest.update(pd.util.hash_array(values[~missing], categorize=True).tobytes())
+    for labels in (df.index, df.columns):
+        digest.update(pd.util.hash_pandas_object(labels, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
 def pathwaydf_to_dict(df):
     """
-    Converts pathway dataframe to dictionary, with pathway IDs as keys and metabolite lists as values
+    Converts pathway dataframe to dictionary, with pathway IDs as keys and metabolite lists as values.
+    Conversions are memoized on the content of the DataFrame, so estimators cloned with the same pathways (e.g. in
+    a parameter search) convert them once. The dictionary also carries the PathwaySet built with the conversion,
+    so filter_pathways and group_pathways do not rebuild the entity index on each call
     Args:
-        df (pd.DataFrame): Pandas DataFrame containing pathways 
+        df (pd.DataFrame): Pandas DataFrame containing pathways, or a sspa.pathway_set.PathwaySet
     Returns: 
         python dict pathway representation
     """
+    from sspa.pathway_set import PathwaySet
+    if isinstance(df, PathwaySet):
+        return df.to_dict()
+
+    key = _pathway_df_hash(df)
+    with _pathway_dicts_lock:
+        memoized = _PATHWAY_DICTS.get(key)
+        if memoized is not None:
+            _PATHWAY_DICTS.move_to_end(key)
+    if memoized is None:
+        pathway_dict = _pathwaydf_to_dict(df)
+        memoized = (pathway_dict, PathwaySet.from_dict(pathway_dict))
+        with _pathway_dicts_lock:
+            _PATHWAY_DICTS[key] = memoized
+            while len(_PATHWAY_DICTS) > _PATHWAY_DICTS_SIZE:
+                _PATHWAY_DICTS.popitem(last=False)
+    pathway_dict, pathway_set = memoized
+    # copies, the memoized dictionary is not changed by callers, sharing the memoized PathwaySet
+    return _PathwayDict({k: list(v) for k, v in pathway_dict.items()}, pathway_set)
+
+
+def _pathwaydf_to_dict(df):
     pathways_df = df.drop(["Pathway_name"], axis=1)
     pathway_dict = {}
 
@@ -86,4 +178,200 @@ def pathwaydf_to_dict(df):
 
         if len(pathway_compounds) > 1:
             pathway_dict[pathway] = pathway_compounds
-    return pathway_dict
\ No newline at end of file
+    return pathway_dict
+
+def group_pathways(pathways, columns, min_entity=0, tags=None):
+    """
+    Align pathways to the data columns and group pathways with identical aligned column sets, so each set
+    only has to be fitted and scored once (e.g. parent/child pathways that only differ by unmeasured entities)
+    Args:
+        pathways (dict): pathway dictionary, e.g. as returned by pathwaydf_to_dict
+        columns (pd.Index): data matrix columns
+        min_entity (int): minimum number of aligned columns for a pathway to be included
+        tags (dict): optional hashable tag per pathway; pathways are only grouped if their tags are equal
+    Returns:
+        list of (column positions, list of pathway identifiers) tuples, one per unique set, in order of first appearance.
+        Column positions follow the order of columns, as selected by X.drop(X.columns.difference(members), axis=1)
+    """
+    from sspa.pathway_set import as_pathway_set
+    aligned = as_pathway_set(pathways).align(columns)
+    groups = {}
+    for n, pathway in enumerate(pathways):
+        positions = aligned.indices[aligned.indptr[n]:aligned.indptr[n + 1]].astype(np.int64)
+        if len(positions) < min_entity:
+            continue
+        key = (positions.tobytes(), tags[pathway] if tags is not None else None)
+        if key in groups:
+            groups[key][1].append(pathway)
+        else:
+            groups[key] = (positions, [pathway])
+    return list(groups.values())
+
+
+def filter_pathways(pathways, columns, min_entity):
+    """
+    Keep pathways with at least min_entity members among the data columns
+    Args:
+        pathways (dict): pathway dictionary, e.g. as returned by pathwaydf_to_dict
+        columns (array-like): data matrix columns (or any entity identifiers)
+        min_entity (int): minimum number of members present in columns
+    Returns:
+        pathway dictionary of the pathways kept, in their original order
+    """
+    from sspa.pathway_set import as_pathway_set
+    coverage = as_pathway_set(pathways).coverage(columns).values
+    return {k: v for (k, v), n in zip(pathways.items(), coverage) if n >= min_entity}
+
+
+NAN_POLICIES = ("propagate", "omit")
+
+
+def check_nan_policy(nan_policy):
+    """
+    Raise a ValueError unless nan_policy is 'propagate' or 'omit'
+    """
+    if nan_policy not in NAN_POLICIES:
+        raise ValueError("nan_policy must be one of %s, got %r" % (", ".join(map(repr, NAN_POLICIES)), nan_policy))
+
+
+def missing_mask(values, nan_policy):
+    """
+    Mask of the missing values of a dense pathway submatrix to be omitted. Missing values are not omitted from sparse
+    submatrices, a ValueError is raised if nan_policy is 'omit' and they have NaN values
+    Args:
+        values (np.ndarray or scipy.sparse matrix): pathway submatrix
+        nan_policy (str): 'propagate' or 'omit'
+    Returns:
+        boolean np.ndarray marking NaN values, or None if nan_policy is not 'omit', values is sparse or has no NaN
+    """
+    if nan_policy != "omit":
+        return None
+    if not isinstance(values, np.ndarray):
+        if np.isnan(values.data).any():
+            raise ValueError("nan_policy='omit' is not supported for sparse input with missing values")
+        return None
+    missing = np.isnan(values)
+    return missing if missing.any() else None
+
+
+def scores_frame(scores, index, pathway_ids):
+    """
+    Samples x pathways DataFrame of per-pathway score vectors
+    Args:
+        scores (list): score vector of each pathway
+        index (pd.Index): sample identifiers
+        pathway_ids (list): pathway identifiers, in the order of scores
+    Returns:
+        pd.DataFrame of pathway scores. Columns represent pathways and rows represent samples.
+    """
+    if not len(scores):
+        return pd.DataFrame(scores, columns=index, index=pathway_ids).T
+    # stacked as columns, a frame built from the vectors as rows would have one column per sample
+    return pd.DataFrame(np.column_stack(scores), index=index, columns=pathway_ids)
+
+
+def dedup_report(groups):
+    """
+    Summarise the work saved by grouping pathways with identical aligned column sets
+    Args:
+        groups (list): pathway groups, as returned by group_pathways
+    Returns:
+        dict with the number of pathways, unique column sets and fits (or scorings) saved
+    """
+    n_pathways = sum(len(ids) for _, ids in groups)
+    return {"pathways": n_pathways, "unique_sets": len(groups), "saved": n_pathways - len(groups),
+            "saved_fraction": (n_pathways - len(groups)) / n_pathways if n_pathways else 0.0}
+
+
+def previous_fit(model):
+    """
+    Fitted models of a per-pathway estimator, to warm start its next fit
+    Args:
+        model: sspa_SVD, sspa_KPCA or sspa_ssClustPA estimator
+    Returns:
+        dict of pathway identifier: (aligned training columns as pd.Index, fitted model). Empty if the estimator is not
+        fitted or scores through packed parameters
+    """
+    models = dict(zip(getattr(model, "pathway_ids", []), getattr(model, "fitted_models", [])))
+    if not models or getattr(model, "packed_", None) is not None:
+        return {}
+    columns = pd.Index(model.feature_names_in_)
+    groups = group_pathways({k: model.pathways_filt[k] for k in models}, columns,
+                            tags={k: id(m) for k, m in models.items()})
+    return {k: (columns[positions], models[k]) for positions, pathways in groups for k in pathways}
+
+
+def warm_start_model(previous, columns, pathways):
+    """
+    Previous model of a pathway group whose aligned column set has not changed
+    Args:
+        previous (dict): previous fit, as returned by previous_fit
+        columns (pd.Index): aligned columns of the group in the new data
+        pathways (list): pathway identifiers of the group
+    Returns:
+        (fitted model, positions of columns in its training columns), or (None, None) if no pathway of the group was
+        fitted on the same column set
+    """
+    for pathway in pathways:
+        if pathway in previous:
+            fitted_columns, model = previous[pathway]
+            if len(fitted_columns) == len(columns) and fitted_columns.is_unique:
+                order = fitted_columns.get_indexer(columns)
+                if (order >= 0).all():
+                    return model, order
+    return None, None
+
+
+def sparse_values(X, format="csc"):
+    """
+    Sparse matrix of a sparse data matrix, e.g. one built with pd.DataFrame.sparse.from_spmatrix(matrix, index=samples,
+    columns=entities), so methods can slice and score it without densifying it
+    Args:
+        X (pd.DataFrame): data matrix (samples x entities)
+        format (str): scipy.sparse format, 'csc' (fast pathway column slices) or 'csr' (fast sample blocks)
+    Returns:
+        scipy.sparse matrix, or None if X is not sparse (every column of a SparseDtype with fill value 0)
+    """
+    if not isinstance(X, pd.DataFrame) or X.shape[1] == 0:
+        return None
+    if not all(isinstance(dtype, pd.SparseDtype) and dtype.fill_value == 0 for dtype in X.dtypes):
+        return None
+    import scipy.sparse as sp
+
+    # the stored values and row indices of each column are the CSC data and indices, assembled without the
+    # intermediate COO copy of DataFrame.sparse.to_coo
+    columns = [column.array for _, column in X.items()]
+    indptr = np.r_[0, np.cumsum([column.sp_index.npoints for column in columns], dtype=np.int64)]
+    data = np.concatenate([column.sp_values for column in columns])
+    indices = np.concatenate([column.sp_index.indices for column in columns])
+    return sp.csc_matrix((data, indices, indptr), shape=X.shape).asformat(format)
+
+
+def fingerprint(X):
+    """
+    Content hash of a data matrix, its values and sample and entity labels, to key caches of results computed
+    from it. Hashing reads the data once, about an order of magnitude faster than ranking or fitting it
+    Args:
+        X (pd.DataFrame or np.ndarray): data matrix (samples x entities), dense or sparse (see sparse_values)
+    Returns:
+        str hex digest
+    """
+    digest = _sha1()
+    sparse = sparse_values(X)
+    if sparse is not None:
+        arrays = [sparse.data, sparse.indices, sparse.indptr]
+    else:
+        values = X.to_numpy() if isinstance(X, pd.DataFrame) else np.asarray(X)
+        arrays = [values]
+    for array in arrays:
+        digest.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+        if array.ndim == 2 and not array.flags.f_contiguous:
+            # values are hashed in column-major order whatever their layout, a few columns at a time
+            for start in range(0, array.shape[1], 64):
+                digest.update(memoryview(np.asfortranarray(array[:, start:start + 64]).T).cast("B"))
+        else:
+            digest.update(memoryview(np.asfortranarray(array).T).cast("B"))
+    if isinstance(X, pd.DataFrame):
+        for labels in (X.index, X.columns):
+            digest.update(pd.util.hash_pandas_object(labels, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,47 @@
+from sspa.cli import main
+from sspa.pathway_set import PathwaySet
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestCLI():
+    rng = np.random.default_rng(4)
+    mat = pd.DataFrame(rng.normal(size=(40, 8)), columns=list("ABCDEFGH"), index=["S%02d" % i for i in range(40)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "G"], 3: [None, "H", None]}, index=["P1", "P2", "P3"])
+
+    def write_inputs(self, tmp_path):
+        self.mat.to_csv(tmp_path / "data.csv")
+        PathwaySet.from_wide(self.pathway_df).to_gmt(str(tmp_path / "pathways.gmt"))
+        return str(tmp_path / "data.csv"), str(tmp_path / "pathways.gmt")
+
+    @pytest.mark.parametrize("method", ["zscore", "svd", "kpca"])
+    def test_chunked_score_matches_full(self, tmp_path, method):
+        data, pathways = self.write_inputs(tmp_path)
+        out = str(tmp_path / "scores.csv")
+        assert main(["score", data, "-p", pathways, "-m", method, "--chunk-size", "7", "-o", out, "-q",
+                     "--timings", str(tmp_path / "timings.json")]) == 0
+        cls = {"zscore": "sspa_zscore", "svd": "sspa_SVD", "kpca": "sspa_KPCA"}[method]
+        import sspa
+        expected = getattr(sspa, cls)(self.pathway_df).fit_transform(self.mat)
+        scores = pd.read_csv(out, index_col=0)
+        np.testing.assert_allclose(scores.values, expected.values, atol=1e-10)
+        assert scores.index.tolist() == expected.index.tolist()
+        assert (tmp_path / "timings.json").exists()
+
+    def test_saved_model(self, tmp_path):
+        data, pathways = self.write_inputs(tmp_path)
+        main(["score", data, "-p", pathways, "-m", "svd", "-o", str(tmp_path / "a.csv"),
+              "--save-model", str(tmp_path / "model.npz"), "-q"])
+        main(["score", data, "-m", "svd", "--model", str(tmp_path / "model.npz"), "-o", str(tmp_path / "b.csv"), "-q"])
+        pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "a.csv"), pd.read_csv(tmp_path / "b.csv"))
+
+    def test_pathways_build_and_errors(self, tmp_path, capsys):
+        _, pathways = self.write_inputs(tmp_path)
+        main(["pathways", "build", "--source", "gmt", "--input", pathways, "-o", str(tmp_path / "copy.gmt"), "-q"])
+        assert (tmp_path / "copy.gmt").read_bytes() == (tmp_path / "pathways.gmt").read_bytes()
+        with pytest.raises(SystemExit) as error:
+            main(["score", "data.csv", "-p", "unknown", "-m", "svd", "-o", "out.csv"])
+        assert error.value.code == 2
+        assert "Unknown pathway source" in capsys.readouterr().err
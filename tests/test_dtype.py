@@ -0,0 +1,60 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestDtype():
+    rng = np.random.default_rng(3)
+    mat = pd.DataFrame(rng.normal(loc=5, size=(80, 12)), columns=list("ABCDEFGHIJKL"),
+                       index=["S%02d" % i for i in range(80)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "D", "A"], 1: ["B", "E", "H"],
+                               2: ["C", "F", "I"], 3: [None, "G", "J"], 4: [None, None, "K"]},
+                              index=["P1", "P2", "P3"])
+
+    def assert_close(self, scores, expected):
+        # the sign of a component is arbitrary when its largest loadings tie, compare up to sign
+        assert (scores.dtypes == np.float32).all()
+        signs = np.sign((scores.to_numpy(dtype=float) * expected.to_numpy()).sum(axis=0))
+        scale = np.abs(expected.to_numpy()).max()
+        np.testing.assert_allclose(scores.to_numpy(dtype=float) * signs, expected.to_numpy(), atol=1e-4 * scale)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_zscore, sspa.sspa_SVD, sspa.sspa_KPCA, sspa.sspa_ssClustPA])
+    def test_float32_matches_float64(self, model):
+        expected = model(self.pathway_df).fit_transform(self.mat)
+        assert (expected.dtypes == np.float64).all()
+        scores = model(self.pathway_df, dtype="float32").fit_transform(self.mat)
+        self.assert_close(scores, expected)
+
+    def test_config(self):
+        expected = sspa.sspa_SVD(self.pathway_df).fit_transform(self.mat)
+        with sspa.config_context(dtype="float32"):
+            model = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+        # the fitted dtype is kept outside the context
+        self.assert_close(model.transform(self.mat), expected)
+        with pytest.raises(ValueError):
+            sspa.set_config(dtype="int32")
+
+    @pytest.mark.parametrize("model", [sspa.sspa_SVD, sspa.sspa_KPCA, sspa.sspa_ssClustPA])
+    def test_saved_float32(self, tmp_path, model):
+        fitted = model(self.pathway_df, dtype="float32").fit(self.mat)
+        path = str(tmp_path / "model.npz")
+        fitted.save(path)
+        loaded = model.load(path)
+        assert loaded.packed_.arrays["X_fit" if model is sspa.sspa_KPCA else "weight"].dtype == np.float32
+        scores = loaded.transform(self.mat)
+        assert (scores.dtypes == np.float32).all()
+        np.testing.assert_allclose(scores, fitted.transform(self.mat), rtol=1e-4, atol=1e-4)
+
+    def test_partial_fit_float32(self):
+        expected = sspa.sspa_zscore(self.pathway_df).fit_transform(self.mat)
+        model = sspa.sspa_zscore(self.pathway_df, dtype="float32")
+        for rows in np.array_split(np.arange(len(self.mat)), 4):
+            model.partial_fit(self.mat.iloc[rows])
+        self.assert_close(model.transform(self.mat), expected)
+
+    def test_multi_float32(self):
+        expected = sspa.sspa_multi(self.pathway_df).fit_transform(self.mat)
+        scores = sspa.sspa_multi(self.pathway_df, dtype="float32").fit_transform(self.mat)
+        for method in ["zscore", "svd", "cluster", "kpca"]:
+            self.assert_close(scores[method], expected[method])
@@ -0,0 +1,49 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def running_sum(metric, members, weight, statistic):
+    # the full running sum over the ranking, ties in reverse column order as gseapy
+    order = np.argsort(metric, kind="stable")[::-1]
+    hit = np.isin(order, members)
+    steps = np.abs(metric[order]) ** weight
+    with np.errstate(invalid="ignore"):
+        walk = np.cumsum(np.where(hit, steps, 0)) / steps[hit].sum() - np.cumsum(~hit) / (~hit).sum()
+    if statistic == "sum":
+        return walk.sum()
+    return walk.max() if abs(walk.max()) > abs(walk.min()) else walk.min()
+
+
+class TestEnrichment():
+    rng = np.random.default_rng(9)
+    metric = rng.normal(size=(6, 80))
+    metric[2] = np.round(metric[2])
+    sets = np.split(rng.permutation(80)[:56], [1, 4, 16])
+
+    @pytest.mark.parametrize("statistic", sspa.enrichment.STATISTICS)
+    @pytest.mark.parametrize("weight", [0, 0.25, 1])
+    def test_matches_running_sum(self, statistic, weight):
+        scores = sspa.enrichment.enrichment_scores(self.metric, self.sets, weight, statistic, backend="numpy")
+        expected = [[running_sum(m, s, weight, statistic) for s in self.sets] for m in self.metric]
+        np.testing.assert_allclose(scores, expected, rtol=1e-12, atol=1e-12)
+
+    @pytest.mark.parametrize("statistic", sspa.enrichment.STATISTICS)
+    def test_numba_matches_numpy(self, statistic):
+        pytest.importorskip("numba")
+        np.testing.assert_array_equal(
+            sspa.enrichment.enrichment_scores(self.metric, self.sets, 0.25, statistic, backend="numba"),
+            sspa.enrichment.enrichment_scores(self.metric, self.sets, 0.25, statistic, backend="numpy"))
+
+    def test_ssgsea_native(self):
+        mat = pd.DataFrame(self.metric, columns=["E%02d" % i for i in range(80)], index=["S%d" % i for i in range(6)])
+        # gseapy's columns are sorted
+        pathway_df = pd.DataFrame([["E%02d" % i for i in s] + [None] * (40 - len(s)) for s in self.sets[1:]],
+                                  index=["P3", "P1", "P2"])
+        pathway_df.insert(0, "Pathway_name", pathway_df.index)
+        native = sspa.sspa_ssGSEA(pathway_df, backend="native").fit_transform(mat)
+        pd.testing.assert_frame_equal(native, sspa.sspa_ssGSEA(pathway_df).fit_transform(mat), check_names=False,
+                                      atol=1e-12)
+        with pytest.raises(ValueError):
+            sspa.sspa_ssGSEA(pathway_df, backend="rust").fit_transform(mat)
@@ -0,0 +1,69 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.base import clone
+
+
+class TestFitCache():
+    rng = np.random.default_rng(6)
+    mat = pd.DataFrame(rng.normal(loc=5, size=(30, 10)), columns=list("ABCDEFGHIJ"),
+                       index=["S%02d" % i for i in range(30)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "D", "A"], 1: ["B", "E", "H"],
+                               2: ["C", "F", "I"], 3: [None, "G", "J"]}, index=["P1", "P2", "P3"])
+
+    @pytest.mark.parametrize("model", [sspa.sspa_SVD, sspa.sspa_KPCA, sspa.sspa_ssClustPA])
+    def test_clones_share_fits(self, model):
+        expected = model(self.pathway_df).fit_transform(self.mat)
+        with sspa.config_context(fit_cache="100MB"):
+            cache = sspa.fit_cache.get_cache()
+            cache.clear()
+            hits, misses = cache.hits, cache.misses
+            estimator = model(self.pathway_df)
+            estimator.fit(self.mat)
+            restored = clone(estimator).fit(self.mat.copy())
+            assert cache.hits - hits == 1 and cache.misses - misses == 1
+            assert restored.pathway_ids is not estimator.pathway_ids
+            assert restored.fitted_models[0] is not estimator.fitted_models[0]
+            pd.testing.assert_frame_equal(restored.transform(self.mat), expected)
+            # other hyperparameters, data or pathways are fitted
+            clone(estimator).set_params(min_entity=4).fit(self.mat)
+            clone(estimator).fit(self.mat.iloc[:20])
+            model(self.pathway_df.iloc[:2]).fit(self.mat)
+            assert cache.misses - misses == 4
+        assert sspa.fit_cache.get_cache() is None
+
+    def test_disk_tier(self, tmp_path):
+        expected = sspa.sspa_SVD(self.pathway_df).fit_transform(self.mat)
+        with sspa.config_context(fit_cache="100MB", fit_cache_dir=str(tmp_path)):
+            sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+            assert len(list(tmp_path.glob("*.npz"))) == 1
+            cache = sspa.fit_cache.get_cache()
+            cache.clear()
+            restored = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+            assert cache.disk_hits == 1
+            pd.testing.assert_frame_equal(restored.transform(self.mat), expected)
+            cache.clear(disk=True)
+            assert not list(tmp_path.glob("*.npz"))
+
+    def test_partial_fit_state_not_restored(self):
+        with sspa.config_context(fit_cache="100MB"):
+            sspa.fit_cache.get_cache().clear()
+            sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+            estimator = sspa.sspa_SVD(self.pathway_df).partial_fit(self.mat.iloc[:10]).fit(self.mat)
+            assert getattr(estimator, "n_samples_seen_", None) is None
+            assert not hasattr(estimator, "pathway_scatter_")
+
+    def test_memory_bound(self):
+        with sspa.config_context(fit_cache=1):
+            cache = sspa.fit_cache.get_cache()
+            sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+            assert cache.info()["entries"] == 0
+
+    def test_pathway_dict_memoized(self):
+        pathways = sspa.utils.pathwaydf_to_dict(self.pathway_df)
+        pathways["P1"].append("Z")
+        assert sspa.utils.pathwaydf_to_dict(self.pathway_df.copy()) == sspa.utils._pathwaydf_to_dict(self.pathway_df)
+        changed = self.pathway_df.copy()
+        changed.loc["P1", 3] = "D"
+        assert sorted(sspa.utils.pathwaydf_to_dict(changed)["P1"]) == ["A", "B", "C", "D"]
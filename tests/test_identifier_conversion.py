@@ -0,0 +1,98 @@
+from sspa.identifier_conversion import identifier_conversion, ConversionCache, CrossReferenceIndex
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import pandas as pd
+import pytest
+
+STUB_IDS = {"glucose": "CHEBI:4167", "lactate": "CHEBI:24996", "alanine": "CHEBI:16449"}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        names = [i for i in body["queryList"].split(";") if i]
+        StubHandler.requests_seen.append(names)
+        resp = {"Query": names, "Match": [i if i in STUB_IDS else "NA" for i in names], "ChEBI": [STUB_IDS.get(i, "NA") for i in names]}
+        data = json.dumps(resp).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/api/mapcompounds" % server.server_port
+    server.shutdown()
+
+
+class TestIdentifierConversion():
+
+    def test_batched_requests(self, stub_url):
+        res = identifier_conversion("name", ["glucose", "lactate", "alanine"], batch_size=2, cache=False, url=stub_url)
+        assert sorted(len(i) for i in StubHandler.requests_seen) == [1, 2]
+        assert res["Query"].tolist() == ["glucose", "lactate", "alanine"]
+        assert res["ChEBI"].tolist() == ["CHEBI:4167", "CHEBI:24996", "CHEBI:16449"]
+
+    def test_cache_consulted_before_network(self, stub_url, tmp_path):
+        cache = ConversionCache(str(tmp_path / "cache.sqlite"))
+        identifier_conversion("name", ["glucose", "lactate"], cache=cache, url=stub_url)
+        res = identifier_conversion("name", ["lactate", "glucose", "alanine"], cache=cache, url=stub_url)
+        assert StubHandler.requests_seen == [["glucose", "lactate"], ["alanine"]]
+        assert res["ChEBI"].tolist() == ["CHEBI:24996", "CHEBI:4167", "CHEBI:16449"]
+        assert len(ConversionCache(cache.path)) == 3
+
+    def test_misses_not_cached(self, stub_url, tmp_path):
+        cache = ConversionCache(str(tmp_path / "cache.sqlite"))
+        identifier_conversion("name", ["glucose", "unknown"], cache=cache, url=stub_url)
+        res = identifier_conversion("name", ["glucose", "unknown"], cache=cache, url=stub_url)
+        assert StubHandler.requests_seen == [["glucose", "unknown"], ["unknown"]]
+        assert res["ChEBI"].tolist() == ["CHEBI:4167", "NA"]
+        assert len(cache) == 1
+
+    def test_offline_local_table(self):
+        local = pd.DataFrame({"Query": ["glucose"], "ChEBI": ["CHEBI:4167"]})
+        res = identifier_conversion("name", ["glucose", "unknown"], cache=False, local_tables=[local], offline=True)
+        assert res["ChEBI"].tolist() == ["CHEBI:4167", "NA"]
+
+
+class TestCrossReferenceIndex():
+    xref = pd.DataFrame({"HMDB": ["HMDB01", "HMDB02", "HMDB03", "HMDB04"],
+                         "ChEBI": ["15377", "15377", "16449", "17234"]})
+    matrix = pd.DataFrame([[1.0, 3.0, 5.0, 7.0], [2.0, 4.0, 6.0, 8.0]],
+                          columns=["HMDB01", "HMDB02", "HMDB03", "HMDB05"], index=["s1", "s2"])
+
+    @pytest.mark.parametrize("aggregate,expected", [("mean", [2.0, 3.0]), ("max", [3.0, 4.0]), ("first", [1.0, 2.0])])
+    def test_translate_matrix_aggregation(self, tmp_path, aggregate, expected):
+        index = CrossReferenceIndex(str(tmp_path / "xref.sqlite")).add_mapping(self.xref, "hmdb", "chebi")
+        res = index.translate_matrix(self.matrix, "hmdb", "chebi", aggregate=aggregate)
+        assert sorted(res.columns) == ["15377", "16449"]
+        assert res["15377"].tolist() == expected
+        assert res["16449"].tolist() == [5.0, 6.0]
+
+    def test_translate_matrix_unmapped_and_duplicates(self):
+        index = CrossReferenceIndex().add_mapping(self.xref, "hmdb", "chebi")
+        res = index.translate_matrix(self.matrix[["HMDB05"]], "hmdb", "chebi")
+        assert res.shape == (2, 0) and res.index.tolist() == ["s1", "s2"]
+        duplicated = self.matrix.set_axis(["HMDB01", "HMDB01", "HMDB03", "HMDB05"], axis=1)
+        res = index.translate_matrix(duplicated, "hmdb", "chebi", aggregate="sum", keep_unmapped=True)
+        assert res.columns.tolist() == ["15377", "16449", "HMDB05"]
+        assert res["15377"].tolist() == [4.0, 6.0]
+
+    def test_translate_pathways(self):
+        index = CrossReferenceIndex().add_mapping(self.xref, "hmdb", "chebi")
+        pathway_df = pd.DataFrame({"Pathway_name": ["Glycolysis"], 0: ["15377"], 1: ["17234"]}, index=["P1"])
+        res = index.translate_pathways(pathway_df, "chebi", "hmdb")
+        assert res.loc["P1", "Pathway_name"] == "Glycolysis"
+        assert sorted(res.drop("Pathway_name", axis=1).loc["P1"].tolist()) == ["HMDB01", "HMDB02", "HMDB04"]
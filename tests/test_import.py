@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+# cumulative budget (microseconds) for the `sspa` entry of `python -X importtime`
+IMPORT_BUDGET_US = 100000
+
+
+def run_importtime(code):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, check=True)
+    return proc.stdout, proc.stderr
+
+
+class TestImport():
+
+    def test_import_time_budget(self):
+        _, stderr = run_importtime("import sspa")
+        timings = {}
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                timings[name.strip()] = int(cumulative)
+        assert timings["sspa"] < IMPORT_BUDGET_US
+
+    def test_heavy_backends_not_imported(self):
+        code = "import sys, sspa; print(' '.join(sorted(sys.modules)))"
+        stdout, _ = run_importtime(code)
+        loaded = set(stdout.split())
+        for module in ["pandas", "sklearn", "gseapy", "statsmodels", "requests", "tqdm", "pkg_resources"]:
+            assert module not in loaded
+
+    def test_lazy_attributes(self):
+        import sspa
+        from sspa.sspa_zscore import sspa_zscore
+        assert sspa.sspa_zscore is sspa_zscore
+        assert callable(sspa.process_gmt)
+        assert isinstance(sspa.__version__, str)
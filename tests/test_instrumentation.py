@@ -0,0 +1,44 @@
+import sspa
+from sspa import instrumentation
+from sspa.sspa_svd import sspa_SVD
+from sspa.sspa_zscore import sspa_zscore
+import numpy as np
+import pandas as pd
+
+
+class TestInstrumentation():
+    rng = np.random.default_rng(0)
+    mat = pd.DataFrame(rng.normal(size=(12, 6)), columns=["A", "B", "C", "D", "E", "F"])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", None]}, index=["P1", "P2", "P3"])
+
+    def test_disabled_is_noop(self):
+        assert not instrumentation.enabled()
+        with instrumentation.span("fit", method="test") as span:
+            span.set(n_entities=3)
+        assert span is instrumentation._NULL_SPAN
+
+    def test_profile_report(self):
+        with instrumentation.profile() as report:
+            sspa_SVD(self.pathway_df).fit_transform(self.mat)
+            sspa_zscore(self.pathway_df).fit_transform(self.mat)
+        assert not instrumentation.enabled()
+
+        stages = report.stage_times()
+        assert stages.loc[("fit_pathway", "sspa_SVD"), "count"] == 3
+        assert stages.loc[("transform_pathway", "sspa_zscore"), "count"] == 3
+
+        slowest = report.slowest_pathways(2)
+        assert len(slowest) == 2
+        assert slowest["duration"].is_monotonic_decreasing
+        spans = report.to_frame()
+        fit_pathways = spans[spans["name"] == "fit_pathway"]
+        assert (fit_pathways["parent"] == "fit").all()
+        assert sorted(fit_pathways["n_entities"]) == [2, 2, 3]
+
+    def test_worker_spans_have_parent(self):
+        with sspa.config_context(n_jobs=2), instrumentation.profile() as report:
+            model = sspa_SVD(self.pathway_df).fit(self.mat)
+        assert model.memory_plans_["fit"].n_jobs == 2
+        spans = report.to_frame()
+        assert (spans.loc[spans["name"] == "fit_pathway", "parent"] == "fit").all()
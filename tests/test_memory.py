@@ -0,0 +1,65 @@
+import sspa
+from sspa import memory
+from sspa.config import parse_memory
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestMemoryPlan():
+    rng = np.random.default_rng(0)
+    mat = pd.DataFrame(rng.normal(size=(60, 8)), columns=list("ABCDEFGH"),
+                       index=["S%02d" % i for i in range(60)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "G"], 3: [None, "H", None]}, index=["P1", "P2", "P3"])
+
+    def test_parse_memory(self):
+        assert parse_memory("512MB") == 512 * 1024 ** 2
+        assert parse_memory("1.5g") == int(1.5 * 1024 ** 3)
+        assert parse_memory(1000) == 1000
+        with pytest.raises(ValueError):
+            parse_memory("lots")
+
+    def test_config_context_restores(self):
+        with sspa.config_context(max_memory="1GB", n_jobs=2):
+            assert sspa.get_config() == {"max_memory": 1024 ** 3, "n_jobs": 2, "dtype": None,
+                                         "fit_cache": None, "fit_cache_dir": None}
+        assert sspa.get_config()["max_memory"] is None
+
+    def test_unbounded_plan_is_single_block(self):
+        plan = memory.plan("sspa_KPCA", "transform", self.mat, {"P1": ["A", "B"]})
+        assert not plan.blocked and plan.n_jobs == 1 and plan.estimated_bytes is None
+
+    def budget(self, method, pathways, fraction=0.6):
+        # a ceiling below the estimated working set of processing all samples at once
+        with sspa.config_context(max_memory=1024 ** 4, n_jobs=1):
+            full = memory.plan(method, "transform", self.mat, pathways, default_jobs=1)
+        assert not full.blocked
+        return int(full.estimated_bytes * fraction)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_KPCA, sspa.sspa_SVD, sspa.sspa_ssClustPA])
+    def test_blocked_transform_matches(self, model):
+        expected = model(self.pathway_df).fit_transform(self.mat)
+        fitted = model(self.pathway_df).fit(self.mat)
+        budget = self.budget(fitted.__class__.__name__, fitted.pathways_filt)
+        with sspa.config_context(max_memory=budget, n_jobs=2):
+            scores = fitted.transform(self.mat)
+        plan = fitted.memory_plans_["transform"]
+        assert plan.sample_block < len(self.mat)
+        assert plan.estimated_bytes <= plan.budget
+        assert plan.peak_bytes is not None
+        pd.testing.assert_frame_equal(scores, expected)
+
+    def test_blocked_ssgsea_matches(self):
+        expected = sspa.sspa_ssGSEA(self.pathway_df).fit_transform(self.mat)
+        model = sspa.sspa_ssGSEA(self.pathway_df)
+        with sspa.config_context(max_memory=self.budget("sspa_ssGSEA", model.pathways)):
+            scores = model.fit_transform(self.mat)
+        assert model.memory_plans_["transform"].blocked
+        pd.testing.assert_frame_equal(scores, expected, check_names=False)
+
+    def test_warns_when_budget_cannot_be_met(self):
+        with sspa.config_context(max_memory=1024):
+            with pytest.warns(UserWarning, match="max_memory"):
+                plan = memory.plan("sspa_KPCA", "fit", self.mat, {"P1": ["A", "B"]})
+        assert plan.n_jobs == 1
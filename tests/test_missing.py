@@ -0,0 +1,71 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+
+class TestMissing():
+    rng = np.random.default_rng(11)
+    # one latent factor per pathway, so that the leading components and clusters are well defined
+    latent = np.repeat(rng.normal(size=(50, 2)) * 3, 4, axis=1)
+    mat = pd.DataFrame(latent + rng.normal(loc=5, size=(50, 8)), columns=list("ABCDEFGH"),
+                       index=["S%02d" % i for i in range(50)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two"], 0: ["A", "E"], 1: ["B", "F"], 2: ["C", "G"],
+                               3: ["D", "H"]}, index=["P1", "P2"])
+    missing = mat.copy()
+    missing.iloc[3, 1] = np.nan
+    missing.iloc[7, 5] = np.nan
+    missing.iloc[7, 6] = np.nan
+
+    def test_zscore_omit(self):
+        scores = sspa.sspa_zscore(self.pathway_df, nan_policy="omit").fit_transform(self.missing)
+        z = (self.missing - self.missing.mean()) / self.missing.std(ddof=0)
+        expected = pd.DataFrame({"P1": z[list("ABCD")].sum(axis=1) / np.sqrt(z[list("ABCD")].notna().sum(axis=1)),
+                                 "P2": z[list("EFGH")].sum(axis=1) / np.sqrt(z[list("EFGH")].notna().sum(axis=1))})
+        pd.testing.assert_frame_equal(scores, expected, check_names=False)
+
+    def test_propagate(self):
+        scores = sspa.sspa_zscore(self.pathway_df).fit_transform(self.missing)
+        assert scores.isna().all().all()
+        with pytest.raises(ValueError):
+            sspa.sspa_zscore(self.pathway_df, nan_policy="ignore").fit(self.missing)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_zscore, sspa.sspa_SVD, sspa.sspa_ssClustPA])
+    def test_omit(self, model):
+        missing = self.missing.copy()
+        scores = model(self.pathway_df, nan_policy="omit").fit_transform(missing)
+        pd.testing.assert_frame_equal(missing, self.missing)
+        assert scores.notna().all().all()
+        # scores of the complete data are unchanged without missing values
+        pd.testing.assert_frame_equal(model(self.pathway_df, nan_policy="omit").fit_transform(self.mat),
+                                      model(self.pathway_df).fit_transform(self.mat))
+        expected = model(self.pathway_df).fit_transform(self.mat)
+        for pathway in scores:
+            assert np.corrcoef(scores[pathway], expected[pathway])[0, 1] > 0.999
+
+    def test_partial_fit_omit(self):
+        expected = sspa.sspa_zscore(self.pathway_df, nan_policy="omit").fit(self.missing)
+        model = sspa.sspa_zscore(self.pathway_df, nan_policy="omit")
+        for rows in np.array_split(np.arange(len(self.missing)), 5):
+            model.partial_fit(self.missing.iloc[rows])
+        np.testing.assert_allclose(model.mean_, self.missing.mean().to_numpy())
+        np.testing.assert_allclose(model.var_, self.missing.var(ddof=0).to_numpy())
+        pd.testing.assert_frame_equal(model.transform(self.missing), expected.transform(self.missing))
+        with pytest.raises(ValueError, match="missing values"):
+            sspa.sspa_SVD(self.pathway_df, nan_policy="omit").partial_fit(self.missing)
+
+    def test_multi_omit(self):
+        scores = sspa.sspa_multi(self.pathway_df, methods=("zscore", "svd", "cluster"),
+                                 nan_policy="omit").fit_transform(self.missing)
+        for method, model in [("zscore", sspa.sspa_zscore), ("svd", sspa.sspa_SVD), ("cluster", sspa.sspa_ssClustPA)]:
+            pd.testing.assert_frame_equal(scores[method],
+                                          model(self.pathway_df, nan_policy="omit").fit_transform(self.missing),
+                                          check_names=False)
+
+    def test_sparse_omit(self):
+        values = self.mat.to_numpy() * (self.rng.random(self.mat.shape) < 0.5)
+        values[2, 3] = np.nan
+        sparse = pd.DataFrame.sparse.from_spmatrix(sp.csr_matrix(values), index=self.mat.index, columns=self.mat.columns)
+        with pytest.raises(ValueError):
+            sspa.sspa_zscore(self.pathway_df, nan_policy="omit").fit_transform(sparse)
@@ -0,0 +1,30 @@
+import sspa
+import numpy as np
+import pandas as pd
+
+
+class TestMulti():
+    rng = np.random.default_rng(3)
+    mat = pd.DataFrame(rng.normal(size=(30, 8)), columns=list("ABCDEFGH"), index=["S%02d" % i for i in range(30)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three", "four"], 0: ["A", "C", "A", "A"],
+                               1: ["B", "D", "F", "B"], 2: [None, "E", "G", "Z"], 3: [None, "H", None, None]},
+                              index=["P1", "P2", "P3", "P4"])
+
+    def test_matches_single_methods(self):
+        model = sspa.sspa_multi(self.pathway_df)
+        panel = model.fit_transform(self.mat)
+        assert panel.columns.get_level_values("Method").unique().tolist() == ["zscore", "svd", "cluster", "kpca"]
+        # P1 and P4 have the same measured members and share one fitted model
+        assert model.dedup_report_["saved"] == 1
+        for method, estimator in [("zscore", sspa.sspa_zscore), ("svd", sspa.sspa_SVD),
+                                  ("cluster", sspa.sspa_ssClustPA), ("kpca", sspa.sspa_KPCA)]:
+            expected = estimator(self.pathway_df).fit_transform(self.mat)
+            pd.testing.assert_frame_equal(panel[method], expected, check_names=False, atol=1e-10)
+
+        new = self.mat.iloc[:5] * 2
+        pd.testing.assert_frame_equal(model.transform(new)["svd"], model.estimators_["svd"].transform(new),
+                                      check_names=False, atol=1e-10)
+
+    def test_subset_of_methods(self):
+        panel = sspa.sspa_multi(self.pathway_df, methods=["kpca", "zscore"]).fit_transform(self.mat)
+        assert panel.columns.get_level_values(0).unique().tolist() == ["kpca", "zscore"]
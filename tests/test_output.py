@@ -0,0 +1,78 @@
+import sspa
+import sspa.output
+from sspa.cli import main
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestOutput():
+    rng = np.random.default_rng(10)
+    mat = pd.DataFrame(rng.normal(size=(30, 8)), columns=list("ABCDEFGH"), index=["S%02d" % i for i in range(30)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "G"], 3: [None, "H", None]}, index=["P1", "P2", "P3"])
+
+    def read(self, path):
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        if path.endswith(".arrow"):
+            return pd.read_feather(path)
+        return pd.read_csv(path, index_col="Sample" if "wide" in path else None)
+
+    @pytest.mark.parametrize("ext", ["csv", "parquet", "arrow"])
+    @pytest.mark.parametrize("layout", sspa.output.LAYOUTS)
+    def test_write_scores(self, tmp_path, ext, layout):
+        if ext != "csv":
+            pytest.importorskip("pyarrow")
+        model = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+        path = str(tmp_path / ("%s.%s" % (layout, ext)))
+        assert sspa.output.write_scores(model, self.mat, path, layout, chunk_size=7) == 30
+        expected = model.transform(self.mat)
+        scores = self.read(path)
+        if layout == "long":
+            scores = scores.pivot(index="Sample", columns="Pathway", values="Score").loc[expected.index]
+        np.testing.assert_allclose(scores[expected.columns].to_numpy(), expected.to_numpy(), atol=1e-12)
+        assert scores.index.astype(str).tolist() == expected.index.tolist()
+        if ext != "csv":
+            assert isinstance(scores.index.dtype, pd.CategoricalDtype)
+
+    @pytest.mark.parametrize("ext", ["parquet", "arrow"])
+    def test_result_rows(self, tmp_path, ext):
+        pytest.importorskip("pyarrow")
+        results = pd.DataFrame({"Pathway_name": ["one", "two", None], "P-value": [0.01, 0.2, 0.5],
+                                "DA_Metabolites_ID": ["A, B", "", "C"]}, index=pd.Index(["P1", "P2", "P3"], name="ID"))
+        path = str(tmp_path / ("ora." + ext))
+        with sspa.output.ResultWriter(path) as writer:
+            writer.write(results.iloc[:2])
+            writer.write(results.iloc[2:])
+        written = self.read(path)
+        assert written.index.tolist() == ["P1", "P2", "P3"]
+        assert isinstance(written["Pathway_name"].dtype, pd.CategoricalDtype)
+        assert [list(entities) for entities in written["DA_Metabolites_ID"]] == [["A", "B"], [], ["C"]]
+
+    def test_errors(self, tmp_path):
+        with pytest.raises(ValueError):
+            sspa.output.ScoreWriter(str(tmp_path / "scores.xlsx"))
+        with pytest.raises(ValueError):
+            sspa.output.ScoreWriter(str(tmp_path / "scores.csv"), layout="tidy")
+        with sspa.output.ScoreWriter(str(tmp_path / "scores.csv")) as writer:
+            writer.write(self.mat.iloc[:5])
+            with pytest.raises(ValueError):
+                writer.write(self.mat.iloc[5:, ::-1])
+
+    def test_chunk_dependent_scores(self, tmp_path):
+        path = str(tmp_path / "scores.csv")
+        with pytest.raises(ValueError, match="partial_fit"):
+            sspa.output.write_scores(sspa.sspa_zscore(self.pathway_df).fit(self.mat), self.mat, path, chunk_size=7)
+        model = sspa.sspa_zscore(self.pathway_df).partial_fit(self.mat)
+        sspa.output.write_scores(model, self.mat, path, chunk_size=7)
+        pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), model.transform(self.mat), check_names=False)
+
+    def test_cli_long_layout(self, tmp_path):
+        self.mat.to_csv(tmp_path / "data.csv")
+        self.pathway_df.to_csv(tmp_path / "pathways.csv")
+        out = str(tmp_path / "scores.csv")
+        assert main(["score", str(tmp_path / "data.csv"), "-p", str(tmp_path / "pathways.csv"), "-m", "zscore",
+                     "--chunk-size", "8", "--layout", "long", "-o", out, "-q"]) == 0
+        scores = pd.read_csv(out)
+        assert scores.columns.tolist() == ["Sample", "Pathway", "Score"] and len(scores) == 30 * 3
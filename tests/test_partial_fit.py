@@ -0,0 +1,45 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestPartialFit():
+    rng = np.random.default_rng(3)
+    mat = pd.DataFrame(rng.normal(size=(45, 6)) * [1, 2, 3, 1, 5, 2] + 1, columns=["A", "B", "C", "D", "E", "F"])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "C"]}, index=["P1", "P2", "P3"])
+
+    def batches(self, size=10):
+        return [self.mat.iloc[i:i + size] for i in range(0, len(self.mat), size)]
+
+    def test_zscore_matches_full_cohort(self):
+        model = sspa.sspa_zscore(self.pathway_df)
+        for batch in self.batches():
+            model.partial_fit(batch)
+        assert model.n_samples_seen_.tolist() == [45] * 6
+        expected = sspa.sspa_zscore(self.pathway_df).fit_transform(self.mat)
+        pd.testing.assert_frame_equal(model.transform(self.mat), expected, rtol=1e-10)
+
+    def test_svd_matches_full_refit(self):
+        model = sspa.sspa_SVD(self.pathway_df)
+        for batch in self.batches():
+            model.partial_fit(batch)
+        full = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+        assert model.pathway_ids == full.pathway_ids
+        pd.testing.assert_frame_equal(model.transform(self.mat), full.transform(self.mat), rtol=1e-8)
+        np.testing.assert_allclose(model.molecular_importance["P2"].values, full.molecular_importance["P2"].values)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_zscore, sspa.sspa_SVD])
+    def test_partial_fit_continues_fit(self, tmp_path, model):
+        # fit then partial_fit matches partial_fit on all samples
+        estimator = model(self.pathway_df).fit(self.mat.iloc[:40]).partial_fit(self.mat.iloc[40:])
+        expected = model(self.pathway_df).partial_fit(self.mat)
+        np.testing.assert_array_equal(estimator.n_samples_seen_, expected.n_samples_seen_)
+        pd.testing.assert_frame_equal(estimator.transform(self.mat), expected.transform(self.mat), rtol=1e-8)
+        if model is sspa.sspa_SVD:
+            with pytest.raises(ValueError):
+                model(self.pathway_df, keep_X=False).fit(self.mat).partial_fit(self.mat)
+        estimator.save(str(tmp_path / "model.npz"))
+        with pytest.raises(ValueError):
+            model.load(str(tmp_path / "model.npz")).partial_fit(self.mat)
@@ -0,0 +1,76 @@
+from sspa.pathway_set import PathwaySet, collapse_redundant
+from sspa.process_pathways import process_gmt
+from sspa.utils import pathwaydf_to_dict
+import pandas as pd
+from io import StringIO
+
+
+class TestPathwaySet():
+    gmt_data = "P1\tPathway one\tA\tB\tC\nP2\tPathway two\tB\tD\nP3\tPathway three\tA\tB\tC\tD\tE\tF\tG\n"
+    dummy_pathway_df_data = """,Pathway_name,0,1,2,3,4\nR-HSA-1059683,Interleukin-6 signaling,30616,456216,,,\nR-HSA-109581,Apoptosis,61120,4705,456216,28494,36080\nR-HSA-109582,Hemostasis,15366,91144,15377,15378,15379"""
+    dummy_pathway_df = pd.read_csv(StringIO(dummy_pathway_df_data), index_col=0, dtype='object', sep=",")
+
+    def test_gmt_round_trip(self, tmp_path):
+        infile = tmp_path / "in.gmt"
+        outfile = tmp_path / "out.gmt"
+        infile.write_text(self.gmt_data)
+        pathway_set = PathwaySet.read_gmt(str(infile))
+        assert pathway_set.sizes.tolist() == [3, 2, 7]
+        assert pathway_set.members("P2") == ["B", "D"]
+        pathway_set.to_gmt(str(outfile))
+        assert outfile.read_bytes() == infile.read_bytes()
+        # line endings, blank lines and the final newline are normalised
+        infile.write_bytes(self.gmt_data.replace("\n", "\r\n").replace("\r\nP2", "\r\n\r\nP2")[:-2].encode())
+        PathwaySet.read_gmt(str(infile)).to_gmt(str(outfile))
+        assert outfile.read_bytes() == self.gmt_data.encode()
+
+    def test_process_gmt_wide(self, tmp_path):
+        infile = tmp_path / "in.gmt"
+        infile.write_text(self.gmt_data)
+        wide = process_gmt(str(infile))
+        assert wide.shape == (3, 8)
+        assert wide.loc["P2", "Pathway_name"] == "Pathway two"
+        expected = PathwaySet.read_gmt(str(infile)).to_dict()
+        assert {k: set(v) for k, v in pathwaydf_to_dict(wide).items()} == {k: set(v) for k, v in expected.items()}
+
+    def test_from_wide(self):
+        pathway_set = PathwaySet.from_wide(self.dummy_pathway_df)
+        expected = pathwaydf_to_dict(self.dummy_pathway_df)
+        actual = pathway_set.to_dict()
+        assert expected.keys() == actual.keys()
+        assert all(set(expected[k]) == set(actual[k]) for k in expected)
+        assert pathway_set.incidence_matrix().sum() == 12
+        assert PathwaySet.from_long(pathway_set.to_long()).to_dict() == actual
+        long_df = pd.concat([pathway_set.to_long(), pd.DataFrame({"Pathway_ID": [None], "Entity": ["X"]})])
+        assert PathwaySet.from_long(long_df).to_dict() == actual
+
+    def test_overlap(self, tmp_path):
+        infile = tmp_path / "in.gmt"
+        infile.write_text(self.gmt_data)
+        pathway_set = PathwaySet.read_gmt(str(infile))
+        jaccard = pathway_set.overlap("jaccard").toarray()
+        assert jaccard[0, 2] == 3 / 7 and jaccard[0, 1] == 1 / 4 and jaccard[0, 0] == 0
+        assert pathway_set.overlap("overlap", threshold=1).nnz == 4
+        assert pathway_set.overlap("shared", top_k=1).toarray()[2].tolist() == [3, 0, 0]
+        assert pathway_set.overlap("shared", entities=["A", "D"]).toarray()[0].tolist() == [0, 0, 1]
+        table = pathway_set.overlap_table(threshold=0.4)
+        assert table[["Pathway_ID_1", "Pathway_ID_2", "Shared"]].values.tolist() == [["P1", "P3", 3], ["P3", "P1", 3]]
+
+    def test_collapse_redundant(self, tmp_path):
+        infile = tmp_path / "in.gmt"
+        infile.write_text(self.gmt_data)
+        pathway_set = PathwaySet.read_gmt(str(infile))
+        results = pd.DataFrame({"ID": ["P1", "P2", "P3"], "P-adjust": [0.04, 0.5, 0.01]})
+        collapsed = collapse_redundant(results, pathway_set, threshold=1)
+        assert collapsed["ID"].tolist() == ["P2", "P3"]
+        assert collapsed.set_index("ID")["Redundant_pathways"].to_dict() == {"P2": "", "P3": "P1"}
+
+    def test_entity_index(self, tmp_path):
+        infile = tmp_path / "in.gmt"
+        infile.write_text(self.gmt_data)
+        pathway_set = PathwaySet.read_gmt(str(infile))
+        assert pathway_set.coverage(["A", "D", "Z"]).to_dict() == {"P1": 1, "P2": 1, "P3": 2}
+        assert pathway_set.pathways_containing(["D", "E"]).tolist() == ["P2", "P3"]
+        assert pathway_set.pathways_containing(["A", "B", "C"], min_count=3).tolist() == ["P1", "P3"]
+        aligned = pathway_set.align(["G", "B", "X", "A"])
+        assert aligned.toarray().tolist() == [[0, 1, 0, 1], [0, 1, 0, 0], [1, 1, 0, 1]]
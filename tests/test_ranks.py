@@ -0,0 +1,77 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+
+class TestRanks():
+    rng = np.random.default_rng(2)
+    values = rng.integers(0, 6, size=(30, 20)).astype(float)
+    values[4, [2, 9]] = np.nan
+    mat = pd.DataFrame(values, columns=["E%02d" % i for i in range(20)], index=["S%02d" % i for i in range(30)])
+
+    @pytest.mark.parametrize("ties", ["average", "min"])
+    def test_matches_pandas(self, ties):
+        ranks = sspa.ranks.rank_samples(self.mat, ties=ties, cache=False)
+        assert ranks.dtype == np.float32
+        np.testing.assert_array_equal(ranks, self.mat.rank(axis=1, method=ties, na_option="bottom").to_numpy())
+
+    def test_cache(self):
+        sspa.ranks.clear_cache()
+        ranks = sspa.ranks.rank_samples(self.mat)
+        assert sspa.ranks.rank_samples(self.mat.copy()) is ranks
+        assert not ranks.flags.writeable
+        changed = self.mat.copy()
+        changed.iloc[0, 0] += 1
+        assert sspa.ranks.rank_samples(changed) is not ranks
+        with pytest.raises(ValueError):
+            sspa.ranks.rank_samples(self.mat, ties="dense")
+
+
+class TestSingscore():
+    rng = np.random.default_rng(4)
+    mat = pd.DataFrame(rng.normal(size=(25, 12)), columns=list("ABCDEFGHIJKL"), index=["S%02d" % i for i in range(25)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "D", "A"], 1: ["B", "E", "H"],
+                               2: ["C", "F", None], 3: [None, "G", None]}, index=["P1", "P2", "P3"])
+    down_df = pd.DataFrame({"Pathway_name": ["one"], 0: ["J"], 1: ["K"], 2: ["L"]}, index=["P1"])
+
+    def singscore(self, genes, reverse=False):
+        # mean rank normalised by its theoretical range, centred
+        ranks = self.mat.rank(axis=1, method="min")[genes]
+        n, k = self.mat.shape[1], len(genes)
+        if reverse:
+            ranks = n + 1 - ranks
+        return (ranks.mean(axis=1) - (k + 1) / 2) / (n - k) - 0.5
+
+    def test_up(self):
+        scores = sspa.sspa_singscore(self.pathway_df).fit_transform(self.mat)
+        expected = pd.DataFrame({"P1": self.singscore(list("ABC")), "P2": self.singscore(list("DEFG")),
+                                 "P3": self.singscore(list("AH"))})
+        pd.testing.assert_frame_equal(scores, expected)
+
+    def test_up_down(self):
+        scores = sspa.sspa_singscore(self.pathway_df, down_pathway_df=self.down_df).fit_transform(self.mat)
+        expected = self.singscore(list("ABC")) + self.singscore(list("JKL"), reverse=True)
+        pd.testing.assert_series_equal(scores["P1"], expected, check_names=False)
+        pd.testing.assert_series_equal(scores["P2"], self.singscore(list("DEFG")), check_names=False)
+
+    def test_sparse(self):
+        values = self.mat.to_numpy() * (self.rng.random(self.mat.shape) < 0.5)
+        dense = pd.DataFrame(values, index=self.mat.index, columns=self.mat.columns)
+        sparse = pd.DataFrame.sparse.from_spmatrix(sp.csr_matrix(values), index=self.mat.index, columns=self.mat.columns)
+        pd.testing.assert_frame_equal(sspa.sspa_singscore(self.pathway_df).fit_transform(sparse),
+                                      sspa.sspa_singscore(self.pathway_df).fit_transform(dense))
+
+    def test_ssgsea_shares_ranks(self):
+        sspa.ranks.clear_cache()
+        expected = sspa.sspa_ssGSEA(self.pathway_df).fit_transform(self.mat)
+        # reads the ranks cached by ssGSEA
+        assert len(sspa.ranks._cache) == 1
+        ranks = sspa.ranks.rank_samples(self.mat)
+        duplicated = self.mat.copy()
+        duplicated.iloc[0, 0] = np.nan
+        # gseapy fills missing values before ranking, its own ranking is used
+        sspa.sspa_ssGSEA(self.pathway_df).fit_transform(duplicated)
+        assert sspa.ranks.rank_samples(self.mat) is ranks and len(sspa.ranks._cache) == 1
+        np.testing.assert_allclose(sspa.sspa_ssGSEA(self.pathway_df).fit_transform(self.mat), expected)
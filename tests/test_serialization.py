@@ -0,0 +1,45 @@
+import sspa
+from sspa import serialization
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestSerialization():
+    rng = np.random.default_rng(1)
+    mat = pd.DataFrame(rng.normal(size=(30, 8)), columns=list("ABCDEFGH"),
+                       index=["S%02d" % i for i in range(30)])
+    new = pd.DataFrame(rng.normal(size=(5, 9)), columns=list("HGFEDCBAZ"))
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "G"], 3: [None, "H", None]}, index=["P1", "P2", "P3"])
+
+    @pytest.mark.parametrize("model", [sspa.sspa_SVD, sspa.sspa_KPCA, sspa.sspa_ssClustPA])
+    @pytest.mark.parametrize("mmap", [True, False])
+    def test_round_trip(self, tmp_path, model, mmap):
+        fitted = model(self.pathway_df, keep_X=False).fit(self.mat)
+        assert fitted.X_ is None
+        path = str(tmp_path / "model.npz")
+        fitted.save(path)
+        loaded = model.load(path, mmap=mmap)
+        assert loaded.pathway_ids == fitted.pathway_ids
+        if mmap and model is sspa.sspa_KPCA:
+            assert isinstance(loaded.packed_.arrays["X_fit"], np.memmap)
+        # new data with reordered and extra columns
+        expected = fitted.transform(self.new[self.mat.columns])
+        pd.testing.assert_frame_equal(loaded.transform(self.new), expected, rtol=1e-10)
+
+    def test_wrong_class(self, tmp_path):
+        path = str(tmp_path / "svd.npz")
+        sspa.sspa_SVD(self.pathway_df).fit(self.mat).save(path)
+        with pytest.raises(TypeError):
+            sspa.sspa_KPCA.load(path)
+        assert type(serialization.load(path)) is sspa.sspa_SVD
+
+    def test_zscore_reference_statistics(self, tmp_path):
+        path = str(tmp_path / "zscore.npz")
+        with pytest.raises(ValueError):
+            sspa.sspa_zscore(self.pathway_df).fit(self.mat).save(path)
+        fitted = sspa.sspa_zscore(self.pathway_df).partial_fit(self.mat.iloc[:10]).partial_fit(self.mat.iloc[10:])
+        fitted.save(path)
+        expected = fitted.transform(self.new[self.mat.columns])
+        pd.testing.assert_frame_equal(sspa.sspa_zscore.load(path).transform(self.new), expected, rtol=1e-10)
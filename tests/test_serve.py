@@ -0,0 +1,75 @@
+import sspa
+from sspa.serve import ScoringServer
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(b"%s %s HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                 % (method.encode(), path.encode(), len(body)) + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        key, _, value = line.decode().partition(":")
+        headers[key.lower()] = value.strip()
+    data = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return status, data
+
+
+class TestServe():
+    rng = np.random.default_rng(5)
+    mat = pd.DataFrame(rng.normal(size=(30, 6)), columns=list("ABCDEF"), index=["S%02d" % i for i in range(30)])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two"], 0: ["A", "C"], 1: ["B", "D"], 2: [None, "E"]},
+                              index=["P1", "P2"])
+
+    def test_scores_match_transform(self, tmp_path):
+        svd = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+        svd.save(str(tmp_path / "svd.npz"))
+        zscore = sspa.sspa_zscore(self.pathway_df).partial_fit(self.mat)
+        expected = {"svd": svd.transform(self.mat), "zscore": zscore.transform(self.mat)}
+
+        async def run():
+            server = await ScoringServer({"svd": str(tmp_path / "svd.npz"), "zscore": zscore}, port=0).start()
+            try:
+                # concurrent single-sample requests are scored in micro-batches
+                responses = await asyncio.gather(*[
+                    request(server.port, "POST", "/score/%s" % name,
+                            {"sample": self.mat.loc[sample].to_dict(), "id": sample})
+                    for name in expected for sample in self.mat.index[:10]])
+                ordered = await request(server.port, "POST", "/score/svd", {"values": self.mat.iloc[0].tolist()})
+                missing = await request(server.port, "POST", "/score/svd", {"sample": {"A": 1.0}})
+                # F is in no pathway, so requests need not provide it
+                unused = await request(server.port, "POST", "/score/zscore",
+                                       {"sample": self.mat.iloc[0].drop("F").to_dict()})
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(b"POST /score/svd HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+                malformed = int((await reader.readline()).split()[1])
+                writer.close()
+                unknown = await request(server.port, "POST", "/score/kpca", {"sample": {}})
+                metrics = await request(server.port, "GET", "/metrics")
+            finally:
+                await server.close()
+            return responses, ordered, missing, unused, malformed, unknown, metrics
+
+        responses, ordered, missing, unused, malformed, unknown, metrics = asyncio.run(run())
+        for n, (status, data) in enumerate(responses):
+            name = list(expected)[n // 10]
+            assert status == 200
+            frame = expected[name]
+            np.testing.assert_allclose(data["data"][0], frame.loc[data["index"][0], data["columns"]].values, atol=1e-10)
+        np.testing.assert_allclose(ordered[1]["data"][0], expected["svd"].iloc[0].values, atol=1e-10)
+        assert missing[0] == 400 and "missing" in missing[1]["error"]
+        np.testing.assert_allclose(unused[1]["data"][0], expected["zscore"].iloc[0].values, atol=1e-10)
+        assert malformed == 400
+        assert unknown[0] == 404
+        assert metrics[1]["svd"]["requests"] == 11 and metrics[1]["svd"]["errors"] == 1
+        assert metrics[1]["svd"]["latency_ms"]["p99"] > 0
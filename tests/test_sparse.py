@@ -0,0 +1,44 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+
+class TestSparse():
+    rng = np.random.default_rng(5)
+    values = rng.gamma(2.0, size=(60, 8)) * (rng.random((60, 8)) < 0.3)
+    values[0] += 1  # no all-zero entities
+    mat = pd.DataFrame(values, columns=list("ABCDEFGH"), index=["S%02d" % i for i in range(60)])
+    sparse = pd.DataFrame.sparse.from_spmatrix(sp.csr_matrix(values), index=mat.index, columns=mat.columns)
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "G"], 3: [None, "H", None]}, index=["P1", "P2", "P3"])
+
+    def test_sparse_values(self):
+        assert sspa.utils.sparse_values(self.mat) is None
+        matrix = sspa.utils.sparse_values(self.sparse)
+        assert sp.issparse(matrix) and matrix.format == "csc"
+        np.testing.assert_array_equal(matrix.toarray(), self.values)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_zscore, sspa.sspa_SVD, sspa.sspa_ssClustPA, sspa.sspa_ssGSEA])
+    def test_matches_dense(self, model):
+        expected = model(self.pathway_df).fit_transform(self.mat)
+        pd.testing.assert_frame_equal(model(self.pathway_df).fit_transform(self.sparse), expected, rtol=1e-8)
+
+    @pytest.mark.parametrize("model", [sspa.sspa_SVD, sspa.sspa_ssClustPA])
+    def test_dense_fit_sparse_transform(self, model):
+        fitted = model(self.pathway_df).fit(self.mat)
+        pd.testing.assert_frame_equal(fitted.transform(self.sparse), fitted.transform(self.mat), rtol=1e-8)
+
+    def test_zero_variance_entity(self):
+        values = self.values.copy()
+        values[:, 2] = 0
+        sparse = pd.DataFrame.sparse.from_spmatrix(sp.csr_matrix(values), index=self.mat.index, columns=self.mat.columns)
+        scores = sspa.sspa_zscore(self.pathway_df).fit_transform(sparse)
+        assert scores["P2"].isna().all() and scores["P1"].notna().all()
+
+    def test_svd_saved_model(self, tmp_path):
+        fitted = sspa.sspa_SVD(self.pathway_df).fit(self.sparse)
+        path = str(tmp_path / "svd.npz")
+        fitted.save(path)
+        pd.testing.assert_frame_equal(sspa.sspa_SVD.load(path).transform(self.sparse), fitted.transform(self.mat))
@@ -0,0 +1,36 @@
+import sspa
+import numpy as np
+import pandas as pd
+
+
+class TestMolecularImportance():
+    rng = np.random.default_rng(2)
+    mat = pd.DataFrame(rng.normal(size=(20, 6)), columns=["A", "B", "C", "D", "E", "F"])
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "C", "A"], 1: ["B", "D", "F"],
+                               2: [None, "E", "C"]}, index=["P1", "P2", "P3"])
+
+    def test_matches_fitted_loadings(self):
+        model = sspa.sspa_SVD(self.pathway_df).fit(self.mat)
+        importance = model.molecular_importance
+        assert list(importance) == ["P1", "P2", "P3"]
+        for n, pathway in enumerate(model.pathway_ids):
+            frame = importance[pathway]
+            assert frame.columns.tolist() == ["PC1_Loadings"]
+            np.testing.assert_array_equal(frame["PC1_Loadings"].values, model.fitted_models[n].components_[0])
+        assert importance["P3"].index.tolist() == ["A", "C", "F"]
+
+        sparse = importance.to_sparse().toarray()
+        assert sparse.shape == (6, 3)
+        assert sparse[2, 2] == importance.pathway("P3")["C"]
+
+        per_entity = importance.entity("A")
+        assert per_entity.index.tolist() == ["P1", "P3"]
+        assert per_entity["P3"] == importance.pathway("P3")["A"]
+
+    def test_top_k(self):
+        importance = sspa.sspa_SVD(self.pathway_df).fit(self.mat).molecular_importance
+        top = importance.top_k(2)
+        assert top.groupby("Pathway_ID").size().tolist() == [2, 2, 2]
+        p3 = importance.pathway("P3").abs().sort_values(ascending=False)
+        assert top[top["Pathway_ID"] == "P3"]["Entity"].tolist() == p3.index[:2].tolist()
+        assert top["Rank"].tolist() == [1, 2] * 3
@@ -1,4 +1,5 @@
-from sspa.utils import pathwaydf_to_dict, t_tests, load_example_data
+from sspa.utils import pathwaydf_to_dict, t_tests, load_example_data, group_pathways, dedup_report, filter_pathways
+from sspa.sspa_kpca import sspa_KPCA
 import pandas as pd
 from pandas.testing import assert_frame_equal
 from io import StringIO
@@ -38,6 +39,38 @@ class TestUtils():
         actual = t_tests(self.dummy_metab, self.dummy_classes, 'fdr_bh', testtype='ttest')
         assert_frame_equal(actual, expected)
 
+    def test_group_pathways(self):
+        # Apoptosis and Intrinsic Pathway for Apoptosis only differ by unmeasured metabolites
+        metab = self.dummy_metab.set_axis(['456216', '28494', '36080', '30616', '1372'], axis=1)
+        groups = group_pathways(pathwaydf_to_dict(self.dummy_pathway_df), metab.columns, min_entity=2)
+        assert [ids for _, ids in groups] == [['R-HSA-1059683'], ['R-HSA-109581', 'R-HSA-109606']]
+        assert groups[1][0].tolist() == [0, 1, 2]
+        assert dedup_report(groups)['saved'] == 1
+
+        model = sspa_KPCA(self.dummy_pathway_df).fit(metab)
+        assert model.dedup_report_ == {'pathways': 3, 'unique_sets': 2, 'saved': 1, 'saved_fraction': 1 / 3}
+        assert model.fitted_models[1] is model.fitted_models[2]
+        scores = model.transform(metab)
+        assert scores['R-HSA-109581'].tolist() == scores['R-HSA-109606'].tolist()
+
+    def test_filter_pathways(self):
+        pathways = pathwaydf_to_dict(self.dummy_pathway_df)
+        columns = ['456216', '28494', '30616']
+        expected = {k: v for k, v in pathways.items() if len([i for i in columns if i in v]) >= 2}
+        assert filter_pathways(pathways, columns, 2) == expected
+        assert list(filter_pathways(pathways, columns, 1)) == [k for k in pathways if set(columns) & set(pathways[k])]
+
+    def test_pathway_set_built_once(self):
+        from sspa.pathway_set import as_pathway_set
+        pathways = pathwaydf_to_dict(self.dummy_pathway_df)
+        pathway_set = as_pathway_set(pathways)
+        assert as_pathway_set(pathwaydf_to_dict(self.dummy_pathway_df)) is pathway_set
+        assert pathway_set.pathway_ids.tolist() == list(pathways)
+        # changing the dictionary drops the PathwaySet built with it
+        del pathways['R-HSA-109581']
+        assert as_pathway_set(pathways) is not pathway_set
+        assert as_pathway_set(pathways).pathway_ids.tolist() == list(pathways)
+
     # def test_loadexampledata(self):
     #     expected_met_raw = pd.read_csv('../src/sspa/example_data/Su_metab_data_raw.csv', index_col=0)
     #     actual_met_raw = load_example_data(omicstype='metabolomics', processed=False)
@@ -0,0 +1,52 @@
+import sspa
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestWarmStart():
+    rng = np.random.default_rng(8)
+    # a latent factor per pathway, so that PC1 and the two clusters are well defined
+    factors = rng.normal(size=(60, 2))
+    values = rng.normal(scale=0.3, size=(60, 10))
+    values[:, :5] += factors[:, [0]] * np.linspace(1, 2, 5)
+    values[:, 5:] += np.sign(factors[:, [1]]) * np.linspace(1, 2, 5)
+    grown = pd.DataFrame(values, columns=list("ABCDEFGHIJ"), index=["S%02d" % i for i in range(60)])
+    mat = grown.iloc[:50]
+    pathway_df = pd.DataFrame({"Pathway_name": ["one", "two", "three"], 0: ["A", "F", "A"], 1: ["B", "G", "B"],
+                               2: ["C", "H", "C"], 3: ["D", "I", None], 4: ["E", "J", None]}, index=["P1", "P2", "P3"])
+
+    @pytest.mark.parametrize("model", [sspa.sspa_SVD, sspa.sspa_KPCA, sspa.sspa_ssClustPA])
+    def test_refit_resets_state(self, model):
+        for warm_start in (False, True):
+            estimator = model(self.pathway_df, warm_start=warm_start).fit(self.mat)
+            estimator.fit(self.grown)
+            assert estimator.pathway_ids == ["P1", "P2", "P3"] and len(estimator.fitted_models) == 3
+        # warm started clusters may be in the other order than those fitted from scratch
+        expected = model(self.pathway_df).fit(self.grown).transform(self.grown)
+        pd.testing.assert_frame_equal(estimator.transform(self.grown).abs(), expected.abs(), atol=1e-6)
+
+    def test_svd_warm_start(self):
+        cold = sspa.sspa_SVD(self.pathway_df).fit(self.grown)
+        # P1 is missing an entity in the first fit, its column set changes
+        estimator = sspa.sspa_SVD(self.pathway_df, warm_start=True).fit(self.mat.drop(columns="E"))
+        estimator.fit(self.grown[list("JIHGFEDCBA")])
+        pd.testing.assert_frame_equal(estimator.transform(self.grown[list("JIHGFEDCBA")]), cold.transform(self.grown),
+                                      atol=1e-6)
+        pd.testing.assert_frame_equal(estimator.molecular_importance["P2"],
+                                      cold.molecular_importance["P2"].loc[list("JIHGF")], atol=1e-6)
+
+    def test_cluster_keeps_order(self):
+        estimator = sspa.sspa_ssClustPA(self.pathway_df, warm_start=True).fit(self.mat)
+        centres = [model.cluster_centers_ for model in estimator.fitted_models]
+        estimator.fit(self.grown)
+        for before, model in zip(centres, estimator.fitted_models):
+            assert np.abs(model.cluster_centers_ - before).max() < 0.5
+
+    def test_kpca_reuses_unchanged(self):
+        estimator = sspa.sspa_KPCA(self.pathway_df, warm_start=True).fit(self.mat)
+        models = list(estimator.fitted_models)
+        estimator.fit(self.mat.copy())
+        assert all(a is b for a, b in zip(models, estimator.fitted_models))
+        estimator.fit(self.grown)
+        assert not any(a is b for a, b in zip(models, estimator.fitted_models))